@@ -0,0 +1,127 @@
+"""
+Leader election for the agent scheduler.
+
+With several workers (WEB_CONCURRENCY) or instances every process builds the
+APScheduler, but only the holder of a Redis lease (`SET leader:scheduler <id> NX PX`)
+runs it; the others keep it paused.  The leader renews the lease every ttl/3 and
+releases it on shutdown, so another process takes over within one renew interval —
+or within the TTL if the leader dies.  If the leader cannot reach Redis it pauses its
+scheduler when the lease would have expired, so two processes never both believe they
+lead for longer than one renew interval.  Every lease call is bounded by the renew
+interval, so a hung Redis counts as unreachable instead of stalling the check.  Without REDIS_URL there is only one
+process (see check_deployment in main.py) and it always leads.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+
+class LeaderLease:
+    def __init__(
+        self,
+        redis_url: Optional[str],
+        on_elected: Callable[[], None],
+        on_deposed: Callable[[], None],
+        key: str = "leader:scheduler",
+        ttl: float = 30.0,
+    ):
+        self._redis_url = redis_url
+        self._redis = None
+        self._on_elected = on_elected
+        self._on_deposed = on_deposed
+        self._key = key
+        self._ttl_ms = int(ttl * 1000)
+        self._interval = ttl / 3
+        self._id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._valid_until = 0.0  # monotonic time the held lease is known good until
+        self._task: Optional[asyncio.Task] = None
+        self.is_leader = False
+
+    async def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis  # optional dependency
+            self._redis = aioredis.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_timeout=self._interval,
+                socket_connect_timeout=self._interval,
+            )
+        return self._redis
+
+    async def _claim(self) -> bool:
+        r = await self._get_redis()
+        if self.is_leader:
+            return bool(await r.eval(_RENEW_LUA, 1, self._key, self._id, self._ttl_ms))
+        return bool(await r.set(self._key, self._id, nx=True, px=self._ttl_ms))
+
+    def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        metrics.gauge("scheduler.leader", int(leader))
+        if leader:
+            logger.info("Scheduler leader elected: %s", self._id)
+            self._on_elected()
+        else:
+            logger.info("Scheduler leadership lost: %s", self._id)
+            self._on_deposed()
+
+    async def step(self) -> bool:
+        """Acquire or renew once; returns whether this process leads afterwards."""
+        t0 = time.monotonic()
+        try:
+            held = await asyncio.wait_for(self._claim(), self._interval)
+            if held:
+                self._valid_until = t0 + self._ttl_ms / 1000
+            self._set_leader(held)
+        except Exception as e:
+            logger.warning("Scheduler lease check failed: %s", type(e).__name__)
+            # Keep leading only while the lease we last confirmed can still be ours
+            if self.is_leader and time.monotonic() + self._interval >= self._valid_until:
+                self._set_leader(False)
+        return self.is_leader
+
+    async def _run(self) -> None:
+        while True:
+            await self.step()
+            await asyncio.sleep(self._interval)
+
+    def start(self) -> None:
+        if not self._redis_url:
+            self._set_leader(True)
+            return
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.is_leader and self._redis_url:
+            try:
+                r = await self._get_redis()
+                await asyncio.wait_for(r.eval(_RELEASE_LUA, 1, self._key, self._id), self._interval)
+            except Exception as e:
+                logger.warning("Scheduler lease release failed: %s", type(e).__name__)
+        self._set_leader(False)
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
@@ -1,11 +1,13 @@
 import asyncio
+import hmac
 import logging
 import time
 
-from fastapi import APIRouter
+from fastapi import APIRouter, Header, HTTPException
 from fastapi.responses import JSONResponse
 
 from app.config import get_settings
+from app.metrics import metrics
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -14,12 +16,20 @@ _cache: dict = {"ts": 0.0, "result": None}
 _CACHE_TTL = 30.0
 
 
+def _with_redis(body: dict) -> dict:
+    # Live, never cached: an open breaker means the store is running in degraded in-memory
+    # mode.  Reported only — it does not fail the health check, since the bot keeps replying.
+    from app.memory.store import redis_health
+    redis = redis_health()
+    return {**body, "redis": redis} if redis is not None else body
+
+
 @router.get("/health")
 async def health_check():
     now = time.monotonic()
     if _cache["result"] and (now - _cache["ts"]) < _CACHE_TTL:
         cached = _cache["result"]
-        return JSONResponse(status_code=cached["http_status"], content=cached["body"])
+        return JSONResponse(status_code=cached["http_status"], content=_with_redis(cached["body"]))
 
     checks: dict = {}
 
@@ -54,4 +64,15 @@ async def health_check():
     _cache["result"] = {"http_status": http_status, "body": body}
     _cache["ts"] = now
 
-    return JSONResponse(status_code=http_status, content=body)
+    return JSONResponse(status_code=http_status, content=_with_redis(body))
+
+
+@router.get("/metrics")
+async def metrics_snapshot(authorization: str = Header("")):
+    # Internal only: costs, breaker states and shed counts are not for the public internet
+    token = get_settings().metrics_token
+    if not token:
+        raise HTTPException(status_code=404)
+    if not hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return metrics.snapshot()
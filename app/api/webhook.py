@@ -1,15 +1,31 @@
+import asyncio
 import logging
 import time
-from functools import lru_cache
+from typing import Optional
 
 from fastapi import APIRouter, BackgroundTasks, Header, HTTPException, Request
-from linebot.v3 import WebhookParser
-from linebot.v3.exceptions import InvalidSignatureError
-from linebot.v3.webhooks import MessageEvent, TextMessageContent
 
 from app.config import get_settings
 from app.core.ai_engine import get_ai_reply
-from app.limiter import limiter
+from app.core.router import flow_step
+from app.core.summarizer import format_summary
+from app.ingress.admission import (
+    BUSY_MESSAGE,
+    PRIORITY_ADMIN,
+    PRIORITY_IN_FLOW,
+    PRIORITY_NEW_CHAT,
+    Shed,
+    get_admission_controller,
+)
+from app.ingress.coalescer import get_coalescer
+from app.ingress.dedup import get_deduplicator
+from app.ingress.dispatcher import get_dispatcher
+from app.ingress.events import parse_text_events, verify_signature
+from app.ingress.mailbox import get_mailbox
+from app.ingress.queue import get_event_queue
+from app.ingress.ratelimit import get_user_rate_limiter
+from app.limiter import count_rejection, rejections_exceeded
+from app.memory.quota import TOKENS
 from app.memory.store import get_store
 from app.services.line_service import push_catalog, push_qt_alert, reply_catalog, reply_company_profile, reply_quick, reply_text
 from app.services.admin_service import handle_tony_admin
@@ -22,9 +38,22 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-@lru_cache
-def _get_parser() -> WebhookParser:
-    return WebhookParser(get_settings().line_channel_secret)
+MAX_BODY_BYTES = 1_000_000
+
+
+async def _read_body(request: Request) -> bytes:
+    """Read the body, refusing anything over MAX_BODY_BYTES without buffering it first."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > MAX_BODY_BYTES:
+        raise HTTPException(status_code=413, detail="Payload too large")
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:  # chunked or lying Content-Length
+            raise HTTPException(status_code=413, detail="Payload too large")
+        chunks.append(chunk)
+    return b"".join(chunks)
 
 
 async def _send_flow_reply(reply_token: str, fr: FlowReply) -> None:
@@ -38,6 +67,34 @@ async def _send_lead_reply(reply_token: str, lr: LeadReply) -> None:
     await reply_text(reply_token, lr.text)
 
 
+async def _open_lead_form(user_id: str, reply_token: str, store) -> None:
+    await _send_lead_reply(reply_token, await start_lead_flow(user_id, store))
+
+
+async def _open_quote_form(user_id: str, reply_token: str, store) -> None:
+    await _send_flow_reply(reply_token, await start_quote_flow(user_id, store))
+
+
+def _early_action(token: str, leading: bool, user_id: str, reply_token: str, store):
+    """
+    The action a control token triggers, when it can start while the reply is still
+    streaming — or None to decide once the reply is complete.  A reply that merely
+    starts with [CATALOG] may be the token alone (reply_catalog) or a message with the
+    catalog pushed after it, so it waits for the end.  [NOTIFY_LEAD] always waits: the
+    lead summary is read from the history, which only holds the closing reply (with the
+    collected details) once get_ai_reply has stored it.
+    """
+    if leading and token == "[PROFILE]":
+        return reply_company_profile(reply_token)
+    if leading and token == "[LEAD_FORM]":
+        return _open_lead_form(user_id, reply_token, store)
+    if leading and token == "[QUOTE_FORM]":
+        return _open_quote_form(user_id, reply_token, store)
+    if token == "[CATALOG]" and not leading:
+        return push_catalog(user_id)
+    return None
+
+
 async def _notify_step4_lead(user_id: str, store) -> None:
     """Push a summary of the last few conversation turns to Tony after Step 4 lead capture."""
     settings = get_settings()
@@ -51,37 +108,72 @@ async def _notify_step4_lead(user_id: str, store) -> None:
             icon = "👤" if m["role"] == "user" else "🤖"
             lines.append(f"{icon} {(m.get('content') or '')[:120]}")
         summary = "\n".join(lines)
-        msg = f"📋 Lead ใหม่ (Step 4)\nLINE: {user_id[:12]}...\n\n{summary[:600]}"
+        # Earlier turns may have been folded out of the history: lead with their summary
+        earlier = format_summary(await store.get_summary(user_id))
+        if earlier:
+            summary = f"{earlier[:400]}\n\n{summary}"
+        msg = f"📋 Lead ใหม่ (Step 4)\nLINE: {user_id[:12]}...\n\n{summary[:1000]}"
         from app.services.line_service import push_text
-        import asyncio
         asyncio.create_task(push_text(settings.tony_line_user_id, msg))
     except Exception as e:
         logger.warning("Step4 lead notify failed: %s", e)
 
 
-async def _handle_message(user_id: str, user_text: str, reply_token: str) -> None:
-    """Background task: enforce daily limit, call OpenAI, and send LINE reply."""
+def _ai_priority(user_id: str, history: list, summary: Optional[dict] = None) -> int:
+    """Admission class for the AI path: Tony, then quotes in progress, then everyone else."""
+    settings = get_settings()
+    if settings.tony_line_user_id and user_id == settings.tony_line_user_id:
+        return PRIORITY_ADMIN
+    # The 4-step quote flow lives in the conversation history (Redis TTL 24h); a customer
+    # who merely chatted earlier today is not in it
+    if flow_step(history, summary) > 0:
+        return PRIORITY_IN_FLOW
+    return PRIORITY_NEW_CHAT
+
+
+async def _handle_message(
+    user_id: str, user_text: str, reply_token: str, last_attempt: bool = True, event: Optional[dict] = None
+) -> None:
+    """
+    Background task: enforce daily limit, call OpenAI, and send LINE reply.
+
+    last_attempt=False (a queued event with retries left): an error propagates so the worker
+    pool retries the event, instead of the "Sorry" reply going out — but only while nothing
+    has reached LINE or been charged and stored.  After that a retry would repeat it, so the
+    error is handled here as on the last attempt.
+
+    event: the queued payload.  It records that the message has been counted against the
+    quota, and the queue re-adds the payload on retry, so a retry does not count it again.
+    """
     settings = get_settings()
     store = get_store()
 
-    usage = await store.get_daily_usage(user_id)
-    if usage >= settings.daily_message_limit:
+    # One round-trip: usage (checked and counted atomically), flow states and history
+    session = await store.get_session(
+        user_id, settings.daily_message_limit, settings.daily_token_limit or None,
+        admitted=bool(event and event.get("admitted")),
+    )
+    if event is not None and session.allowed:
+        event["admitted"] = True
+    if not session.allowed:
+        if session.blocked_by == TOKENS:
+            notice = "You've reached your daily usage limit. Please try again tomorrow!"
+        else:
+            notice = f"You've reached your daily limit of {settings.daily_message_limit} messages. Please try again tomorrow!"
         try:
-            await reply_text(
-                reply_token,
-                f"You've reached your daily limit of {settings.daily_message_limit} messages. Please try again tomorrow!",
-            )
+            await reply_text(reply_token, notice)
         except Exception:
             pass
         return
 
-    await store.increment_daily_usage(user_id)
-
+    committed = False  # something reached LINE or the store: a retry would repeat it
+    started: dict = {}  # control-token actions started while the reply streams
     try:
         t0 = time.monotonic()
 
         # 1a. Owner shortcut: "Tony QT" → open quote flow — Tony only
         if user_text.strip().lower() == "tony qt" and settings.tony_line_user_id and user_id == settings.tony_line_user_id:
+            committed = True
             form_reply = await start_quote_flow(user_id, store)
             await _send_flow_reply(reply_token, form_reply)
             await log_line_message(user_id, user_text, "[QUOTE_FORM STARTED]", 0)
@@ -89,6 +181,7 @@ async def _handle_message(user_id: str, user_text: str, reply_token: str) -> Non
 
         # 1b. Admin skill commands: tony TR / RP / EM — Tony only
         if settings.tony_line_user_id and user_id == settings.tony_line_user_id:
+            committed = True  # admin commands write to Sheets / Drive
             admin_reply = await handle_tony_admin(user_text)
             if admin_reply is not None:
                 response_ms = int((time.monotonic() - t0) * 1000)
@@ -96,8 +189,11 @@ async def _handle_message(user_id: str, user_text: str, reply_token: str) -> Non
                 await log_line_message(user_id, user_text, f"[ADMIN {user_text[:30]}]", response_ms)
                 return
 
+        # An active form writes its next step before replying: a retry would skip a step
+        committed = committed or bool(session.lead_flow or session.quote_flow)
+
         # 2. Active lead flow
-        lead_reply = await handle_lead_flow(user_id, user_text, store)
+        lead_reply = await handle_lead_flow(user_id, user_text, store, session)
         if lead_reply is not None:
             response_ms = int((time.monotonic() - t0) * 1000)
             await _send_lead_reply(reply_token, lead_reply)
@@ -105,30 +201,51 @@ async def _handle_message(user_id: str, user_text: str, reply_token: str) -> Non
             return
 
         # 3. Active quote flow — route all messages through step handler
-        flow_reply = await handle_quote_flow(user_id, user_text, store)
+        flow_reply = await handle_quote_flow(user_id, user_text, store, session)
         if flow_reply is not None:
             response_ms = int((time.monotonic() - t0) * 1000)
             await _send_flow_reply(reply_token, flow_reply)
             await log_line_message(user_id, user_text, flow_reply.text[:80], response_ms)
             return
 
-        # 4. Normal AI reply
-        reply = await get_ai_reply(user_id, user_text)
+        # 4. Normal AI reply — admitted by priority; new chats get a busy reply when overloaded.
+        # Control tokens start their action as soon as they appear in the stream.
+        def on_control(token: str, leading: bool) -> None:
+            nonlocal committed
+            action = _early_action(token, leading, user_id, reply_token, store)
+            if action is not None and token not in started:
+                committed = True
+                started[token] = asyncio.create_task(action)
+
+        try:
+            async with get_admission_controller().admit(_ai_priority(user_id, session.history, session.summary)):
+                reply = await get_ai_reply(
+                    user_id,
+                    user_text,
+                    history=session.history,
+                    on_control=on_control,
+                    summary=session.summary,
+                    fallback=last_attempt,
+                )
+        except Shed:
+            committed = True
+            await reply_text(reply_token, BUSY_MESSAGE)
+            await log_line_message(user_id, user_text, "[BUSY — SHED]", int((time.monotonic() - t0) * 1000))
+            return
+        committed = True  # the turns are stored and charged
         response_ms = int((time.monotonic() - t0) * 1000)
 
         if reply.strip() == "[CATALOG]":
             await reply_catalog(reply_token)
             await log_line_message(user_id, user_text, "[CATALOG SENT]", response_ms)
         elif reply.strip() == "[PROFILE]":
-            await reply_company_profile(reply_token)
+            await (started.get("[PROFILE]") or reply_company_profile(reply_token))
             await log_line_message(user_id, user_text, "[PROFILE SENT]", response_ms)
         elif reply.strip() == "[QUOTE_FORM]":
-            form_reply = await start_quote_flow(user_id, store)
-            await _send_flow_reply(reply_token, form_reply)
+            await (started.get("[QUOTE_FORM]") or _open_quote_form(user_id, reply_token, store))
             await log_line_message(user_id, user_text, "[QUOTE_FORM STARTED]", response_ms)
         elif reply.strip() == "[LEAD_FORM]":
-            lr = await start_lead_flow(user_id, store)
-            await _send_lead_reply(reply_token, lr)
+            await (started.get("[LEAD_FORM]") or _open_lead_form(user_id, reply_token, store))
             await log_line_message(user_id, user_text, "[LEAD_FORM STARTED]", response_ms)
         elif "[NOTIFY_LEAD]" in reply:
             # Step 4 lead: info already collected in conversation — send closing text, notify Tony
@@ -142,52 +259,136 @@ async def _handle_message(user_id: str, user_text: str, reply_token: str) -> Non
             clean = reply.replace("[CATALOG]", "").strip()
             if clean:
                 await reply_text(reply_token, clean)
-            await push_catalog(user_id)
+            await (started.get("[CATALOG]") or push_catalog(user_id))
             await log_line_message(user_id, user_text, "[CATALOG SENT + TEXT]", response_ms)
         else:
             await reply_text(reply_token, reply)
             await log_line_message(user_id, user_text, reply, response_ms)
+        # Actions the stream started that the final reply did not claim (e.g. [CATALOG] next to [NOTIFY_LEAD]);
+        # claimed ones are already done
+        for task in started.values():
+            await task
     except Exception as e:
+        if not last_attempt and not committed:
+            raise
         logger.error("Failed to handle message from %s...: %s", user_id[:8], type(e).__name__)
+        if started:
+            # An early action has fired and may have used the reply token: let the actions
+            # finish, and do not send the apology on top of them
+            await asyncio.gather(*started.values(), return_exceptions=True)
+            return
         try:
             await reply_text(reply_token, "Sorry, something went wrong. Please try again.")
         except Exception:
             pass
 
 
+async def _in_form_flow(store, user_id: str) -> bool:
+    """True while a quote or lead form is collecting answers (each message is one answer)."""
+    try:
+        quote, lead = await asyncio.gather(store.get_quote_flow(user_id), store.get_lead_flow(user_id))
+    except Exception:
+        return False  # _handle_message reports the store error
+    return bool(quote or lead)
+
+
+async def _dispatch_events(items: list) -> None:
+    """Background task: run one webhook body's events — concurrent across users, ordered per user."""
+    dispatcher = get_dispatcher(_handle_message)
+    coalescer = get_coalescer(lambda *item: dispatcher.dispatch([item]))
+    if coalescer is None:
+        await dispatcher.dispatch(items)
+        return
+    # Tony's admin commands are never merged with other text, nor are form answers
+    # (a name and a phone number sent separately must stay two answers)
+    tony_id = get_settings().tony_line_user_id
+    store = get_store()
+    users = list({i[0] for i in items if not (tony_id and i[0] == tony_id)})
+    in_flow = await asyncio.gather(*(_in_form_flow(store, u) for u in users))
+    merge = {u for u, flow in zip(users, in_flow) if not flow}
+    await asyncio.gather(
+        dispatcher.dispatch([i for i in items if i[0] not in merge]),
+        *(coalescer.offer(*i) for i in items if i[0] in merge),
+    )
+
+
+async def handle_queued_event(payload: dict, last: bool = True) -> None:
+    """Worker-pool entry point for events appended by callback in INGRESS_MODE=queue."""
+    async with get_mailbox().hold(payload["user_id"]):
+        await _handle_message(
+            payload["user_id"], payload["text"], payload["reply_token"], last_attempt=last, event=payload
+        )
+
+
+async def _verified_body(request: Request, x_line_signature: str) -> bytes:
+    if not x_line_signature:
+        raise HTTPException(status_code=400, detail="Missing X-Line-Signature header")
+
+    body = await _read_body(request)
+
+    if not verify_signature(body, x_line_signature, get_settings().line_channel_secret):
+        logger.warning("Invalid LINE signature received")
+        raise HTTPException(status_code=400, detail="Invalid signature")
+    return body
+
+
 @router.post("/callback")
-@limiter.limit("60/minute")
 async def callback(
     request: Request,
     background_tasks: BackgroundTasks,
     x_line_signature: str = Header(None, alias="X-Line-Signature"),
 ):
-    body = await request.body()
-
-    if len(body) > 1_000_000:
-        raise HTTPException(status_code=413, detail="Payload too large")
-
-    if not x_line_signature:
-        raise HTTPException(status_code=400, detail="Missing X-Line-Signature header")
+    # Endpoint ceiling (app/limiter.py): a source that keeps failing verification is refused,
+    # but a correctly signed request always gets through
+    over_ceiling = rejections_exceeded(request)
+    if over_ceiling and not x_line_signature:
+        raise HTTPException(status_code=429, detail="Too many rejected requests")
+    try:
+        body = await _verified_body(request, x_line_signature)
+    except HTTPException:
+        count_rejection(request)
+        if over_ceiling:
+            raise HTTPException(status_code=429, detail="Too many rejected requests")
+        raise
 
-    body_text = body.decode("utf-8")
     try:
-        events = _get_parser().parse(body_text, x_line_signature)
-    except InvalidSignatureError:
-        logger.warning("Invalid LINE signature received")
-        raise HTTPException(status_code=400, detail="Invalid signature")
+        text_events = parse_text_events(body)
     except Exception as e:
         logger.error("Webhook parse error: %s", type(e).__name__)
         raise HTTPException(status_code=500, detail="Webhook processing error")
 
-    for event in events:
-        if isinstance(event, MessageEvent) and isinstance(event.message, TextMessageContent):
-            background_tasks.add_task(
-                _handle_message,
-                event.source.user_id,
-                event.message.text,
-                event.reply_token,
-            )
+    # Drop LINE redeliveries before any store / AI / Sheets work
+    first_seen = await get_deduplicator().claim([(e.webhook_event_id, e.is_redelivery) for e in text_events])
+    # Per-user rate limit; events over it are dropped but still acked, so LINE sees no failure
+    claimed = [e for e, ok in zip(text_events, first_seen) if ok]
+    admitted = iter(await get_user_rate_limiter().admit([e.user_id for e in claimed]))
+    first_seen = [ok and next(admitted) for ok in first_seen]
+
+    queue_mode = get_settings().ingress_mode == "queue"
+    items = []
+    for idx, (event, fresh) in enumerate(zip(text_events, first_seen)):
+        if not fresh:
+            continue
+        if queue_mode:
+            try:
+                await get_event_queue().enqueue({
+                    "user_id": event.user_id,
+                    "text": event.text,
+                    "reply_token": event.reply_token,
+                })
+            except Exception as e:
+                # Non-2xx makes LINE redeliver, so nothing is lost while the queue is down
+                logger.error("Ingress enqueue failed: %s", type(e).__name__)
+                # Events already queued stay claimed; the rest must be accepted on redelivery
+                for pending, ok in zip(text_events[idx:], first_seen[idx:]):
+                    if ok:
+                        await get_deduplicator().release(pending.webhook_event_id)
+                raise HTTPException(status_code=503, detail="Queue unavailable")
+            continue
+        items.append((event.user_id, event.text, event.reply_token))
+
+    if items:
+        background_tasks.add_task(_dispatch_events, items)
 
-    # Acknowledge LINE immediately — reply is sent asynchronously
+    # Acknowledge LINE immediately — reply is sent asynchronously (background task or worker pool)
     return {"status": "ok"}
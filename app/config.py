@@ -10,14 +10,39 @@ class Settings(BaseSettings):
     line_channel_access_token: str = Field(..., validation_alias="LINE_CHANNEL_ACCESS_TOKEN")
     openai_api_key: str = Field(..., validation_alias="OPENAI_API_KEY")
     openai_model: str = Field("gpt-4o-mini", validation_alias="OPENAI_MODEL")
+    # Per-turn model tiers (app/core/router.py); "" = OPENAI_MODEL
+    openai_model_light: str = Field("", validation_alias="OPENAI_MODEL_LIGHT")
+    openai_model_strong: str = Field("", validation_alias="OPENAI_MODEL_STRONG")
     openai_max_tokens: int = Field(1000, validation_alias="OPENAI_MAX_TOKENS")
     openai_temperature: float = Field(0.4, validation_alias="OPENAI_TEMPERATURE")
+    openai_prompt_cache_key: str = Field("clawbot-sera", validation_alias="OPENAI_PROMPT_CACHE_KEY")  # "" = off
+    openai_input_usd_per_mtok: float = Field(0.15, validation_alias="OPENAI_INPUT_USD_PER_MTOK")
+    openai_cached_input_usd_per_mtok: float = Field(0.075, validation_alias="OPENAI_CACHED_INPUT_USD_PER_MTOK")
+    openai_stream: bool = Field(True, validation_alias="OPENAI_STREAM")  # early control-token dispatch
     max_history_messages: int = Field(10, validation_alias="MAX_HISTORY_MESSAGES")
     app_env: str = Field("production", validation_alias="APP_ENV")
     redis_url: Optional[str] = Field(None, validation_alias="REDIS_URL")
+    store_backend: str = Field("redis", validation_alias="STORE_BACKEND")  # redis (memory without REDIS_URL) | sqlite
+    sqlite_path: str = Field("data/clawbot.db", validation_alias="SQLITE_PATH")
+    redis_max_connections: int = Field(20, validation_alias="REDIS_MAX_CONNECTIONS")
+    redis_op_timeout_ms: int = Field(500, validation_alias="REDIS_OP_TIMEOUT_MS")
+    memory_max_entries: int = Field(100_000, validation_alias="MEMORY_MAX_ENTRIES")
+    memory_max_bytes: int = Field(64 * 1024 * 1024, validation_alias="MEMORY_MAX_BYTES")
+    memory_snapshot_path: str = Field("", validation_alias="MEMORY_SNAPSHOT_PATH")  # "" = off
+    l1_cache_users: int = Field(0, validation_alias="L1_CACHE_USERS")  # 0 = off
+    # json (legacy) | orjson — stays json until every instance reads both formats
+    store_codec: str = Field("json", validation_alias="STORE_CODEC")
+    store_compress_min_bytes: int = Field(512, validation_alias="STORE_COMPRESS_MIN_BYTES")  # 0 = off
     sentry_dsn: Optional[str] = Field(None, validation_alias="SENTRY_DSN")
     daily_message_limit: int = Field(100, validation_alias="DAILY_MESSAGE_LIMIT")
-    max_context_tokens: int = Field(3500, validation_alias="MAX_CONTEXT_TOKENS")
+    daily_token_limit: int = Field(0, validation_alias="DAILY_TOKEN_LIMIT")  # 0 = off
+    user_rate_per_minute: int = Field(20, validation_alias="USER_RATE_PER_MINUTE")  # 0 = off
+    user_rate_burst: int = Field(10, validation_alias="USER_RATE_BURST")
+    callback_reject_limit: str = Field("30/minute", validation_alias="CALLBACK_REJECT_LIMIT")
+    summary_trigger_messages: int = Field(8, validation_alias="SUMMARY_TRIGGER_MESSAGES")  # 0 = off
+    summary_keep_messages: int = Field(4, validation_alias="SUMMARY_KEEP_MESSAGES")
+    max_context_tokens: int = Field(8000, validation_alias="MAX_CONTEXT_TOKENS")  # whole prompt, system prompt included
+    prompt_scoping: bool = Field(True, validation_alias="PROMPT_SCOPING")  # per-turn prompt modules, app/core/prompt.py
     tony_line_user_id: str = Field("", validation_alias="TONY_LINE_USER_ID")
     google_spreadsheet_id: str = Field(
         "184d7kpY7swRCwSJ_eZi8UtrH2K57U1Wzb2Fc9_ShVC8",
@@ -25,6 +50,22 @@ class Settings(BaseSettings):
     )
     agents_enabled: bool = Field(True, validation_alias="AGENTS_ENABLED")
     drive_folder_id: str = Field("", validation_alias="DRIVE_FOLDER_ID")
+    web_concurrency: int = Field(1, validation_alias="WEB_CONCURRENCY")  # gunicorn worker processes
+    ingress_mode: str = Field("background", validation_alias="INGRESS_MODE")  # background | queue
+    ingress_workers: int = Field(4, validation_alias="INGRESS_WORKERS")
+    ingress_role: str = Field("all", validation_alias="INGRESS_ROLE")  # all | web (pool runs in worker.py)
+    ingress_max_attempts: int = Field(3, validation_alias="INGRESS_MAX_ATTEMPTS")
+    ingress_stream: str = Field("clawbot:events", validation_alias="INGRESS_STREAM")
+    max_concurrent_events: int = Field(16, validation_alias="MAX_CONCURRENT_EVENTS")
+    user_lock_lease_ms: int = Field(60000, validation_alias="USER_LOCK_LEASE_MS")
+    coalesce_window_ms: int = Field(0, validation_alias="COALESCE_WINDOW_MS")  # 0 = off
+    coalesce_max_wait_ms: int = Field(3000, validation_alias="COALESCE_MAX_WAIT_MS")
+    ai_max_inflight: int = Field(8, validation_alias="AI_MAX_INFLIGHT")
+    ai_max_queue: int = Field(32, validation_alias="AI_MAX_QUEUE")
+    ai_queue_timeout_ms: int = Field(8000, validation_alias="AI_QUEUE_TIMEOUT_MS")
+    ai_protected_timeout_ms: int = Field(30000, validation_alias="AI_PROTECTED_TIMEOUT_MS")
+    faq_enabled: bool = Field(True, validation_alias="FAQ_ENABLED")
+    metrics_token: str = Field("", validation_alias="METRICS_TOKEN")  # "" = /metrics disabled
 
     model_config = {"env_file": ".env", "case_sensitive": False, "populate_by_name": True}
 
@@ -0,0 +1,153 @@
+"""
+Per-turn model tier, picked from cheap local features of the turn.
+
+Every reply used to go to OPENAI_MODEL, whether the customer said "ขอบคุณค่ะ" or was
+due a multi-SKU project pricing summary.  choose_tier looks at:
+
+  - message length (normalized characters)
+  - SKUs in the message (find_skus_in_text)
+  - the 4-step flow position, read off the last reply's wording (flow_step)
+  - whether the Step 3 order summary with totals is due
+
+Short chit-chat outside an order goes to the light tier.  A due pricing summary or
+MULTI_SKU or more codes in one message goes to the strong tier.  Everything else uses
+the standard tier.  The tiers map to OPENAI_MODEL_LIGHT / OPENAI_MODEL / OPENAI_MODEL_STRONG.
+An empty tier setting falls back to OPENAI_MODEL, so nothing changes until they are set.
+
+Replies are checked against the catalog (mispriced).  When a quoted price is not a
+catalog price for its SKU, get_ai_reply asks the next tier up with a different model
+(escalate), until one passes or the strongest has answered.  Each completion records
+latency and cost under its tier: router.<tier>.latency_ms, router.<tier>.cost_usd.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional
+
+from app.config import get_settings
+from app.knowledge import faq
+from app.knowledge.lookup import catalog_prices, find_skus_in_text
+from app.metrics import metrics
+
+LIGHT, STANDARD, STRONG = "light", "standard", "strong"
+TIERS = (LIGHT, STANDARD, STRONG)
+
+LIGHT_MAX_CHARS = 40  # normalized; longer messages usually ask something
+MULTI_SKU = 3
+
+# List prices in USD per 1M tokens: input, cached input, output.  Models not listed
+# get latency but no cost.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+}
+
+# Wording of the reply templates in SYSTEM_PROMPT that mark each step, latest step first
+_STEP_MARKERS = (
+    (4, ("ขอข้อมูลสั้นๆ", "ขอข้อมูลสำหรับใบเสนอราคา", "contact details", "联系方式")),
+    (3, ("ทวนรายการ", "จัดทำใบเสนอราคาไหม", "formal quotation", "报价单")),
+    (2, ("ต้องการเพิ่มไหม", "anything else", "还需要")),
+)
+# The customer closing the item list: the Step 3 summary with totals comes next
+_DONE_WORDS = tuple(faq.normalize(w) for w in (
+    "แค่นี้", "ไม่เอาเพิ่ม", "ไม่มีเพิ่ม", "พอแล้ว", "สรุป", "รวมเท่าไหร่", "ทั้งหมด",
+    "that's all", "nothing else", "total", "summary", "就这些", "总共",
+))
+
+_SKU = re.compile(r"CF-[A-Z0-9]+", re.IGNORECASE)
+_PRICE = re.compile(r"(?<![\d,])\d{1,3}(?:,\d{3})+(?![\d,])")  # 10,800 — how the prompt writes prices
+# Grouped numbers that are not a unit price: a quantity (1,000 ชิ้น, x 1,000) or a line total (รวม 21,600)
+_QUANTITY_UNIT = re.compile(r"\s*(?:ชิ้น|ชุด|pcs\b|pieces?\b|sets?\b|件|套)", re.IGNORECASE)
+_NOT_PRICE_BEFORE = re.compile(r"(?:(?<![A-Za-z])[x×]|รวม|total|合计|总计|总共)\s*$", re.IGNORECASE)
+
+
+@dataclass
+class TurnFeatures:
+    length: int
+    skus: int
+    step: int  # 0 = no product yet, else the 4-step flow step the reply answers
+    summary_due: bool
+
+
+def flow_step(history: List[dict], summary: Optional[dict] = None) -> int:
+    last = next((m.get("content") or "" for m in reversed(history) if m.get("role") == "assistant"), "")
+    for step, markers in _STEP_MARKERS:
+        if any(marker in last for marker in markers):
+            return step
+    in_flow = bool(summary and summary.get("items")) or any(
+        find_skus_in_text(m.get("content") or "") for m in history
+    )
+    return 1 if in_flow else 0
+
+
+def extract_features(message: str, history: List[dict], summary: Optional[dict] = None) -> TurnFeatures:
+    """`history` is the conversation window, ending with `message` when it is already stored."""
+    norm = faq.normalize(message)
+    skus = set(find_skus_in_text(message))
+    step = flow_step(history, summary)
+    if skus and step == 0:
+        step = 1
+    summary_due = step == 2 or (step >= 1 and any(w in norm for w in _DONE_WORDS))
+    return TurnFeatures(length=len(norm), skus=len(skus), step=step, summary_due=summary_due)
+
+
+def choose_tier(features: TurnFeatures) -> str:
+    if features.summary_due or features.skus >= MULTI_SKU:
+        return STRONG
+    if not features.skus and features.step == 0 and features.length <= LIGHT_MAX_CHARS:
+        return LIGHT
+    return STANDARD
+
+
+def model_for(tier: str) -> str:
+    settings = get_settings()
+    configured = {LIGHT: settings.openai_model_light, STRONG: settings.openai_model_strong}.get(tier)
+    return configured or settings.openai_model
+
+
+def escalate(tier: str) -> Optional[str]:
+    """The next tier up that runs a different model than `tier`, or None."""
+    current = model_for(tier)
+    for stronger in TIERS[TIERS.index(tier) + 1:]:
+        if model_for(stronger) != current:
+            return stronger
+    return None
+
+
+def mispriced(reply: str) -> List[str]:
+    """
+    "SKU price" for each price quoted for a SKU that the catalog does not list for it.
+    The price checked is the first one after the code on its line, before the next code;
+    Step 3 lines put the unit price before the total.  Quantities (a number followed by
+    ชิ้น / pcs / ชุด, or after "x") and totals (after รวม / total) are not prices.
+    """
+    problems = []
+    for line in reply.splitlines():
+        codes = list(_SKU.finditer(line))
+        for i, code in enumerate(codes):
+            end = codes[i + 1].start() if i + 1 < len(codes) else len(line)
+            price = next((m for m in _PRICE.finditer(line, code.end(), end) if _unit_price(line, m)), None)
+            if price is None:
+                continue
+            sku = code.group().upper()
+            if int(price.group().replace(",", "")) not in catalog_prices(sku):
+                problems.append(f"{sku} {price.group()}")
+    return problems
+
+
+def _unit_price(line: str, number: "re.Match") -> bool:
+    return not (_QUANTITY_UNIT.match(line, number.end()) or _NOT_PRICE_BEFORE.search(line, 0, number.start()))
+
+
+def record(tier: str, model: str, latency_ms: float, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+    """Latency and cost of one completion, under its tier."""
+    metrics.incr(f"router.{tier}.completions")
+    metrics.observe(f"router.{tier}.latency_ms", latency_ms)
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return
+    usd_in, usd_cached, usd_out = prices
+    cost = ((prompt_tokens - cached_tokens) * usd_in + cached_tokens * usd_cached + completion_tokens * usd_out) / 1e6
+    metrics.incr(f"router.{tier}.cost_usd", cost)
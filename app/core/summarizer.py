@@ -0,0 +1,185 @@
+"""
+Rolling conversation summary.
+
+Long negotiations used to lose their early facts (retail vs project, SKUs, quantities)
+once the history window slid past them.  Now, when a user's stored history reaches
+SUMMARY_TRIGGER_MESSAGES, every message but the last SUMMARY_KEEP_MESSAGES is folded
+into a structured summary kept with the conversation:
+
+    {"customer_type": "retail" | "project" | null,
+     "items": [{"sku": "CF-13022", "quantity": 100, "color": "Matt Black"}],
+     "contact": {"name": ..., "phone": ..., ...},
+     "notes": "...", "messages": <messages folded so far>}
+
+Those messages are then dropped from the history (ConversationStore.fold_history).
+get_ai_reply sends the summary in the per-turn context message, followed by the recent
+turns.  Folding runs as a background task after the reply is stored, never on the
+reply path.  With the defaults (trigger 8, keep 4, MAX_HISTORY_MESSAGES 10) the window
+leaves one full turn of slack for the fold to land before a message would be trimmed
+unsummarized.  The summarization call is charged to the user's token budget.
+"""
+import asyncio
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+from app.config import get_settings
+from app.memory.store import get_store
+from app.metrics import metrics
+from app.services.openai_service import create_completion
+
+logger = logging.getLogger(__name__)
+
+CONTACT_FIELDS = ("name", "phone", "email", "company", "tax_id", "project", "delivery")
+_NOTES_MAX = 300
+
+SUMMARY_PROMPT = """You keep a compact record of a LINE sales chat between a customer and Sera, the sales assistant of CERAFIELD (sanitaryware).
+Update the record with the new messages and reply with the updated record as one JSON object with exactly these keys:
+"customer_type": "retail" or "project", or null while not established
+"items": the current order as [{"sku": "CF-...", "quantity": number or null, "color": string or null}]; apply changes and removals
+"contact": only details the customer gave, from {"name", "phone", "email", "company", "tax_id", "project", "delivery"}
+"notes": at most two short sentences of anything else that matters for the sale (budget, flow step, open questions)
+Keep what the record already says unless the new messages change it. Never invent values."""
+
+
+def _normalize(data, previous: dict, folded: int) -> dict:
+    """Keep only the expected keys and types; fall back to the previous record per field."""
+    data = data if isinstance(data, dict) else {}
+    customer_type = data.get("customer_type")
+    if customer_type not in ("retail", "project"):
+        customer_type = previous.get("customer_type")
+    items = data.get("items")
+    if isinstance(items, list):
+        items = [
+            {
+                "sku": str(item["sku"]).upper(),
+                "quantity": item.get("quantity") if isinstance(item.get("quantity"), (int, float)) else None,
+                "color": str(item["color"]) if item.get("color") else None,
+            }
+            for item in items
+            if isinstance(item, dict) and item.get("sku")
+        ]
+    else:
+        items = previous.get("items", [])
+    contact = data.get("contact")
+    if isinstance(contact, dict):
+        contact = {k: str(contact[k]) for k in CONTACT_FIELDS if contact.get(k)}
+    else:
+        contact = previous.get("contact", {})
+    notes = data.get("notes")
+    notes = str(notes)[:_NOTES_MAX] if isinstance(notes, str) else previous.get("notes", "")
+    return {
+        "customer_type": customer_type,
+        "items": items,
+        "contact": contact,
+        "notes": notes,
+        "messages": previous.get("messages", 0) + folded,
+    }
+
+
+def format_summary(summary: Optional[dict]) -> str:
+    """The summary as a context block for the prompt ("" when there is none)."""
+    if not summary:
+        return ""
+    lines = [f"Summary of the {summary.get('messages', 0)} earlier messages of this conversation:"]
+    if summary.get("customer_type"):
+        lines.append(f"Customer type: {summary['customer_type'].upper()}")
+    items = []
+    for item in summary.get("items", []):
+        entry = item["sku"]
+        if item.get("quantity") is not None:
+            entry += f" x{item['quantity']:g}"
+        if item.get("color"):
+            entry += f" ({item['color']})"
+        items.append(entry)
+    if items:
+        lines.append("Items: " + ", ".join(items))
+    contact = summary.get("contact") or {}
+    if contact:
+        lines.append("Contact: " + ", ".join(f"{k}: {v}" for k, v in contact.items()))
+    if summary.get("notes"):
+        lines.append("Notes: " + summary["notes"])
+    return "\n".join(lines)
+
+
+async def summarize(user_id: str, previous: Optional[dict], messages: List[Dict[str, str]]) -> dict:
+    """Fold `messages` into `previous` with one JSON-mode completion."""
+    previous = previous or {}
+    transcript = "\n".join(
+        f"{'Customer' if m['role'] == 'user' else 'Sera'}: {m.get('content') or ''}" for m in messages
+    )
+    record = json.dumps({k: v for k, v in previous.items() if k != "messages"}, ensure_ascii=False)
+    prompt = [
+        {"role": "system", "content": SUMMARY_PROMPT},
+        {"role": "user", "content": f"Current record:\n{record}\n\nNew messages:\n{transcript}"},
+    ]
+    response = await create_completion(prompt, response_format={"type": "json_object"})
+    total_tokens = getattr(getattr(response, "usage", None), "total_tokens", None)
+    if isinstance(total_tokens, int):
+        metrics.incr("summary.tokens", total_tokens)
+        await get_store().record_tokens(user_id, total_tokens)
+    return _normalize(json.loads(response.choices[0].message.content or ""), previous, len(messages))
+
+
+class Summarizer:
+    def __init__(self, trigger: int, keep: int, max_history: int):
+        # The store trims history at max_history, so a larger trigger would never fire
+        self._trigger = min(trigger, max_history)
+        self._keep = keep
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self._trigger > 0 and self._trigger > self._keep
+
+    def maybe_schedule(self, user_id: str, history_len: int) -> None:
+        """Start a background fold once the stored history reaches the trigger (one per user at a time)."""
+        if not self.enabled or history_len < self._trigger or user_id in self._tasks:
+            return
+        task = asyncio.create_task(self._fold(user_id))
+        self._tasks[user_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(user_id, None))
+
+    async def _fold(self, user_id: str) -> None:
+        store = get_store()
+        t0 = time.monotonic()
+        try:
+            previous = await store.get_summary(user_id)
+            history = await store.get_history(user_id)
+            folded = history[:len(history) - self._keep]
+            if len(history) < self._trigger or not folded:
+                return
+            summary = await summarize(user_id, previous, folded)
+            dropped = await store.fold_history(user_id, previous, summary, folded)
+            if not dropped:
+                # None: another process folded first; 0: the messages left the head meanwhile
+                metrics.incr("summary.conflicts")
+                return
+            metrics.incr("summary.folds")
+            metrics.incr("summary.messages_folded", dropped)
+            metrics.observe("summary.fold_ms", (time.monotonic() - t0) * 1000)
+        except Exception as e:
+            metrics.incr("summary.errors")
+            logger.warning("Summary fold failed for %s...: %s", user_id[:8], type(e).__name__)
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """Let in-flight folds finish (up to `timeout`), then cancel the rest."""
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+_summarizer: Optional[Summarizer] = None
+
+
+def get_summarizer() -> Summarizer:
+    global _summarizer
+    if _summarizer is None:
+        s = get_settings()
+        _summarizer = Summarizer(s.summary_trigger_messages, s.summary_keep_messages, s.max_history_messages)
+    return _summarizer
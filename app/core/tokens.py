@@ -0,0 +1,154 @@
+"""
+Token accounting for the prompt budget (MAX_CONTEXT_TOKENS).
+
+Counts come from tiktoken when it is installed and has the encoding for OPENAI_MODEL
+(the BPE file is downloaded once, then read from TIKTOKEN_CACHE_DIR).  Otherwise a
+per-script estimate is used.  The app loads the encodings at startup off the event
+loop (preload); a failed load is retried after ENCODING_RETRY seconds instead of
+leaving the process on the estimate for good.  Its weights were fitted against o200k_base on the system
+prompt, the FAQ answers, the catalogue and sample chats (scripts/bench_tokens.py).
+Thai costs about 0.4 token per letter, next to nothing for vowel and tone marks, so
+the old `len(text) // 4` undercounted Thai messages by about a third.
+
+Counts are cached by content, so each stored message is tokenized once per process
+however many turns it stays in the history window.
+"""
+import asyncio
+import logging
+import re
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODING = "o200k_base"  # gpt-4o / gpt-4o-mini / gpt-4.1 family
+MESSAGE_OVERHEAD = 3  # role and delimiters added around every chat message
+REPLY_PRIMING = 3  # the assistant header every reply is primed with
+ENCODING_RETRY = 300.0  # seconds before a failed encoding load is tried again
+PRELOAD_TIMEOUT = 30.0  # seconds startup waits for the BPE download
+
+# (pattern, tokens per match), fitted by least squares against o200k_base
+_WEIGHTS = (
+    (re.compile(r"[ก-ฯเ-ๆ]"), 0.4),  # Thai consonants and leading vowels
+    (re.compile(r"[ะ-ฺ็-๎]"), 0.06),  # Thai vowel and tone marks (mostly merged)
+    (re.compile(r"[฀-๿]+"), 0.41),  # Thai runs (a run rarely ends mid-token)
+    (re.compile(r"[A-Za-z]+"), 0.84),  # Latin words
+    (re.compile(r"[A-Za-z]"), 0.073),  # Latin characters
+    (re.compile(r"\d{1,3}"), 1.69),  # digit groups (numbers split every 3 digits)
+    (re.compile(r"[぀-ヿ㐀-鿿가-힯]"), 0.855),  # CJK / kana / Hangul
+    (re.compile(r"\n"), 0.55),  # line breaks
+    (re.compile(r"[^\w\s]"), 0.55),  # punctuation and symbols
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Per-script estimate of the token count of `text`, for when tiktoken is unavailable."""
+    if not text:
+        return 0
+    return max(1, round(sum(len(pattern.findall(text)) * weight for pattern, weight in _WEIGHTS)))
+
+
+_encodings: Dict[str, object] = {}
+_failed: Dict[str, float] = {}  # model -> monotonic time of the last failed load
+_loading: set = set()
+
+
+def _load(model: str):
+    _loading.add(model)
+    try:
+        import tiktoken  # optional dependency
+        try:
+            enc = tiktoken.encoding_for_model(model)
+        except KeyError:
+            enc = tiktoken.get_encoding(DEFAULT_ENCODING)
+    except ImportError:
+        _failed[model] = float("inf")  # never retried
+        return None
+    except Exception as e:  # encoding file not cached and not downloadable
+        logger.warning("tiktoken encoding unavailable for %s, estimating tokens: %s", model, type(e).__name__)
+        _failed[model] = time.monotonic()
+        return None
+    finally:
+        _loading.discard(model)
+    _encodings[model] = enc
+    if _failed.pop(model, None) is not None:
+        _count.cache_clear()  # drop the estimates counted meanwhile
+    return enc
+
+
+def _encoding(model: str):
+    """
+    The encoding for `model`, or None to estimate.  Not loaded yet: on the event loop the
+    load goes to an executor and this call estimates; in scripts it loads inline.  A
+    failed load is not retried for ENCODING_RETRY seconds.
+    """
+    enc = _encodings.get(model)
+    if enc is not None or model in _loading:
+        return enc
+    failed = _failed.get(model)
+    if failed is not None and time.monotonic() - failed < ENCODING_RETRY:
+        return None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return _load(model)
+    _loading.add(model)
+    loop.run_in_executor(None, _load, model)
+    return None
+
+
+async def preload(models: Iterable[str]) -> None:
+    """Load the encodings in an executor, so no request waits on the BPE download."""
+    loop = asyncio.get_running_loop()
+    todo = [model for model in dict.fromkeys(models) if model and model not in _encodings]
+    _loading.update(todo)  # requests meanwhile estimate instead of loading on the loop
+    pending = [loop.run_in_executor(None, _load, model) for model in todo]
+    try:
+        await asyncio.wait_for(asyncio.gather(*pending), PRELOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.warning("tiktoken encodings still loading after %.0fs, estimating tokens meanwhile", PRELOAD_TIMEOUT)
+
+
+def tokenizer_name(model: Optional[str] = None) -> str:
+    enc = _encoding(model or get_settings().openai_model)
+    return enc.name if enc is not None else "estimate"
+
+
+@lru_cache(maxsize=8192)
+def _count(text: str, model: str) -> int:
+    enc = _encoding(model)
+    if enc is None:
+        return estimate_tokens(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return _count(text or "", model or get_settings().openai_model)
+
+
+def count_message(message: dict, model: Optional[str] = None) -> int:
+    return count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD
+
+
+def count_messages(messages: List[dict], model: Optional[str] = None) -> int:
+    """Prompt tokens for a chat request with these messages."""
+    return sum(count_message(m, model) for m in messages) + REPLY_PRIMING
+
+
+def fit_history(history: List[dict], budget: int, model: Optional[str] = None) -> List[dict]:
+    """
+    The most recent messages whose tokens fit in `budget`, oldest first.  The latest
+    message is always kept, since without it there is nothing to answer.
+    """
+    model = model or get_settings().openai_model
+    total = 0
+    start = len(history)
+    while start > 0:
+        total += _count(history[start - 1].get("content") or "", model) + MESSAGE_OVERHEAD
+        if total > budget and start < len(history):
+            break
+        start -= 1
+    return history[start:]
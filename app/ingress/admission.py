@@ -0,0 +1,153 @@
+"""
+Admission control and priority load shedding for the AI path.
+
+Caps in-flight completions (AI_MAX_INFLIGHT) and keeps a bounded wait queue
+(AI_MAX_QUEUE).  Waiters are granted in priority order, FIFO within a class:
+
+  0  ADMIN       — Tony (tony_line_user_id)
+  1  IN_FLOW     — customers part-way through a quote (router.flow_step > 0)
+  2  NEW_CHAT    — everyone else, e.g. the first message of a new chat
+
+NEW_CHAT is shed first: it is rejected when the queue is full or it waited longer
+than AI_QUEUE_TIMEOUT_MS, and a queued NEW_CHAT is evicted to make room for a higher
+class.  The protected classes may go past AI_MAX_QUEUE, but only up to twice it, and
+wait at most AI_PROTECTED_TIMEOUT_MS, so the queue stays bounded under any mix.  The
+caller then sends BUSY_MESSAGE instead of letting the reply time out.
+"""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_ADMIN = 0
+PRIORITY_IN_FLOW = 1
+PRIORITY_NEW_CHAT = 2
+_CLASS_NAMES = {PRIORITY_ADMIN: "admin", PRIORITY_IN_FLOW: "in_flow", PRIORITY_NEW_CHAT: "new_chat"}
+
+BUSY_MESSAGE = (
+    "ขออภัยค่ะ ขณะนี้มีลูกค้าติดต่อเข้ามาจำนวนมาก "
+    "รบกวนส่งข้อความอีกครั้งในอีกสักครู่นะคะ"
+)
+
+
+class Shed(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_inflight: int = 8,
+        max_queue: int = 32,
+        new_chat_timeout_ms: int = 8000,
+        protected_timeout_ms: int = 30000,
+    ):
+        self._max_inflight = max(1, max_inflight)
+        self._max_queue = max(0, max_queue)
+        self._timeout = new_chat_timeout_ms / 1000
+        self._protected_timeout = protected_timeout_ms / 1000
+        self._inflight = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = 0
+
+    def _publish(self) -> None:
+        metrics.gauge("admission.inflight", self._inflight)
+        metrics.gauge("admission.queue_depth", len(self._waiters))
+
+    def _shed(self, priority: int, reason: str) -> Shed:
+        metrics.incr(f"admission.shed.{_CLASS_NAMES[priority]}")
+        logger.warning("AI request shed (%s, %s)", _CLASS_NAMES[priority], reason)
+        return Shed(reason)
+
+    async def acquire(self, priority: int) -> None:
+        if self._inflight < self._max_inflight and not self._waiters:
+            self._inflight += 1
+            self._publish()
+            return
+
+        if len(self._waiters) >= self._max_queue:
+            if priority >= PRIORITY_NEW_CHAT:
+                raise self._shed(priority, "queue full")
+            # Make room by evicting the newest queued new chat; protected classes may exceed the bound
+            victims = [w for w in self._waiters if w.priority >= PRIORITY_NEW_CHAT]
+            if victims:
+                victim = max(victims, key=lambda w: w.seq)
+                self._waiters.remove(victim)
+                victim.future.set_exception(self._shed(victim.priority, "evicted"))
+            elif len(self._waiters) >= 2 * self._max_queue:
+                raise self._shed(priority, "queue full")
+
+        self._seq += 1
+        waiter = _Waiter(priority, self._seq, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._publish()
+        t0 = time.monotonic()
+        try:
+            timeout = self._timeout if priority >= PRIORITY_NEW_CHAT else self._protected_timeout
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            f = waiter.future
+            if f.done() and not f.cancelled() and f.exception() is None:
+                self.release()  # granted at the same moment we gave up — hand the slot on
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed(priority, "wait timeout")
+            raise
+        finally:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+                self._publish()
+            metrics.observe("admission.wait_ms", (time.monotonic() - t0) * 1000)
+
+    def release(self) -> None:
+        live = [w for w in self._waiters if not w.future.done()]
+        if live:
+            nxt = min(live, key=lambda w: (w.priority, w.seq))
+            self._waiters.remove(nxt)
+            nxt.future.set_result(None)  # slot handed over, inflight unchanged
+        else:
+            self._inflight -= 1
+        self._publish()
+
+    @asynccontextmanager
+    async def admit(self, priority: int):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission_controller() -> AdmissionController:
+    global _controller
+    if _controller is None:
+        from app.config import get_settings
+        s = get_settings()
+        _controller = AdmissionController(
+            s.ai_max_inflight, s.ai_max_queue, s.ai_queue_timeout_ms, s.ai_protected_timeout_ms
+        )
+    return _controller
@@ -0,0 +1,96 @@
+"""
+Burst coalescing: merge rapid consecutive text messages from one user into one turn.
+
+Customers often type one thought across several quick LINE messages.  With
+COALESCE_WINDOW_MS > 0, a message opens (or extends) a debounce window for its user;
+when the window closes the texts are joined with newlines and handled once, replying
+on the newest reply token.  COALESCE_MAX_WAIT_MS caps how long the first message can
+be held so its reply token never goes stale.
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, str, str], Awaitable[None]]
+
+
+class _Burst:
+    __slots__ = ("texts", "reply_token", "started", "timer", "done")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.texts: List[str] = []
+        self.reply_token = ""
+        self.started = time.monotonic()
+        self.timer: Optional[asyncio.TimerHandle] = None
+        self.done: asyncio.Future = loop.create_future()
+
+
+class BurstCoalescer:
+    def __init__(self, handler: Handler, window_ms: int, max_wait_ms: int = 3000, max_messages: int = 5):
+        self._handler = handler
+        self._window = window_ms / 1000
+        self._max_wait = max_wait_ms / 1000
+        self._max_messages = max_messages
+        self._bursts: Dict[str, _Burst] = {}
+
+    async def offer(self, user_id: str, text: str, reply_token: str) -> None:
+        """Add a message to the user's burst; returns once the merged turn has been handled."""
+        loop = asyncio.get_running_loop()
+        burst = self._bursts.get(user_id)
+        if burst is None:
+            burst = self._bursts[user_id] = _Burst(loop)
+        burst.texts.append(text)
+        burst.reply_token = reply_token
+
+        if burst.timer:
+            burst.timer.cancel()
+        remaining = self._max_wait - (time.monotonic() - burst.started)
+        delay = min(self._window, remaining)
+        if len(burst.texts) >= self._max_messages or delay <= 0:
+            self._flush(user_id, burst)
+        else:
+            burst.timer = loop.call_later(delay, self._flush, user_id, burst)
+
+        await asyncio.shield(burst.done)
+
+    def _flush(self, user_id: str, burst: _Burst) -> None:
+        if self._bursts.get(user_id) is burst:
+            del self._bursts[user_id]
+        if burst.timer:
+            burst.timer.cancel()
+        asyncio.get_running_loop().create_task(self._run(user_id, burst))
+
+    async def _run(self, user_id: str, burst: _Burst) -> None:
+        merged = len(burst.texts)
+        if merged > 1:
+            saved = merged - 1
+            metrics.incr("coalesce.bursts")
+            metrics.incr("coalesce.completions_saved", saved)
+            # Each skipped completion would have re-sent roughly an average prompt
+            metrics.incr("coalesce.prompt_tokens_saved", saved * metrics.summary("ai.prompt_tokens")["avg"])
+        try:
+            await self._handler(user_id, "\n".join(burst.texts), burst.reply_token)
+        except Exception as e:
+            logger.error("Coalesced turn failed: %s", type(e).__name__)
+        finally:
+            burst.done.set_result(None)
+
+
+_coalescer: Optional[BurstCoalescer] = None
+
+
+def get_coalescer(handler: Handler) -> Optional[BurstCoalescer]:
+    """Return the process-wide coalescer, or None when COALESCE_WINDOW_MS is 0."""
+    global _coalescer
+    from app.config import get_settings
+    s = get_settings()
+    if s.coalesce_window_ms <= 0:
+        return None
+    if _coalescer is None:
+        _coalescer = BurstCoalescer(handler, s.coalesce_window_ms, s.coalesce_max_wait_ms)
+    return _coalescer
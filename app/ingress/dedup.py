@@ -0,0 +1,130 @@
+"""
+Webhook redelivery idempotency.
+
+LINE redelivers a webhook when our ack is slow; the redelivered event keeps its
+webhookEventId and carries deliveryContext.isRedelivery=true.  Every text event id is
+claimed here before any store / AI / Sheets work: a bounded in-memory TTL set catches
+repeats on this instance, and with REDIS_URL set a `SET evt:{id} NX EX` claim (all ids
+of a body in one pipeline) catches repeats that land on another instance.  Redis calls
+are bounded by REDIS_OP_TIMEOUT_MS and skipped by a circuit breaker after repeated
+failures, so a hung Redis cannot hold up the ack; the local set still applies then.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from app.memory.breaker import CLOSED, CircuitBreaker
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EventDeduplicator:
+    def __init__(
+        self, redis_url: Optional[str] = None, ttl: int = 3600, max_entries: int = 50_000, op_timeout_ms: int = 500
+    ):
+        self._redis_url = redis_url
+        self._redis = None
+        self._op_timeout = op_timeout_ms / 1000
+        self._breaker = CircuitBreaker("dedup")
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # event_id -> expiry (insertion order)
+
+    async def _get_redis(self):
+        if not self._redis_url or not self._breaker.allow():
+            return None
+        if self._redis is None:
+            import redis.asyncio as aioredis  # optional dependency
+            self._redis = aioredis.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_timeout=self._op_timeout,
+                socket_connect_timeout=self._op_timeout,
+            )
+        return self._redis
+
+    async def _call(self, op):
+        """Await a Redis op within the timeout, feeding the breaker."""
+        try:
+            result = await asyncio.wait_for(op, self._op_timeout)
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        if self._breaker.state != CLOSED:
+            self._breaker.record_success()
+        return result
+
+    def _purge(self, now: float) -> None:
+        # Expiry grows with insertion order, so expired ids sit at the front
+        while self._seen:
+            event_id, expiry = next(iter(self._seen.items()))
+            if expiry > now and len(self._seen) <= self._max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    async def claim(self, events: Sequence[Tuple[str, bool]]) -> List[bool]:
+        """
+        events: (webhook_event_id, is_redelivery) pairs.  Returns one flag per event —
+        True if this is the first time the id is seen and it should be processed.
+        """
+        now = time.monotonic()
+        self._purge(now)
+        fresh = []
+        batch = set()
+        for eid, _ in events:
+            fresh.append(bool(eid) and eid not in self._seen and eid not in batch)
+            batch.add(eid)
+
+        to_check = [i for i, ok in enumerate(fresh) if ok]
+        if to_check:
+            try:
+                r = await self._get_redis()
+                if r is not None:
+                    pipe = r.pipeline(transaction=False)
+                    for i in to_check:
+                        pipe.set(f"evt:{events[i][0]}", 1, nx=True, ex=self._ttl)
+                    for i, ok in zip(to_check, await self._call(pipe.execute())):
+                        fresh[i] = bool(ok)
+            except Exception as e:
+                logger.warning("Redis dedup unavailable, using local set only: %s", type(e).__name__)
+
+        result = []
+        for (eid, is_redelivery), ok in zip(events, fresh):
+            if not eid:
+                result.append(True)  # no id to key on — never drop
+                continue
+            if eid not in self._seen:
+                self._seen[eid] = now + self._ttl
+            if is_redelivery:
+                metrics.incr("dedup.redeliveries")
+            if not ok:
+                metrics.incr("dedup.dropped")
+                logger.info("Dropped duplicate webhook event %s (redelivery=%s)", eid, is_redelivery)
+            result.append(ok)
+        self._purge(now)
+        return result
+
+    async def release(self, event_id: str) -> None:
+        """Forget a claim whose processing never started, so LINE's redelivery is accepted."""
+        self._seen.pop(event_id, None)
+        try:
+            r = await self._get_redis()
+            if r is not None:
+                await self._call(r.delete(f"evt:{event_id}"))
+        except Exception as e:
+            logger.warning("Redis dedup release failed: %s", type(e).__name__)
+
+
+_dedup: Optional[EventDeduplicator] = None
+
+
+def get_deduplicator() -> EventDeduplicator:
+    global _dedup
+    if _dedup is None:
+        from app.config import get_settings
+        s = get_settings()
+        _dedup = EventDeduplicator(redis_url=s.redis_url, op_timeout_ms=s.redis_op_timeout_ms)
+    return _dedup
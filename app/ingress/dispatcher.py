@@ -0,0 +1,59 @@
+"""
+Concurrent event dispatcher for multi-event webhook bodies.
+
+LINE batches several events into one POST.  Starlette runs BackgroundTasks one after
+another, so events from different users used to wait on each other's OpenAI calls.
+The dispatcher runs events from different users concurrently under a global cap and
+keeps strict arrival order only between events of the same user_id — per-user
+serialization comes from the UserMailbox, whose per-user lock is FIFO.
+"""
+import asyncio
+import logging
+from typing import Awaitable, Callable, Iterable, Optional, Tuple
+
+from app.ingress.mailbox import UserMailbox
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[..., Awaitable[None]]
+
+
+class EventDispatcher:
+    def __init__(self, handler: Handler, max_concurrency: int = 16, mailbox: Optional[UserMailbox] = None):
+        self._handler = handler
+        self._sem = asyncio.Semaphore(max(1, max_concurrency))
+        self._mailbox = mailbox or UserMailbox()
+
+    def submit(self, user_id: str, *args) -> asyncio.Task:
+        return asyncio.create_task(self._run(user_id, args))
+
+    async def _run(self, user_id: str, args: tuple) -> None:
+        # Take the user's mailbox slot first so a waiting event does not hold a concurrency slot
+        try:
+            async with self._mailbox.hold(user_id):
+                async with self._sem:
+                    await self._handler(*args)
+        except Exception as e:  # includes LeaseTimeout: there is no retry outside queue mode
+            logger.error("Dispatched event failed: %s", type(e).__name__)
+
+    async def dispatch(self, items: Iterable[Tuple]) -> None:
+        """Run (user_id, *handler_args) items and wait for all of them to finish."""
+        tasks = [self.submit(item[0], *item) for item in items]
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    @property
+    def active_users(self) -> int:
+        return self._mailbox.active_users
+
+
+_dispatcher: Optional[EventDispatcher] = None
+
+
+def get_dispatcher(handler: Handler) -> EventDispatcher:
+    global _dispatcher
+    if _dispatcher is None:
+        from app.config import get_settings
+        from app.ingress.mailbox import get_mailbox
+        _dispatcher = EventDispatcher(handler, get_settings().max_concurrent_events, get_mailbox())
+    return _dispatcher
@@ -0,0 +1,58 @@
+"""
+Lean webhook decoding for the /callback ack path.
+
+The handler only acts on text MessageEvents, so instead of building full line-bot-sdk
+pydantic models for every event type we verify the HMAC on the raw bytes and pull out
+just the fields we need.  Stickers, follows, postbacks etc. are skipped after a dict
+lookup.  Parsing uses the orjson-backed loads of app/memory/codec.py.
+"""
+import base64
+import hashlib
+import hmac
+from dataclasses import dataclass
+from typing import List
+
+from app.memory.codec import loads
+
+
+@dataclass(frozen=True)
+class TextEvent:
+    user_id: str
+    text: str
+    reply_token: str
+    webhook_event_id: str = ""
+    is_redelivery: bool = False
+
+
+def verify_signature(body: bytes, signature: str, channel_secret: str) -> bool:
+    """Check X-Line-Signature (base64 HMAC-SHA256 of the raw body) in constant time."""
+    mac = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return hmac.compare_digest(base64.b64encode(mac), signature.encode("utf-8"))
+
+
+def parse_text_events(body: bytes) -> List[TextEvent]:
+    """Return the text message events of a webhook body; raises ValueError on malformed JSON."""
+    data = loads(body)
+    events = data.get("events") if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        raise ValueError("webhook body has no events list")
+
+    result = []
+    for e in events:
+        if not isinstance(e, dict) or e.get("type") != "message":
+            continue
+        message = e.get("message") or {}
+        if message.get("type") != "text":
+            continue
+        user_id = (e.get("source") or {}).get("userId")
+        reply_token = e.get("replyToken")
+        if not user_id or not reply_token:
+            continue
+        result.append(TextEvent(
+            user_id=user_id,
+            text=message.get("text") or "",
+            reply_token=reply_token,
+            webhook_event_id=e.get("webhookEventId") or "",
+            is_redelivery=bool((e.get("deliveryContext") or {}).get("isRedelivery")),
+        ))
+    return result
@@ -0,0 +1,161 @@
+"""
+Per-user mailbox: serializes message handling for one LINE user while different users
+run in parallel.
+
+get_ai_reply and the quote / lead flows do read-modify-write on the user's history and
+flow state, so two fast messages from the same user must never overlap.  On a single
+node an asyncio.Lock per user does that (FIFO, so arrival order is kept); the lock is
+evicted as soon as nobody holds or waits for it.  With REDIS_URL set a Redis lease lock
+is taken inside the local lock so the guarantee also holds across instances.  The lease
+is renewed while held; if Redis is unavailable handling continues on the local lock.
+A lease that stays taken past twice its lifetime raises LeaseTimeout rather than letting
+a second writer in, so a queued event goes back to the worker pool for a later retry.
+
+Arrival order per user is guaranteed only within one process: the Redis lease excludes
+but does not queue, so events of one user picked up by workers in different processes
+run in the order they win the lease, not stream order.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+_RENEW_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end
+return 0
+"""
+
+
+class LeaseTimeout(RuntimeError):
+    """Another instance kept the user's lease for longer than it could be waited for."""
+
+
+class _Slot:
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class UserMailbox:
+    def __init__(self, redis_url: Optional[str] = None, lease_ms: int = 60_000, poll_ms: int = 50):
+        self._redis_url = redis_url
+        self._redis = None
+        self._lease_ms = lease_ms
+        self._poll_ms = poll_ms
+        self._slots: Dict[str, _Slot] = {}
+        self._waiting = 0
+
+    async def _get_redis(self):
+        if not self._redis_url:
+            return None
+        if self._redis is None:
+            import redis.asyncio as aioredis  # optional dependency
+            self._redis = aioredis.from_url(self._redis_url, decode_responses=True)
+        return self._redis
+
+    async def _acquire_lease(self, user_id: str) -> Optional[str]:
+        try:
+            r = await self._get_redis()
+            if r is None:
+                return None
+            key = f"lock:user:{user_id}"
+            token = uuid.uuid4().hex
+            # An abandoned lease expires after lease_ms, so waiting longer than that means contention
+            deadline = time.monotonic() + self._lease_ms / 1000 * 2
+            while True:
+                if await r.set(key, token, nx=True, px=self._lease_ms):
+                    return token
+                if time.monotonic() > deadline:
+                    metrics.incr("mailbox.lease_timeouts")
+                    logger.warning("User lease wait timed out for %s...", user_id[:8])
+                    raise LeaseTimeout(user_id[:8])
+                await asyncio.sleep(self._poll_ms / 1000)
+        except LeaseTimeout:
+            raise
+        except Exception as e:
+            metrics.incr("mailbox.lease_errors")
+            logger.warning("User lease unavailable, serializing locally only: %s", type(e).__name__)
+            return None
+
+    async def _renew_lease(self, user_id: str, token: str) -> None:
+        r = await self._get_redis()
+        while True:
+            await asyncio.sleep(self._lease_ms / 3000)
+            try:
+                await r.eval(_RENEW_LUA, 1, f"lock:user:{user_id}", token, self._lease_ms)
+            except Exception as e:
+                logger.warning("User lease renew failed: %s", type(e).__name__)
+
+    async def _release_lease(self, user_id: str, token: str) -> None:
+        try:
+            r = await self._get_redis()
+            await r.eval(_RELEASE_LUA, 1, f"lock:user:{user_id}", token)
+        except Exception as e:
+            logger.warning("User lease release failed: %s", type(e).__name__)
+
+    @asynccontextmanager
+    async def hold(self, user_id: str):
+        slot = self._slots.get(user_id)
+        if slot is None:
+            slot = self._slots[user_id] = _Slot()
+        slot.refs += 1
+        self._set_waiting(+1)
+        waiting = True
+        t0 = time.monotonic()
+        try:
+            async with slot.lock:
+                token = await self._acquire_lease(user_id)
+                self._set_waiting(-1)
+                waiting = False
+                metrics.observe("mailbox.wait_ms", (time.monotonic() - t0) * 1000)
+                renewer = asyncio.create_task(self._renew_lease(user_id, token)) if token else None
+                try:
+                    yield
+                finally:
+                    if renewer:
+                        renewer.cancel()
+                    if token:
+                        await self._release_lease(user_id, token)
+        finally:
+            if waiting:  # cancelled before getting the slot
+                self._set_waiting(-1)
+            slot.refs -= 1
+            if slot.refs == 0 and self._slots.get(user_id) is slot:
+                del self._slots[user_id]
+            metrics.gauge("mailbox.active_users", len(self._slots))
+
+    def _set_waiting(self, delta: int) -> None:
+        self._waiting += delta
+        metrics.gauge("mailbox.queue_depth", self._waiting)
+
+    @property
+    def active_users(self) -> int:
+        return len(self._slots)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting
+
+
+_mailbox: Optional[UserMailbox] = None
+
+
+def get_mailbox() -> UserMailbox:
+    global _mailbox
+    if _mailbox is None:
+        from app.config import get_settings
+        s = get_settings()
+        _mailbox = UserMailbox(redis_url=s.redis_url, lease_ms=s.user_lock_lease_ms)
+    return _mailbox
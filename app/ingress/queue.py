@@ -0,0 +1,208 @@
+"""
+Durable webhook ingress queue.
+
+In INGRESS_MODE=queue the /callback handler only verifies the signature and appends
+each text event here; a WorkerPool (app/ingress/worker.py) consumes the queue and runs
+the message handler.  Uses Redis Streams with a consumer group when REDIS_URL is set,
+so entries survive a restart and are reclaimed from crashed consumers; falls back to
+an in-process queue (not durable — tests / local dev only).
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_GROUP = "workers"
+_MAXLEN = 100_000
+_DEAD_MAXLEN = 10_000
+_CLAIM_INTERVAL = 5.0  # seconds between XAUTOCLAIM sweeps when nothing was stuck
+
+
+@dataclass
+class QueuedEvent:
+    id: str
+    payload: dict
+    attempts: int = 0
+    not_before: float = 0.0
+
+
+class MemoryEventQueue:
+    """In-process queue with the same ack / retry / dead-letter semantics as Redis."""
+
+    def __init__(self):
+        self._ready: Deque[QueuedEvent] = deque()
+        self._pending: dict = {}
+        self._dead: List[dict] = []
+        self._seq = 0
+        self._cond = asyncio.Condition()
+
+    async def enqueue(self, payload: dict, attempts: int = 0, not_before: float = 0.0) -> str:
+        self._seq += 1
+        event = QueuedEvent(id=str(self._seq), payload=payload, attempts=attempts, not_before=not_before)
+        async with self._cond:
+            self._ready.append(event)
+            self._cond.notify()
+        return event.id
+
+    async def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedEvent]:
+        async with self._cond:
+            if not self._ready:
+                try:
+                    await asyncio.wait_for(self._cond.wait(), timeout=block_ms / 1000)
+                except asyncio.TimeoutError:
+                    return None
+            if not self._ready:
+                return None
+            event = self._ready.popleft()
+        self._pending[event.id] = event
+        return event
+
+    async def ack(self, event: QueuedEvent) -> None:
+        self._pending.pop(event.id, None)
+
+    async def retry(self, event: QueuedEvent, delay: float) -> None:
+        await self.enqueue(event.payload, event.attempts + 1, time.time() + delay)
+        await self.ack(event)
+
+    async def dead_letter(self, event: QueuedEvent, error: str) -> None:
+        self._dead.append({"payload": event.payload, "attempts": event.attempts, "error": error})
+        self._dead = self._dead[-_DEAD_MAXLEN:]
+        await self.ack(event)
+
+    async def dead_letters(self, count: int = 100) -> List[dict]:
+        return self._dead[-count:]
+
+    async def depth(self) -> int:
+        return len(self._ready) + len(self._pending)
+
+    async def close(self) -> None:
+        return None
+
+
+class RedisStreamQueue:
+    """
+    Redis Streams backend.  Each entry is acked only after the handler finished (or was
+    dead-lettered); entries left pending by a dead consumer for longer than claim_idle_ms
+    are taken over with XAUTOCLAIM.  Retries are re-added with attempts+1 and a not_before
+    timestamp before the original is acked, so a crash mid-backoff never drops the event.
+    """
+
+    def __init__(self, redis_url: str, stream: str, claim_idle_ms: int = 60_000):
+        self._redis_url = redis_url
+        self._stream = stream
+        self._dead_stream = f"{stream}:dead"
+        self._claim_idle_ms = claim_idle_ms
+        self._last_claim = 0.0
+        self._redis = None
+
+    async def _get_redis(self):
+        if self._redis is None:
+            import redis.asyncio as aioredis  # optional dependency
+            self._redis = aioredis.from_url(self._redis_url, decode_responses=True)
+            try:
+                await self._redis.xgroup_create(self._stream, _GROUP, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        return self._redis
+
+    @staticmethod
+    def _fields(payload: dict, attempts: int, not_before: float) -> dict:
+        return {
+            "payload": json.dumps(payload, ensure_ascii=False),
+            "attempts": attempts,
+            "not_before": not_before,
+        }
+
+    @staticmethod
+    def _event(entry_id: str, fields: dict) -> QueuedEvent:
+        return QueuedEvent(
+            id=entry_id,
+            payload=json.loads(fields.get("payload") or "{}"),
+            attempts=int(fields.get("attempts") or 0),
+            not_before=float(fields.get("not_before") or 0),
+        )
+
+    async def enqueue(self, payload: dict, attempts: int = 0, not_before: float = 0.0) -> str:
+        r = await self._get_redis()
+        return await r.xadd(
+            self._stream, self._fields(payload, attempts, not_before), maxlen=_MAXLEN, approximate=True
+        )
+
+    async def consume(self, consumer: str, block_ms: int = 1000) -> Optional[QueuedEvent]:
+        r = await self._get_redis()
+        entries = []
+        now = time.monotonic()
+        if now - self._last_claim > _CLAIM_INTERVAL:
+            claimed = await r.xautoclaim(
+                self._stream, _GROUP, consumer, min_idle_time=self._claim_idle_ms, start_id="0-0", count=1
+            )
+            entries = claimed[1] if claimed else []
+            if not entries:
+                self._last_claim = now
+        if not entries:
+            resp = await r.xreadgroup(_GROUP, consumer, {self._stream: ">"}, count=1, block=block_ms)
+            entries = resp[0][1] if resp else []
+        for entry_id, fields in entries:
+            if fields is None:  # entry trimmed while pending
+                await r.xack(self._stream, _GROUP, entry_id)
+                continue
+            return self._event(entry_id, fields)
+        return None
+
+    async def ack(self, event: QueuedEvent) -> None:
+        r = await self._get_redis()
+        await r.xack(self._stream, _GROUP, event.id)
+
+    async def retry(self, event: QueuedEvent, delay: float) -> None:
+        await self.enqueue(event.payload, event.attempts + 1, time.time() + delay)
+        await self.ack(event)
+
+    async def dead_letter(self, event: QueuedEvent, error: str) -> None:
+        r = await self._get_redis()
+        fields = self._fields(event.payload, event.attempts, 0)
+        fields["error"] = error
+        await r.xadd(self._dead_stream, fields, maxlen=_DEAD_MAXLEN, approximate=True)
+        await self.ack(event)
+
+    async def dead_letters(self, count: int = 100) -> List[dict]:
+        r = await self._get_redis()
+        entries = await r.xrevrange(self._dead_stream, count=count)
+        return [
+            {"payload": json.loads(f["payload"]), "attempts": int(f["attempts"]), "error": f.get("error", "")}
+            for _, f in reversed(entries)
+        ]
+
+    async def depth(self) -> int:
+        r = await self._get_redis()
+        groups = await r.xinfo_groups(self._stream)
+        for g in groups:
+            if g.get("name") == _GROUP:
+                return int(g.get("lag") or 0) + int(g.get("pending") or 0)
+        return 0
+
+    async def close(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+
+_queue = None
+
+
+def get_event_queue():
+    global _queue
+    if _queue is None:
+        from app.config import get_settings
+        s = get_settings()
+        if s.redis_url:
+            _queue = RedisStreamQueue(s.redis_url, s.ingress_stream)
+        else:
+            logger.warning("INGRESS_MODE=queue without REDIS_URL — using in-process queue (not durable)")
+            _queue = MemoryEventQueue()
+    return _queue
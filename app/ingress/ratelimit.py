@@ -0,0 +1,133 @@
+"""
+Per-LINE-user rate limiting.
+
+Every webhook arrives from LINE's small pool of addresses, so a per-IP limit throttles
+all customers together.  This limiter keys on source.userId instead and runs in
+/callback after signature verification and redelivery dedup: each text event takes
+one token from its user's bucket (USER_RATE_PER_MINUTE refill, USER_RATE_BURST
+capacity).  Events over the limit are dropped, but the webhook is still acked with
+200, so LINE never sees a failure because one user is flooding.
+
+With REDIS_URL set the buckets live in Redis (one EVAL per webhook body, clock taken
+from Redis TIME so every worker shares one view); otherwise, or while Redis is
+unreachable, a bounded in-memory table on this instance is used.  The EVAL is bounded
+by REDIS_OP_TIMEOUT_MS and a circuit breaker skips Redis after repeated failures, so a
+hung Redis cannot hold up the ack.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from app.memory.breaker import CLOSED, CircuitBreaker
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# KEYS: one bucket hash per event (a user may repeat) — ARGV: refill per second, burst, key TTL.
+# Returns 1 / 0 per key.  Repeated keys see the previous iteration's write.
+_BUCKET_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, burst, ttl = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local out = {}
+for i, key in ipairs(KEYS) do
+  local b = redis.call('HMGET', key, 'tokens', 'ts')
+  local tokens = tonumber(b[1]) or burst
+  local ts = tonumber(b[2]) or now
+  tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+  out[i] = 0
+  if tokens >= 1 then
+    tokens = tokens - 1
+    out[i] = 1
+  end
+  redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', tostring(now))
+  redis.call('EXPIRE', key, ttl)
+end
+return out
+"""
+
+
+class UserRateLimiter:
+    def __init__(
+        self,
+        per_minute: int,
+        burst: int,
+        redis_url: Optional[str] = None,
+        max_entries: int = 50_000,
+        op_timeout_ms: int = 500,
+    ):
+        self.enabled = per_minute > 0
+        self._rate = per_minute / 60.0
+        self._burst = max(1, burst)
+        self._ttl = int(self._burst / self._rate) + 1 if self.enabled else 0  # full again by then
+        self._redis_url = redis_url
+        self._redis = None
+        self._op_timeout = op_timeout_ms / 1000
+        self._breaker = CircuitBreaker("ratelimit")
+        self._max_entries = max_entries
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # user -> (tokens, ts)
+
+    async def _get_redis(self):
+        if not self._redis_url or not self._breaker.allow():
+            return None
+        if self._redis is None:
+            import redis.asyncio as aioredis  # optional dependency
+            self._redis = aioredis.from_url(
+                self._redis_url,
+                decode_responses=True,
+                socket_timeout=self._op_timeout,
+                socket_connect_timeout=self._op_timeout,
+            )
+        return self._redis
+
+    def _take_local(self, user_id: str, now: float) -> bool:
+        tokens, ts = self._buckets.pop(user_id, (self._burst, now))
+        tokens = min(self._burst, tokens + max(0.0, now - ts) * self._rate)
+        allowed = tokens >= 1
+        self._buckets[user_id] = (tokens - 1 if allowed else tokens, now)
+        while len(self._buckets) > self._max_entries:
+            self._buckets.popitem(last=False)  # least recently seen — its bucket is the fullest anyway
+        return allowed
+
+    async def admit(self, user_ids: Sequence[str]) -> List[bool]:
+        """One flag per event: True if the user still has a token and the event should be processed."""
+        if not self.enabled or not user_ids:
+            return [True] * len(user_ids)
+        result = None
+        try:
+            r = await self._get_redis()
+            if r is not None:
+                keys = [f"rl:{uid}" for uid in user_ids]
+                flags = await asyncio.wait_for(
+                    r.eval(_BUCKET_LUA, len(keys), *keys, self._rate, self._burst, self._ttl), self._op_timeout
+                )
+                result = [bool(ok) for ok in flags]
+                if self._breaker.state != CLOSED:
+                    self._breaker.record_success()
+        except Exception as e:
+            self._breaker.record_failure()
+            logger.warning("Redis rate limiter unavailable, using local buckets: %s", type(e).__name__)
+        if result is None:
+            now = time.monotonic()
+            result = [self._take_local(uid, now) for uid in user_ids]
+        for uid, ok in zip(user_ids, result):
+            if not ok:
+                metrics.incr("ratelimit.limited")
+                logger.info("Rate limited user %s...", uid[:8])
+        return result
+
+
+_limiter: Optional[UserRateLimiter] = None
+
+
+def get_user_rate_limiter() -> UserRateLimiter:
+    global _limiter
+    if _limiter is None:
+        from app.config import get_settings
+        s = get_settings()
+        _limiter = UserRateLimiter(
+            s.user_rate_per_minute, s.user_rate_burst, redis_url=s.redis_url, op_timeout_ms=s.redis_op_timeout_ms
+        )
+    return _limiter
@@ -0,0 +1,128 @@
+"""
+Async worker pool that drains the ingress queue.
+
+Each worker consumes one event at a time, waits out any retry backoff, runs the handler
+and acks.  A handler exception schedules a retry with exponential backoff; after
+max_attempts the event goes to the dead-letter list.  Backoff is kept short because a
+LINE reply token is only valid for about a minute.  The handler is told whether this is
+the last attempt, so it can raise on a transient error and only send its fallback reply
+when no retry is left.
+
+The pool runs inside the web process (main.py lifespan) or on its own with
+`python worker.py`; INGRESS_ROLE=web keeps it out of the web process.
+"""
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[dict, bool], Awaitable[None]]  # (payload, last attempt)
+
+
+class WorkerPool:
+    def __init__(
+        self,
+        queue,
+        handler: Handler,
+        concurrency: int = 4,
+        max_attempts: int = 3,
+        base_backoff: float = 1.0,
+        max_backoff: float = 16.0,
+    ):
+        self._queue = queue
+        self._handler = handler
+        self._concurrency = max(1, concurrency)
+        self._max_attempts = max(1, max_attempts)
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+        self._consumer_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self._max_backoff, self._base_backoff * (2 ** attempts))
+
+    async def _process(self, event) -> None:
+        wait = event.not_before - time.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        last = event.attempts + 1 >= self._max_attempts
+        try:
+            await self._handler(event.payload, last)
+        except Exception as e:
+            if last:
+                logger.error("Ingress event %s dead-lettered after %d attempts: %s",
+                             event.id, event.attempts + 1, type(e).__name__)
+                await self._queue.dead_letter(event, type(e).__name__)
+            else:
+                delay = self._backoff(event.attempts)
+                logger.warning("Ingress event %s failed (%s), retrying in %.1fs",
+                               event.id, type(e).__name__, delay)
+                await self._queue.retry(event, delay)
+            return
+        await self._queue.ack(event)
+
+    async def _run(self, index: int) -> None:
+        consumer = f"{self._consumer_prefix}-{index}"
+        while not self._stopping:
+            try:
+                event = await self._queue.consume(consumer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Ingress consume error: %s", type(e).__name__)
+                await asyncio.sleep(1)
+                continue
+            if event is None:
+                continue
+            try:
+                await self._process(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # ack/retry bookkeeping failed — leave the entry pending so it is reclaimed
+                logger.error("Ingress worker error on %s: %s", event.id, type(e).__name__)
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self._concurrency)]
+        logger.info("Ingress worker pool started (%d workers)", self._concurrency)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Stop consuming; in-flight events get `timeout` seconds before being cancelled (and later reclaimed)."""
+        self._stopping = True
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+
+_pool: Optional[WorkerPool] = None
+
+
+def get_worker_pool(handler: Handler) -> WorkerPool:
+    global _pool
+    if _pool is None:
+        from app.config import get_settings
+        from app.ingress.queue import get_event_queue
+        s = get_settings()
+        _pool = WorkerPool(
+            get_event_queue(),
+            handler,
+            concurrency=s.ingress_workers,
+            max_attempts=s.ingress_max_attempts,
+        )
+    return _pool
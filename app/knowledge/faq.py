@@ -0,0 +1,143 @@
+"""
+Canned answers for the COMMON QUESTIONS / GREETING sections of SYSTEM_PROMPT.
+
+Greetings, warranty, shipping, installation, showroom and payment-terms questions get
+the exact replies the prompt already prescribes, straight from faq.json in Thai,
+English or Chinese, without a completion.  Matching is deliberately conservative —
+anything that mentions a SKU, asks about price/catalog/quotation, matches more than
+one intent or is long enough to carry a second question goes to the LLM.
+"""
+import json
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import List, Optional
+
+from app.knowledge.lookup import find_skus_in_text
+
+_DATA_PATH = Path(__file__).parent / "faq.json"
+
+_MAX_LEN = 80  # normalized chars; longer messages usually carry more than one ask
+
+# Signals that the message needs the LLM even if an FAQ keyword matched
+_DEFER_WORDS = (
+    "ราคา", "แคตตาล็อก", "แคตตาล็อค", "โบรชัวร์", "ใบเสนอราคา", "เปรียบเทียบ", "ต่างกัน", "แนะนำ", "งบ",
+    "price", "catalog", "catalogue", "quotation", "quote", "compare", "recommend", "budget",
+    "价格", "多少钱", "目录", "报价", "比较", "推荐",
+)
+_PARTICLES = re.compile(r"(ครับ|คับ|ค่ะ|คะ|ค่า|นะ|จ้า|จ้ะ|ฮะ|หน่อย)")
+_SPACES = re.compile(r"\s+")
+
+_RETAIL_SIGNALS = ("ส่วนตัว", "ใช้เอง", "บ้าน", "รีโนเวท", "personal", "home", "自用", "家用")
+_PROJECT_SIGNALS = ("โปรเจค", "โครงการ", "โรงแรม", "คอนโด", "ดีลเลอร์", "บริษัท",
+                    "project", "hotel", "condo", "dealer", "company", "项目", "工程", "酒店", "公司")
+
+
+@dataclass
+class FaqAnswer:
+    intent: str
+    language: str
+    text: str
+
+
+@lru_cache(maxsize=1)
+def _load() -> dict:
+    data = json.loads(_DATA_PATH.read_text(encoding="utf-8"))
+    for entry in data.values():
+        # Matched against normalize(text), so normalized the same way (NFKC splits Thai sara am)
+        entry["_terms"] = [normalize(k) for k in entry["keywords"].get("th", []) + entry["keywords"].get("zh", [])]
+        # English keywords match on word boundaries; Thai / Chinese have no spaces → substring
+        entry["_en_re"] = re.compile(
+            r"\b(" + "|".join(re.escape(k) for k in entry["keywords"].get("en", [])) + r")\b"
+        )
+    return data
+
+
+def normalize(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text).lower()
+    # Drop punctuation / symbols / emoji by category — \w would also drop Thai vowel marks (Mn)
+    t = "".join(" " if unicodedata.category(ch)[0] in "PS" else ch for ch in t)
+    return _SPACES.sub(" ", t).strip()
+
+
+def detect_language(text: str) -> str:
+    """Majority script: 'th', 'zh' or 'en' (Thai is the default for empty / mixed input)."""
+    thai = cjk = latin = 0
+    for ch in text:
+        o = ord(ch)
+        if 0x0E00 <= o <= 0x0E7F:
+            thai += 1
+        elif 0x4E00 <= o <= 0x9FFF:
+            cjk += 1
+        elif ch.isascii() and ch.isalpha():
+            latin += 1
+    if cjk > thai and cjk * 2 >= latin:
+        return "zh"
+    if latin > thai and latin > cjk:
+        return "en"
+    return "th"
+
+
+def _hits(entry: dict, norm: str) -> List[str]:
+    found = [k for k in entry["_terms"] if k in norm]
+    found += entry["_en_re"].findall(norm)
+    return found
+
+
+def customer_type(texts: List[str]) -> Optional[str]:
+    """Latest retail / project label mentioned by the customer, newest first."""
+    for t in reversed(texts):
+        low = t.lower()
+        if any(s in low for s in _PROJECT_SIGNALS):
+            return "project"
+        if any(s in low for s in _RETAIL_SIGNALS):
+            return "retail"
+    return None
+
+
+def detect_intent(text: str) -> Optional[str]:
+    """Cheap first pass (no store access): the single FAQ intent the message asks, or None."""
+    norm = normalize(text)
+    if not norm or len(norm) > _MAX_LEN or find_skus_in_text(text):
+        return None
+    if any(normalize(w) in norm for w in _DEFER_WORDS):
+        return None
+
+    matched = []
+    for intent, entry in _load().items():
+        hits = _hits(entry, norm)
+        if not hits:
+            continue
+        if entry.get("exclusive"):
+            rest = _PARTICLES.sub(" ", norm)
+            for h in hits:
+                rest = rest.replace(h, " ")
+            if rest.strip():
+                continue  # greeting plus something else — let the LLM answer the rest
+        matched.append(intent)
+    return matched[0] if len(matched) == 1 else None
+
+
+def topics(text: str) -> List[str]:
+    """Every intent whose keywords appear in the message, without the deferral rules (prompt scoping)."""
+    norm = normalize(text)
+    return [intent for intent, entry in _load().items() if _hits(entry, norm)]
+
+
+def answer(intent: str, text: str, history: List[dict]) -> Optional[FaqAnswer]:
+    """Resolve a detected intent against the conversation; None means defer to the LLM."""
+    entry = _load()[intent]
+    if entry.get("first_turn_only") and history:
+        return None
+    lang = detect_language(text)
+    answers = entry["answers"]
+    if entry.get("by_customer_type"):
+        user_texts = [m.get("content") or "" for m in history if m.get("role") == "user"] + [text]
+        ctype = customer_type(user_texts)
+        if ctype is None:
+            return None
+        answers = answers[ctype]
+    reply = answers.get(lang) or answers["th"]
+    return FaqAnswer(intent=intent, language=lang, text=reply)
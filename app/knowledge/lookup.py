@@ -40,6 +40,23 @@ def find_skus_in_text(text: str) -> list[str]:
     return [m.upper() for m in re.findall(r"CF-[A-Z0-9]+", text, re.IGNORECASE)]
 
 
+def catalog_prices(sku: str) -> set[int]:
+    """Every price the catalog lists for `sku` (retail and project, per color); empty if unknown."""
+    p = get_product(sku)
+    if p is None:
+        return set()
+    entries = [p]
+    if isinstance(p.get("colors"), dict):
+        entries += [v for v in p["colors"].values() if isinstance(v, dict)]
+    prices = set()
+    for entry in entries:
+        if entry.get("list_price"):
+            prices.add(entry["list_price"])
+        if entry.get("project_price"):
+            prices.add(entry["project_price"]["price"])
+    return prices
+
+
 def _format_product(sku: str, p: dict) -> str:
     lines = [f"{sku} — {p.get('name_th', '')}"]
     if p.get("series"):
@@ -1,4 +1,39 @@
+"""
+Endpoint ceiling for /callback.
+
+Per-customer limits are per LINE user (app/ingress/ratelimit.py).  This ceiling only
+guards the ack endpoint against junk: it counts requests that fail before signature
+verification succeeds (missing or bad X-Line-Signature, oversized body) per source
+address.  Once an address is over CALLBACK_REJECT_LIMIT, its unsigned requests get 429
+without the body being read and its failing ones get 429 instead of 400/413.  A
+correctly signed request is never counted and never refused — even when the address
+is shared with the junk (e.g. the platform's proxy) — so legitimate LINE traffic
+cannot see failures from it.  Counts are per process (slowapi in-memory storage).
+"""
+from fastapi import Request
+from limits import parse
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
+from app.metrics import metrics
+
 limiter = Limiter(key_func=get_remote_address)
+
+_SCOPE = "callback-rejected"
+
+
+def _ceiling():
+    from app.config import get_settings
+    return parse(get_settings().callback_reject_limit)
+
+
+def rejections_exceeded(request: Request) -> bool:
+    if not limiter.enabled or limiter.limiter.test(_ceiling(), _SCOPE, get_remote_address(request)):
+        return False
+    metrics.incr("callback.over_ceiling")
+    return True
+
+
+def count_rejection(request: Request) -> None:
+    if limiter.enabled:
+        limiter.limiter.hit(_ceiling(), _SCOPE, get_remote_address(request))
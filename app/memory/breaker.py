@@ -0,0 +1,111 @@
+"""
+Circuit breaker for the Redis-backed stores.
+
+  closed     Redis is used; failures inside FAILURE_WINDOW are counted, and
+             failure_threshold of them trip the breaker.
+  open       Redis is skipped (callers run in their in-memory degraded mode) until the
+             backoff expires: base_backoff, doubled on every failed probe up to max_backoff.
+  half_open  A single caller is let through to probe; success closes the breaker and
+             resets the backoff, failure re-opens it.
+
+State and trip counts are published as breaker.<name>.state (0 closed, 1 half-open,
+2 open) and breaker.<name>.trips in /metrics, and snapshot() feeds /health.
+"""
+import logging
+import time
+from collections import deque
+from typing import Deque
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+_STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+FAILURE_WINDOW = 30.0  # seconds
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = 3, base_backoff: float = 1.0, max_backoff: float = 60.0):
+        self.name = name
+        self._threshold = max(1, failure_threshold)
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._backoff = base_backoff
+        self._state = CLOSED
+        self._failures: Deque[float] = deque()
+        self._retry_at = 0.0
+        self._probing = False
+        self.trips = 0
+        self._publish()
+
+    def _publish(self) -> None:
+        metrics.gauge(f"breaker.{self.name}.state", _STATE_CODES[self._state])
+
+    def _open(self) -> None:
+        self._state = OPEN
+        self._retry_at = time.monotonic() + self._backoff
+        self._probing = False
+        self._publish()
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() >= self._retry_at:
+            return HALF_OPEN
+        return self._state
+
+    def allow(self) -> bool:
+        """True if the caller may use Redis now; in half-open only one probe is let through."""
+        if self._state == CLOSED:
+            return True
+        if self._state == OPEN:
+            if time.monotonic() < self._retry_at:
+                return False
+            self._state = HALF_OPEN
+            self._publish()
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self) -> None:
+        if self._state != CLOSED:
+            logger.info("Redis breaker '%s' closed — reconnected", self.name)
+        self._state = CLOSED
+        self._probing = False
+        self._failures.clear()
+        self._backoff = self._base_backoff
+        self._publish()
+
+    def trip(self) -> None:
+        """Open immediately — for connection-level failures, where retrying at once is pointless."""
+        if self._state == CLOSED:
+            self.trips += 1
+            metrics.incr(f"breaker.{self.name}.trips")
+            logger.warning("Redis breaker '%s' opened — degraded to in-memory for %.0fs", self.name, self._backoff)
+            self._failures.clear()
+            self._open()
+        else:
+            self.record_failure()
+
+    def record_failure(self) -> None:
+        now = time.monotonic()
+        if self._state == HALF_OPEN:
+            self._backoff = min(self._backoff * 2, self._max_backoff)
+            logger.warning("Redis breaker '%s' probe failed, retry in %.0fs", self.name, self._backoff)
+            self._open()
+            return
+        if self._state == OPEN:
+            return
+        self._failures.append(now)
+        while self._failures and now - self._failures[0] > FAILURE_WINDOW:
+            self._failures.popleft()
+        if len(self._failures) >= self._threshold:
+            self.trip()
+
+    def snapshot(self) -> dict:
+        retry_in = max(0.0, self._retry_at - time.monotonic()) if self._state == OPEN else 0.0
+        return {"state": self.state, "trips": self.trips, "retry_in_s": round(retry_in, 1)}
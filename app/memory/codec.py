@@ -0,0 +1,70 @@
+"""
+Value codecs for the Redis keys of ConversationStore (history entries and flow state).
+
+A value is one version byte followed by the payload:
+
+  0x01  orjson — UTF-8, so Thai stays 3 bytes per character instead of a 6-byte \\uXXXX escape
+  0x02  zlib-compressed orjson, used once the encoded value reaches compress_min bytes
+
+Values without a version byte are plain json text (what older releases wrote), so
+old and new keys coexist during a rollout and are rewritten as they are touched.
+STORE_CODEC=json (the default for now) keeps writing that legacy format, for rolling
+out (or back) in two steps: first deploy readers of every format, then switch writers
+with STORE_CODEC=orjson.
+"""
+import json
+import zlib
+from typing import Union
+
+# dumps / loads are also the JSON helpers for the rest of the app (e.g. app/ingress/events.py)
+try:
+    import orjson as _orjson  # optional dependency — several times faster than json
+
+    def dumps(obj) -> bytes:
+        return _orjson.dumps(obj)
+
+    loads = _orjson.loads
+except ImportError:  # pragma: no cover
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+    loads = json.loads
+
+V_ORJSON = 0x01
+V_ZLIB = 0x02
+
+_ORJSON = bytes([V_ORJSON])
+_ZLIB = bytes([V_ZLIB])
+
+CODECS = ("orjson", "json")
+
+
+class Codec:
+    def __init__(self, fmt: str = "orjson", compress_min: int = 512, level: int = 6):
+        if fmt not in CODECS:
+            raise ValueError(f"Unknown store codec {fmt!r} (expected one of {', '.join(CODECS)})")
+        self.fmt = fmt
+        self._compress_min = compress_min
+        self._level = level
+
+    def encode(self, obj) -> bytes:
+        if self.fmt == "json":
+            return json.dumps(obj, ensure_ascii=False).encode()
+        payload = dumps(obj)
+        if 0 < self._compress_min <= len(payload):
+            packed = zlib.compress(payload, self._level)
+            if len(packed) < len(payload):
+                return _ZLIB + packed
+        return _ORJSON + payload
+
+    @staticmethod
+    def decode(raw: Union[bytes, str]):
+        """Decode any supported format, whichever codec this process writes."""
+        if isinstance(raw, str):
+            raw = raw.encode()
+        tag = raw[0]
+        if tag == V_ORJSON:
+            return loads(raw[1:])
+        if tag == V_ZLIB:
+            return loads(zlib.decompress(raw[1:]))
+        return loads(raw)  # legacy json text
@@ -0,0 +1,189 @@
+"""
+Per-process L1 cache of per-user state (history, quote flow, lead flow, summary) in front
+of the Redis backend of ConversationStore.  Enabled with L1_CACHE_USERS > 0.
+
+Coherence across instances:
+  - Every Redis write for a user bumps ver:{user_id} and PUBLISHes "<instance> <user> <ver>"
+    on CHANNEL, inside the same MULTI as the write (no extra round-trip).
+  - Each instance subscribes and drops its copy when a newer version was written elsewhere.
+    A "fence" remembers the newest version seen per user so a read that raced with the
+    invalidation cannot re-insert older data.
+  - get_session always reaches Redis (the usage counter must), so it also sends the cached
+    version and Redis only returns the payload when it changed — strongly consistent on the
+    message path even if a pub/sub message is still in flight.
+Writes are write-through: when the local copy is exactly one version behind, it is updated
+in place instead of dropped.  Redis expiring a key on its own TTL bumps no version, so an
+entry never outlives the shortest remaining TTL of the keys it was filled from, nor L1_TTL.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "clawbot:l1"
+L1_TTL = 300.0
+
+FIELDS = ("history", "quote_flow", "lead_flow", "summary")
+
+# KEYS: ver:{user} — ARGV: channel, instance id, user id, ttl.  Run inside the writer's MULTI.
+BUMP_LUA = """
+local v = redis.call('INCR', KEYS[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+redis.call('PUBLISH', ARGV[1], ARGV[2] .. ' ' .. ARGV[3] .. ' ' .. v)
+return v
+"""
+
+
+class _Entry:
+    __slots__ = ("version", "expires", "values")
+
+    def __init__(self, version: int):
+        self.version = version
+        self.expires = time.monotonic() + L1_TTL
+        self.values: Dict[str, object] = {}
+
+
+class L1Cache:
+    def __init__(self, max_users: int = 10_000, instance_id: str = ""):
+        self.instance_id = instance_id or uuid.uuid4().hex[:12]
+        self._max_users = max(1, max_users)
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._fences: "OrderedDict[str, int]" = OrderedDict()
+        self._listener: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.listening = False
+
+    # ── lookups / fills ─────────────────────────────────────────────────────
+
+    def _entry(self, user_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry.expires <= time.monotonic():
+            del self._entries[user_id]
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def get(self, user_id: str, field: str):
+        """(True, value) on a hit, (False, None) on a miss."""
+        entry = self._entry(user_id) if self.listening else None
+        if entry is not None and field in entry.values:
+            metrics.incr("l1.hits")
+            return True, entry.values[field]
+        metrics.incr("l1.misses")
+        return False, None
+
+    def values(self, user_id: str, version: int) -> Optional[Dict[str, object]]:
+        """All cached fields if the entry is still at `version` (it may be invalidated meanwhile)."""
+        entry = self._entry(user_id) if self.listening else None
+        if entry is None or entry.version != version:
+            metrics.incr("l1.misses")
+            return None
+        metrics.incr("l1.hits")
+        return entry.values
+
+    def session_version(self, user_id: str) -> int:
+        """Version to send with get_session, or -1 unless all fields are cached."""
+        entry = self._entry(user_id) if self.listening else None
+        if entry is None or any(f not in entry.values for f in FIELDS):
+            return -1
+        return entry.version
+
+    def fill(self, user_id: str, version: int, ttl_ms: int = -1, **values) -> None:
+        """Cache values read at `version`; ttl_ms > 0 is the source keys' remaining PTTL."""
+        if not self.listening or version < self._fences.get(user_id, 0):
+            return
+        entry = self._entry(user_id)
+        if entry is None or entry.version != version:
+            entry = _Entry(version)
+            self._entries[user_id] = entry
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self._max_users:
+                self._entries.popitem(last=False)
+        if ttl_ms > 0:
+            entry.expires = min(entry.expires, time.monotonic() + ttl_ms / 1000)
+        entry.values.update(values)
+
+    def apply(self, user_id: str, version: int, field: str, update: Callable) -> None:
+        """Write-through after our own write produced `version`."""
+        self._fence(user_id, version)
+        entry = self._entry(user_id)
+        if entry is None:
+            return
+        if entry.version == version - 1 and field in entry.values:
+            entry.values[field] = update(entry.values[field])
+            entry.version = version
+        else:
+            del self._entries[user_id]
+
+    # ── invalidation ────────────────────────────────────────────────────────
+
+    def _fence(self, user_id: str, version: int) -> None:
+        if version > self._fences.get(user_id, 0):
+            self._fences[user_id] = version
+            self._fences.move_to_end(user_id)
+            while len(self._fences) > self._max_users:
+                self._fences.popitem(last=False)
+
+    def invalidate(self, user_id: str, version: int) -> None:
+        self._fence(user_id, version)
+        entry = self._entries.get(user_id)
+        if entry is not None and entry.version < version:
+            del self._entries[user_id]
+            metrics.incr("l1.invalidations")
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def _on_message(self, data) -> None:
+        if isinstance(data, bytes):
+            data = data.decode()
+        try:
+            instance, user_id, version = data.split(" ")
+        except ValueError:
+            return
+        if instance != self.instance_id:
+            self.invalidate(user_id, int(version))
+
+    def ensure_listener(self, r) -> None:
+        if not self._stopping and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.get_running_loop().create_task(self._listen(r))
+
+    async def _listen(self, r) -> None:
+        pubsub = r.pubsub(ignore_subscribe_messages=True)
+        try:
+            await pubsub.subscribe(CHANNEL)
+            self.clear()  # anything cached before the subscription may have missed invalidations
+            self.listening = True
+            logger.info("L1 cache subscribed to %s", CHANNEL)
+            while not self._stopping:
+                msg = await pubsub.get_message(timeout=1.0)
+                if msg and msg.get("type") == "message":
+                    self._on_message(msg["data"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("L1 invalidation listener stopped: %s", type(e).__name__)
+        finally:
+            self.listening = False
+            self.clear()
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+    async def close(self) -> None:
+        self._stopping = True
+        task, self._listener = self._listener, None
+        # redis-py's get_message(timeout=...) can swallow a cancellation that lands while it
+        # waits, so keep cancelling until the task is actually done (the flag ends the loop too).
+        while task is not None and not task.done():
+            task.cancel()
+            await asyncio.wait({task}, timeout=0.1)
@@ -0,0 +1,258 @@
+"""
+Bounded in-process backend for ConversationStore — used when REDIS_URL is unset or
+while the Redis breaker is open.
+
+Every piece of state lives in one LRU keyed like the Redis keyspace (conv:, qflow:,
+lflow:, summary:, usage:, tokens:) with the same TTL semantics:
+
+  conv   24h, refreshed on every write (RPUSH + EXPIRE)
+  flows  1800s, refreshed on every set
+  summary 24h, refreshed on every fold
+  usage  25h from the first increment of the day
+  tokens 32 days from the first charge of the day (kept for spend queries)
+
+A global entry budget and byte budget bound the whole thing; the least recently used
+key is evicted first, and expired keys are dropped when read or when they reach the
+LRU head.  History is kept as compact (role, content) tuples, not dicts.
+
+Quota counters (usage:, tokens:) are kept apart, outside those budgets: evicting one
+under memory pressure would reset that user's daily quota.  They have their own count
+cap (max_counters), which evicts the oldest counters, i.e. past days, first.
+
+A snapshot from the previous process (app/memory/snapshot.py) can be attached; a key
+missing from the LRU is then looked up there once, on first access.
+"""
+import sys
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.metrics import metrics
+
+CONV_TTL = 86400
+FLOW_TTL = 1800
+USAGE_TTL = 90000
+
+# Rough CPython footprint of the containers around each value, for the byte budget
+_ENTRY_OVERHEAD = 200
+_RECORD_OVERHEAD = 64
+_SWEEP_PER_WRITE = 2
+_QUOTA_PREFIXES = ("usage:", "tokens:")
+
+
+class _Entry:
+    __slots__ = ("value", "expires", "size")
+
+    def __init__(self, value, expires: float, size: int):
+        self.value = value
+        self.expires = expires
+        self.size = size
+
+
+def _text_size(s: str) -> int:
+    return sys.getsizeof(s)
+
+
+def _flow_size(state: dict) -> int:
+    return sum(_text_size(str(k)) + _text_size(str(v)) for k, v in state.items())
+
+
+class LocalBackend:
+    def __init__(
+        self,
+        max_history: int = 10,
+        max_entries: int = 100_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_counters: int = 200_000,
+    ):
+        self._max_history = max_history
+        self._max_entries = max(1, max_entries)
+        self._max_bytes = max(1, max_bytes)
+        self._max_counters = max(1, max_counters)
+        self._data: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._counters: "OrderedDict[str, _Entry]" = OrderedDict()  # by first increment
+        self._bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.snapshot = None  # SnapshotReader, see attach_snapshot
+
+    # ── core LRU ────────────────────────────────────────────────────────────
+
+    def _get(self, key: str) -> Optional[_Entry]:
+        counter = key.startswith(_QUOTA_PREFIXES)
+        entry = (self._counters if counter else self._data).get(key)
+        if entry is None:
+            return self._restore(key) if self.snapshot is not None else None
+        if entry.expires <= time.monotonic():
+            self._drop(key)
+            self.expirations += 1
+            return None
+        if not counter:
+            self._data.move_to_end(key)
+        return entry
+
+    def _drop(self, key: str) -> None:
+        if self.snapshot is not None:
+            self.snapshot.discard(key)
+        if key.startswith(_QUOTA_PREFIXES):
+            self._counters.pop(key, None)
+            return
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _put(self, key: str, value, ttl: float, size: int) -> None:
+        if self.snapshot is not None:
+            self.snapshot.discard(key)
+        if key.startswith(_QUOTA_PREFIXES):
+            self._put_counter(key, value, ttl)
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._data[key] = _Entry(value, time.monotonic() + ttl, size)
+        self._bytes += size
+        self._enforce()
+
+    def _resize(self, key: str, entry: _Entry, delta: int) -> None:
+        entry.size += delta
+        self._bytes += delta
+        self._enforce()
+
+    def _put_counter(self, key: str, value, ttl: float) -> None:
+        now = time.monotonic()
+        self._counters.pop(key, None)
+        self._counters[key] = _Entry(value, now + ttl, _ENTRY_OVERHEAD)
+        while self._counters:
+            oldest, entry = next(iter(self._counters.items()))
+            if entry.expires > now and len(self._counters) <= self._max_counters:
+                break
+            del self._counters[oldest]
+            if entry.expires > now:
+                metrics.incr("memory_store.counter_evictions")
+        metrics.gauge("memory_store.counters", len(self._counters))
+
+    def _enforce(self) -> None:
+        now = time.monotonic()
+        for _ in range(_SWEEP_PER_WRITE):
+            if not self._data:
+                break
+            key, entry = next(iter(self._data.items()))
+            if entry.expires > now:
+                break
+            self._drop(key)
+            self.expirations += 1
+        evicted = 0
+        while len(self._data) > self._max_entries or (self._bytes > self._max_bytes and len(self._data) > 1):
+            _, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            metrics.incr("memory_store.evictions", evicted)
+        metrics.gauge("memory_store.entries", len(self._data))
+        metrics.gauge("memory_store.bytes", self._bytes)
+
+    # ── snapshot ────────────────────────────────────────────────────────────
+
+    def attach_snapshot(self, reader) -> None:
+        self.snapshot = reader
+
+    def _restore(self, key: str) -> Optional[_Entry]:
+        taken = self.snapshot.take(key)
+        if taken is None:
+            return None
+        value, ttl = taken
+        if key.startswith("conv:"):
+            value = deque(((sys.intern(role), content) for role, content in value), maxlen=self._max_history)
+            size = _ENTRY_OVERHEAD + sum(_RECORD_OVERHEAD + _text_size(content) for _, content in value)
+        elif key.startswith(_QUOTA_PREFIXES):
+            self._put(key, value, ttl, _ENTRY_OVERHEAD)
+            return self._counters.get(key)
+        else:
+            size = _ENTRY_OVERHEAD + _flow_size(value)
+        self._put(key, value, ttl, size)
+        return self._data.get(key)
+
+    def entries(self) -> Iterator[Tuple[str, _Entry]]:
+        return iter(list(self._data.items()) + list(self._counters.items()))
+
+    # ── conversation history ────────────────────────────────────────────────
+
+    def add_message(self, user_id: str, role: str, content: str) -> None:
+        key = f"conv:{user_id}"
+        record = (sys.intern(role), content)
+        size = _RECORD_OVERHEAD + _text_size(content)
+        entry = self._get(key)
+        if entry is None:
+            self._put(key, deque([record], maxlen=self._max_history), CONV_TTL, _ENTRY_OVERHEAD + size)
+            return
+        history: Deque[Tuple[str, str]] = entry.value
+        delta = size
+        if len(history) == history.maxlen:
+            delta -= _RECORD_OVERHEAD + _text_size(history[0][1])
+        history.append(record)
+        entry.expires = time.monotonic() + CONV_TTL
+        self._resize(key, entry, delta)
+
+    def get_history(self, user_id: str) -> List[Dict[str, str]]:
+        entry = self._get(f"conv:{user_id}")
+        if entry is None:
+            return []
+        return [{"role": role, "content": content} for role, content in entry.value]
+
+    def clear(self, user_id: str) -> None:
+        self._drop(f"conv:{user_id}")
+        self._drop(f"summary:{user_id}")
+
+    def drop_oldest(self, user_id: str, folded: List[Dict[str, str]]) -> int:
+        """Drop the `folded` messages still at the head of the history (see app/memory/summary.py)."""
+        from app.memory.summary import dropped_prefix
+
+        entry = self._get(f"conv:{user_id}")
+        if entry is None:
+            return 0
+        history: Deque[Tuple[str, str]] = entry.value
+        n = dropped_prefix(list(history), [(m["role"], m["content"]) for m in folded])
+        delta = 0
+        for _ in range(n):
+            delta -= _RECORD_OVERHEAD + _text_size(history.popleft()[1])
+        self._resize(f"conv:{user_id}", entry, delta)
+        return n
+
+    # ── quote / lead flow state ─────────────────────────────────────────────
+
+    def get_flow(self, kind: str, user_id: str) -> Optional[dict]:
+        entry = self._get(f"{kind}:{user_id}")
+        return entry.value if entry else None
+
+    def set_flow(self, kind: str, user_id: str, state: dict, ttl: float = FLOW_TTL) -> None:
+        self._put(f"{kind}:{user_id}", state, ttl, _ENTRY_OVERHEAD + _flow_size(state))
+
+    def clear_flow(self, kind: str, user_id: str) -> None:
+        self._drop(f"{kind}:{user_id}")
+
+    # ── daily usage ─────────────────────────────────────────────────────────
+
+    def get_usage(self, day: str, user_id: str, kind: str = "usage") -> int:
+        """kind: "usage" (messages) or "tokens"."""
+        entry = self._get(f"{kind}:{day}:{user_id}")
+        return entry.value if entry else 0
+
+    def incr_usage(self, day: str, user_id: str, amount: int = 1, kind: str = "usage", ttl: float = USAGE_TTL) -> int:
+        key = f"{kind}:{day}:{user_id}"
+        entry = self._get(key)
+        if entry is None:
+            self._put(key, amount, ttl, _ENTRY_OVERHEAD)
+            return amount
+        entry.value += amount  # TTL stays anchored at the first increment, as with INCR + EXPIRE
+        return entry.value
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "counters": len(self._counters),
+            "bytes": self._bytes,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,70 @@
+"""
+Per-user daily quota: messages and LLM tokens per Bangkok calendar day.
+
+A message is admitted only while the user is under both limits, and admitting it
+counts it.  That check-and-consume is one atomic step — QUOTA_LUA inside the Redis
+session script, a single synchronous step in the in-memory and SQLite backends — so
+concurrent messages from one user cannot both slip past the limit.
+
+A retried message (a queued event whose earlier attempt failed after it was counted)
+is passed as already admitted: it is neither checked nor counted again.
+
+Tokens are only known once the completion returns, so they are charged afterwards
+(ConversationStore.record_tokens with usage.total_tokens).  A user can therefore
+overshoot the token budget by the completions already in flight when they cross it.
+Token counters are kept for SPEND_TTL so per-user spend can be queried afterwards
+(get_spend, scripts/user_spend.py).
+"""
+import datetime
+from typing import Optional
+
+# Asia/Bangkok has no DST, so a fixed offset is exact — and needs no tzdata in slim images
+TIMEZONE = datetime.timezone(datetime.timedelta(hours=7), "Asia/Bangkok")
+SPEND_TTL = 32 * 86400
+
+MESSAGES = "messages"
+TOKENS = "tokens"
+
+# Prefix of the session script.  KEYS[1] message counter, KEYS[2] token counter —
+# ARGV[1] message limit, ARGV[2] token limit (-1 = none), ARGV[3] message counter TTL,
+# ARGV[5] 1 = already admitted.  Leaves `usage`, `tokens` and `allowed` (0/1) set for
+# the rest of the script.
+QUOTA_LUA = """
+local usage = tonumber(redis.call('GET', KEYS[1]) or '0')
+local tokens = tonumber(redis.call('GET', KEYS[2]) or '0')
+local msg_limit, tok_limit = tonumber(ARGV[1]), tonumber(ARGV[2])
+local allowed = 0
+if ARGV[5] == '1' then
+  allowed = 1
+elseif (msg_limit < 0 or usage < msg_limit) and (tok_limit < 0 or tokens < tok_limit) then
+  usage = redis.call('INCR', KEYS[1])
+  if usage == 1 then redis.call('EXPIRE', KEYS[1], ARGV[3]) end
+  allowed = 1
+end
+"""
+
+# KEYS[1] token counter — ARGV[1] tokens, ARGV[2] TTL (set when the day's counter is created)
+CHARGE_LUA = """
+local v = redis.call('INCRBY', KEYS[1], ARGV[1])
+if v == tonumber(ARGV[1]) then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+return v
+"""
+
+
+def bangkok_day(days_ago: int = 0) -> str:
+    """The quota day (YYYY-MM-DD): customers are in Thailand, so it rolls over at Bangkok midnight."""
+    return (datetime.datetime.now(TIMEZONE).date() - datetime.timedelta(days=days_ago)).isoformat()
+
+
+def limit_arg(limit: Optional[int]) -> int:
+    return -1 if limit is None else limit
+
+
+def admits(usage: int, tokens: int, msg_limit: int, tok_limit: int) -> bool:
+    """Same rule as QUOTA_LUA (limits as from limit_arg)."""
+    return (msg_limit < 0 or usage < msg_limit) and (tok_limit < 0 or tokens < tok_limit)
+
+
+def blocked_by(usage: int, msg_limit: int) -> str:
+    """Which limit refused a message that admits() turned down."""
+    return MESSAGES if 0 <= msg_limit <= usage else TOKENS
@@ -0,0 +1,188 @@
+"""
+Snapshot / restore of the in-memory LocalBackend across deploys (MEMORY_SNAPSHOT_PATH).
+
+On shutdown the live entries (histories, flows, today's usage and token counters) are written
+to a versioned binary file; on startup the file is attached to the new backend and each
+entry is decoded only when its key is first read, so a large snapshot costs nothing
+at startup.
+
+File layout (little-endian):
+
+  header   b"CLAWSNAP" | u8 version | f64 written_at (epoch) | u32 record count
+  record   u16 key length | u32 value length | f64 expires (epoch) | key | value
+
+Values go through the store codec (orjson, zlib for long histories).  Expiry is stored
+as wall-clock time, so time spent between shutdown and restart counts against the TTL.
+The file is written to a temp file, fsynced and renamed over the old one, so a crash
+mid-write leaves the previous snapshot intact.  Unknown versions are ignored; a
+truncated or corrupt file keeps the records before the damage.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+from app.memory.codec import Codec
+from app.memory.quota import bangkok_day
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"CLAWSNAP"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sBdI")
+_RECORD = struct.Struct("<HId")
+
+_codec = Codec()
+
+
+def _encode(key: str, value) -> bytes:
+    if key.startswith("conv:"):
+        value = [list(m) for m in value]
+    return _codec.encode(value)
+
+
+def _decode(key: str, raw: bytes):
+    value = _codec.decode(raw)
+    if key.startswith("conv:"):
+        return [(m[0], m[1]) for m in value]
+    return value
+
+
+class SnapshotReader:
+    """Lazily indexed view of a snapshot file; each record can be taken once."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            self._file.close()
+            raise ValueError(f"{path}: not a snapshot")
+        if len(self._mm) < _HEADER.size:
+            self.close()
+            raise ValueError(f"{path}: not a snapshot")
+        magic, version, self.written_at, self.count = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path}: unsupported snapshot (magic={magic!r}, version={version})")
+        self._index: Optional[Dict[str, Tuple[int, int, float]]] = None
+        self._lock = threading.Lock()
+
+    def load_index(self) -> None:
+        """Scan record headers and keys only — values stay undecoded in the mapping."""
+        with self._lock:
+            if self._index is not None:
+                return
+            index = {}
+            offset, size = _HEADER.size, len(self._mm)
+            for _ in range(self.count):
+                start = offset + _RECORD.size
+                if start > size:
+                    break
+                klen, vlen, expires = _RECORD.unpack_from(self._mm, offset)
+                if start + klen + vlen > size:
+                    break
+                try:
+                    key = self._mm[start:start + klen].decode()
+                except UnicodeDecodeError:
+                    break
+                index[key] = (start + klen, vlen, expires)
+                offset = start + klen + vlen
+            if len(index) < self.count:
+                logger.warning("Memory snapshot %s is damaged: kept %d of %d records", self.path, len(index), self.count)
+                metrics.incr("snapshot.damaged")
+            self._index = index
+
+    def take(self, key: str):
+        """(value, ttl seconds left) once per key, or None.  Histories come back as (role, content) lists."""
+        self.load_index()
+        rec = self._index.pop(key, None)
+        if rec is None:
+            return None
+        offset, vlen, expires = rec
+        ttl = expires - time.time()
+        if ttl <= 0:
+            return None
+        try:
+            value = _decode(key, self._mm[offset:offset + vlen])
+        except Exception as e:
+            logger.warning("Skipping unreadable snapshot record %s: %s", key, type(e).__name__)
+            return None
+        metrics.incr("snapshot.restored")
+        return value, ttl
+
+    def discard(self, key: str) -> None:
+        self.load_index()
+        self._index.pop(key, None)
+
+    def pending(self) -> Iterator[Tuple[str, bytes, float]]:
+        """Records never taken, still raw, for carrying into the next snapshot."""
+        self.load_index()
+        now = time.time()
+        for key, (offset, vlen, expires) in self._index.items():
+            if expires > now:
+                yield key, self._mm[offset:offset + vlen], expires
+
+    def __len__(self) -> int:
+        self.load_index()
+        return len(self._index)
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+def save(backend, path: str) -> int:
+    """Write the backend's live entries (plus untouched restored ones) atomically; returns the count."""
+    t0 = time.perf_counter()
+    today = bangkok_day()
+    now_wall, now_mono = time.time(), time.monotonic()
+    tmp = f"{path}.tmp"
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    count = 0
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, now_wall, 0))
+
+        def write(key: str, raw: bytes, expires: float) -> None:
+            nonlocal count
+            k = key.encode()
+            f.write(_RECORD.pack(len(k), len(raw), expires))
+            f.write(k)
+            f.write(raw)
+            count += 1
+
+        for key, entry in backend.entries():
+            if entry.expires <= now_mono or (key.startswith("usage:") and not key.startswith(f"usage:{today}:")):
+                continue
+            write(key, _encode(key, entry.value), now_wall + (entry.expires - now_mono))
+        if backend.snapshot is not None:
+            for key, raw, expires in backend.snapshot.pending():
+                if not key.startswith("usage:") or key.startswith(f"usage:{today}:"):
+                    write(key, bytes(raw), expires)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, now_wall, count))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    metrics.gauge("snapshot.entries", count)
+    metrics.gauge("snapshot.bytes", os.path.getsize(path))
+    metrics.observe("snapshot.save_ms", (time.perf_counter() - t0) * 1000)
+    return count
+
+
+def open_snapshot(path: str) -> Optional[SnapshotReader]:
+    """Reader for `path`, or None when there is no usable snapshot."""
+    if not os.path.exists(path):
+        return None
+    try:
+        return SnapshotReader(path)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring memory snapshot: %s", e)
+        return None
@@ -0,0 +1,378 @@
+"""
+SQLite (WAL) backend for single-node deployments without Redis — STORE_BACKEND=sqlite.
+
+Same async interface as ConversationStore, but history, flow state and usage counters
+survive restarts:
+
+  - Every write goes through one writer task.  It drains whatever is queued and commits
+    it as a single transaction (group commit), each op in its own SAVEPOINT so one
+    failure does not sink the batch.  Callers await their own op, so a read issued
+    after a write sees it.  The blocking sqlite calls run on a dedicated thread that
+    owns the write connection.
+  - Reads use a second connection; WAL lets them proceed while the writer commits.
+    They run on a reader thread of their own, so a slow disk stalls the caller, not
+    the event loop.  If the writer task dies, every op still queued fails with
+    WriterStopped instead of leaving its caller waiting; the next write starts a new one.
+  - TTLs mirror the Redis keyspace (conversation 24h after its last message, flows
+    1800s, the summary 24h after its last fold); a day's usage row (messages and
+    tokens) is kept for SPEND_TTL.  Expired rows are ignored when read and deleted by a
+    sweep the writer runs every SWEEP_INTERVAL seconds.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.memory.codec import Codec
+from app.memory.local import CONV_TTL, FLOW_TTL
+from app.memory.quota import SPEND_TTL, admits, bangkok_day, blocked_by, limit_arg
+from app.memory.store import Session
+from app.memory.summary import SUMMARY, SUMMARY_TTL, dropped_prefix
+from app.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SWEEP_INTERVAL = 300.0
+_BATCH_MAX = 256
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id      INTEGER PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    ts      REAL NOT NULL,
+    role    TEXT NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_user_ts ON messages (user_id, ts);
+CREATE TABLE IF NOT EXISTS flows (
+    user_id TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    state   BLOB NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (user_id, kind)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS flows_expires ON flows (expires);
+CREATE TABLE IF NOT EXISTS usage (
+    day     TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    count   INTEGER NOT NULL,
+    tokens  INTEGER NOT NULL DEFAULT 0,
+    expires REAL NOT NULL,
+    PRIMARY KEY (day, user_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS usage_expires ON usage (expires);
+"""
+
+# Constant SQL text so sqlite3's per-connection statement cache reuses the prepared statements
+_SELECT_HISTORY = "SELECT role, content, ts FROM messages WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT ?"
+_DROP_EXPIRED_CONV = "DELETE FROM messages WHERE user_id = ? AND (SELECT MAX(ts) FROM messages WHERE user_id = ?) < ?"
+_INSERT_MESSAGE = "INSERT INTO messages (user_id, ts, role, content) VALUES (?, ?, ?, ?)"
+_TRIM_HISTORY = (
+    "DELETE FROM messages WHERE user_id = ? AND id IN "
+    "(SELECT id FROM messages WHERE user_id = ? ORDER BY ts DESC, id DESC LIMIT -1 OFFSET ?)"
+)
+_DELETE_HISTORY = "DELETE FROM messages WHERE user_id = ?"
+_SELECT_OLDEST = "SELECT role, content FROM messages WHERE user_id = ? ORDER BY ts, id LIMIT ?"
+_DROP_OLDEST = (
+    "DELETE FROM messages WHERE user_id = ? AND id IN "
+    "(SELECT id FROM messages WHERE user_id = ? ORDER BY ts, id LIMIT ?)"
+)
+_SELECT_FLOW = "SELECT state FROM flows WHERE user_id = ? AND kind = ? AND expires > ?"
+_UPSERT_FLOW = (
+    "INSERT INTO flows (user_id, kind, state, expires) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (user_id, kind) DO UPDATE SET state = excluded.state, expires = excluded.expires"
+)
+_DELETE_FLOW = "DELETE FROM flows WHERE user_id = ? AND kind = ?"
+_SELECT_USAGE = "SELECT count, tokens FROM usage WHERE day = ? AND user_id = ? AND expires > ?"
+_INCR_USAGE = (
+    "INSERT INTO usage (day, user_id, count, expires) VALUES (?, ?, 1, ?) "
+    "ON CONFLICT (day, user_id) DO UPDATE SET count = count + 1 RETURNING count"
+)
+_CHARGE_TOKENS = (
+    "INSERT INTO usage (day, user_id, count, tokens, expires) VALUES (?, ?, 0, ?, ?) "
+    "ON CONFLICT (day, user_id) DO UPDATE SET tokens = tokens + excluded.tokens RETURNING tokens"
+)
+_SWEEP = (
+    "DELETE FROM flows WHERE expires <= ?",
+    "DELETE FROM usage WHERE expires <= ?",
+    "DELETE FROM messages WHERE user_id IN (SELECT user_id FROM messages GROUP BY user_id HAVING MAX(ts) < ?)",
+)
+
+
+class WriterStopped(RuntimeError):
+    """The writer task ended before running the op."""
+
+
+def _execute(conn: sqlite3.Connection, sql: str, params: tuple) -> None:
+    conn.execute(sql, params)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=64)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL: durable across process crashes, fsync at checkpoints
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+class SqliteStore:
+    def __init__(self, path: str, max_history: int = 10, codec: Optional[Codec] = None):
+        self._path = path
+        self._max_history = max_history
+        self._codec = codec or Codec()
+        if path != ":memory:" and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._wconn = self._executor.submit(self._open_writer).result()
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-reader")
+        self._rconn = self._reader.submit(_connect, path).result()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+
+    def _open_writer(self) -> sqlite3.Connection:
+        conn = _connect(self._path)
+        conn.executescript(_SCHEMA)
+        if "tokens" not in {row[1] for row in conn.execute("PRAGMA table_info(usage)")}:
+            conn.execute("ALTER TABLE usage ADD COLUMN tokens INTEGER NOT NULL DEFAULT 0")
+        return conn
+
+    # ── writer ──────────────────────────────────────────────────────────────
+
+    async def _read(self, op: Callable, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._reader, op, self._rconn, *args)
+
+    async def _submit(self, op: Callable, *args):
+        if self._writer is None or self._writer.done():
+            self._fail_queued(WriterStopped("SQLite writer stopped"))
+            self._queue = asyncio.Queue()
+            self._writer = asyncio.get_running_loop().create_task(self._write_loop())
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((op, args, fut))
+        return await fut
+
+    def _fail_queued(self, error: Exception, batch=()) -> None:
+        pending = list(batch)
+        while self._queue is not None and not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        for item in pending:
+            if item is not None and item[2] is not None and not item[2].done():
+                item[2].set_exception(error)
+
+    async def _write_loop(self) -> None:
+        batch = []
+        try:
+            await self._drain(batch)
+        except BaseException as e:
+            logger.error("SQLite writer stopped: %s", type(e).__name__)
+            self._fail_queued(WriterStopped(f"SQLite writer stopped: {type(e).__name__}"), batch)
+            raise
+
+    async def _drain(self, batch: list) -> None:
+        """Writer loop; `batch` holds the ops in flight, for _write_loop to fail if this dies."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch.clear()
+            try:
+                timeout = max(0.0, self._next_sweep - time.monotonic())
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                pass
+            while len(batch) < _BATCH_MAX and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stop = any(item is None for item in batch)
+            batch[:] = [item for item in batch if item is not None]
+            if time.monotonic() >= self._next_sweep:
+                self._next_sweep = time.monotonic() + SWEEP_INTERVAL
+                batch.append((self._sweep, (), None))
+            if batch:
+                results = await loop.run_in_executor(self._executor, self._run_batch, batch)
+                for (_, _, fut), (ok, value) in zip(batch, results):
+                    if fut is None or fut.done():
+                        continue
+                    if ok:
+                        fut.set_result(value)
+                    else:
+                        fut.set_exception(value)
+            if stop:
+                return
+
+    def _run_batch(self, batch) -> list:
+        """Writer thread: one transaction per batch, one SAVEPOINT per op."""
+        conn = self._wconn
+        t0 = time.perf_counter()
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op, args, _ in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((True, op(conn, *args)))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((False, e))
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning("SQLite batch failed: %s", e)
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            return [(False, e)] * len(batch)
+        metrics.observe("sqlite.batch_size", len(batch))
+        metrics.observe("sqlite.commit_ms", (time.perf_counter() - t0) * 1000)
+        return results
+
+    def _sweep(self, conn: sqlite3.Connection) -> None:
+        now = time.time()
+        flows, usage, convs = _SWEEP
+        removed = conn.execute(flows, (now,)).rowcount + conn.execute(usage, (now,)).rowcount
+        removed += conn.execute(convs, (now - CONV_TTL,)).rowcount
+        metrics.incr("sqlite.swept_rows", removed)
+
+    async def close(self) -> None:
+        if self._writer is not None and not self._writer.done():
+            self._queue.put_nowait(None)
+            await self._writer
+        self._writer = None
+        self._reader.submit(self._rconn.close).result()
+        self._reader.shutdown()
+        self._executor.submit(self._wconn.close).result()
+        self._executor.shutdown()
+
+    # ── ops run on the writer (or, for reads, the reader) thread ────────────
+
+    def _history(self, conn: sqlite3.Connection, user_id: str) -> List[Dict[str, str]]:
+        rows = conn.execute(_SELECT_HISTORY, (user_id, self._max_history)).fetchall()
+        if not rows or rows[0][2] < time.time() - CONV_TTL:
+            return []
+        return [{"role": role, "content": content} for role, content, _ in reversed(rows)]
+
+    def _flow(self, conn: sqlite3.Connection, user_id: str, kind: str) -> Optional[dict]:
+        row = conn.execute(_SELECT_FLOW, (user_id, kind, time.time())).fetchone()
+        return self._codec.decode(row[0]) if row else None
+
+    def _usage(self, conn: sqlite3.Connection, day: str, user_id: str) -> Tuple[int, int]:
+        """(messages, tokens) for the day."""
+        row = conn.execute(_SELECT_USAGE, (day, user_id, time.time())).fetchone()
+        return (row[0], row[1]) if row else (0, 0)
+
+    def _spend(self, conn: sqlite3.Connection, days: List[str], user_id: str) -> Dict[str, int]:
+        spend = {d: self._usage(conn, d, user_id)[1] for d in days}
+        return {d: v for d, v in spend.items() if v}
+
+    def _add(self, conn: sqlite3.Connection, user_id: str, role: str, content: str) -> None:
+        now = time.time()
+        conn.execute(_DROP_EXPIRED_CONV, (user_id, user_id, now - CONV_TTL))
+        conn.execute(_INSERT_MESSAGE, (user_id, now, role, content))
+        conn.execute(_TRIM_HISTORY, (user_id, user_id, self._max_history))
+
+    def _clear(self, conn: sqlite3.Connection, user_id: str) -> None:
+        conn.execute(_DELETE_HISTORY, (user_id,))
+        conn.execute(_DELETE_FLOW, (user_id, SUMMARY))
+
+    def _fold(self, conn: sqlite3.Connection, user_id: str, expected: Optional[dict], summary: dict,
+              folded: List[Dict[str, str]]) -> Optional[int]:
+        if self._flow(conn, user_id, SUMMARY) != expected:
+            return None
+        oldest = conn.execute(_SELECT_OLDEST, (user_id, len(folded))).fetchall()
+        n = dropped_prefix(oldest, [(m["role"], m["content"]) for m in folded])
+        if n:
+            conn.execute(_DROP_OLDEST, (user_id, user_id, n))
+            conn.execute(_UPSERT_FLOW, (user_id, SUMMARY, self._codec.encode(summary), time.time() + SUMMARY_TTL))
+        return n
+
+    def _incr(self, conn: sqlite3.Connection, day: str, user_id: str) -> int:
+        return conn.execute(_INCR_USAGE, (day, user_id, time.time() + SPEND_TTL)).fetchone()[0]
+
+    def _charge(self, conn: sqlite3.Connection, day: str, user_id: str, tokens: int) -> int:
+        return conn.execute(_CHARGE_TOKENS, (day, user_id, tokens, time.time() + SPEND_TTL)).fetchone()[0]
+
+    def _session(
+        self, conn: sqlite3.Connection, day: str, user_id: str, limit: int, tok_limit: int, admitted: bool
+    ) -> Session:
+        usage, tokens = self._usage(conn, day, user_id)
+        allowed = admitted or admits(usage, tokens, limit, tok_limit)
+        if allowed and not admitted:
+            usage = self._incr(conn, day, user_id)
+        return Session(
+            usage=usage,
+            allowed=allowed,
+            tokens=tokens,
+            blocked_by=None if allowed else blocked_by(usage, limit),
+            quote_flow=self._flow(conn, user_id, "qflow"),
+            lead_flow=self._flow(conn, user_id, "lflow"),
+            history=self._history(conn, user_id),
+            summary=self._flow(conn, user_id, SUMMARY),
+        )
+
+    # ── ConversationStore interface ─────────────────────────────────────────
+
+    async def add_message(self, user_id: str, role: str, content: str) -> None:
+        await self._submit(self._add, user_id, role, content)
+
+    async def get_history(self, user_id: str) -> List[Dict[str, str]]:
+        return await self._read(self._history, user_id)
+
+    async def clear(self, user_id: str) -> None:
+        await self._submit(self._clear, user_id)
+
+    async def get_summary(self, user_id: str) -> Optional[dict]:
+        return await self._read(self._flow, user_id, SUMMARY)
+
+    async def fold_history(
+        self, user_id: str, expected: Optional[dict], summary: dict, folded: List[Dict[str, str]]
+    ) -> Optional[int]:
+        return await self._submit(self._fold, user_id, expected, summary, folded)
+
+    async def get_daily_usage(self, user_id: str) -> int:
+        return (await self._read(self._usage, bangkok_day(), user_id))[0]
+
+    async def increment_daily_usage(self, user_id: str) -> int:
+        return await self._submit(self._incr, bangkok_day(), user_id)
+
+    async def record_tokens(self, user_id: str, tokens: int) -> int:
+        return await self._submit(self._charge, bangkok_day(), user_id, tokens)
+
+    async def get_spend(self, user_id: str, days: int = 7) -> Dict[str, int]:
+        return await self._read(self._spend, [bangkok_day(i) for i in range(days)], user_id)
+
+    async def _set_flow(self, kind: str, user_id: str, state: dict) -> None:
+        row = (user_id, kind, self._codec.encode(state), time.time() + FLOW_TTL)
+        await self._submit(_execute, _UPSERT_FLOW, row)
+
+    async def _clear_flow(self, kind: str, user_id: str) -> None:
+        await self._submit(_execute, _DELETE_FLOW, (user_id, kind))
+
+    async def get_quote_flow(self, user_id: str) -> Optional[dict]:
+        return await self._read(self._flow, user_id, "qflow")
+
+    async def set_quote_flow(self, user_id: str, state: dict) -> None:
+        await self._set_flow("qflow", user_id, state)
+
+    async def clear_quote_flow(self, user_id: str) -> None:
+        await self._clear_flow("qflow", user_id)
+
+    async def get_lead_flow(self, user_id: str) -> Optional[dict]:
+        return await self._read(self._flow, user_id, "lflow")
+
+    async def set_lead_flow(self, user_id: str, state: dict) -> None:
+        await self._set_flow("lflow", user_id, state)
+
+    async def clear_lead_flow(self, user_id: str) -> None:
+        await self._clear_flow("lflow", user_id)
+
+    async def get_session(
+        self,
+        user_id: str,
+        daily_limit: Optional[int] = None,
+        token_limit: Optional[int] = None,
+        admitted: bool = False,
+    ) -> Session:
+        """Quota check + increment and every read in one writer transaction."""
+        return await self._submit(
+            self._session, bangkok_day(), user_id, limit_arg(daily_limit), limit_arg(token_limit), admitted
+        )
@@ -1,80 +1,259 @@
-import datetime
-import json
 import logging
-from collections import defaultdict, deque
+import uuid
+from dataclasses import dataclass, field
 from typing import Dict, List, Optional
 
+from app.memory.breaker import HALF_OPEN, CircuitBreaker
+from app.memory.codec import Codec
+from app.memory.l1 import BUMP_LUA, CHANNEL, L1Cache
+from app.memory.local import CONV_TTL, FLOW_TTL, USAGE_TTL, LocalBackend
+from app.memory.quota import CHARGE_LUA, QUOTA_LUA, SPEND_TTL, admits, bangkok_day, blocked_by, limit_arg
+from app.memory.snapshot import open_snapshot
+from app.memory.snapshot import save as save_snapshot
+from app.memory.summary import FOLD_LUA, SUMMARY, SUMMARY_TTL
+
 logger = logging.getLogger(__name__)
 
+# KEYS: usage, tokens, qflow, lflow, conv, ver, summary — ARGV: message limit, token limit (-1 = none),
+# usage TTL, cached version, already admitted (0/1).  Counts the message only when under both limits (QUOTA_LUA), then
+# returns everything the handler reads — or only {usage, tokens, allowed, version} when the
+# caller's L1 copy is already at that version.
+_SESSION_LUA = QUOTA_LUA + """
+local ver = tonumber(redis.call('GET', KEYS[6]) or '0')
+if ver == tonumber(ARGV[4]) then
+  return {usage, tokens, allowed, ver}
+end
+local conv
+if redis.call('TYPE', KEYS[5]).ok == 'string' then
+  conv = redis.call('GET', KEYS[5])  -- legacy JSON document, migrated on the next write
+else
+  conv = redis.call('LRANGE', KEYS[5], 0, -1)
+end
+-- Shortest remaining lifetime of the payload keys: L1 must not outlive a key Redis expires
+-- on its own (an expiry does not bump ver:)
+local ttl = -1
+for _, k in ipairs({KEYS[3], KEYS[4], KEYS[5], KEYS[7]}) do
+  local t = redis.call('PTTL', k)
+  if t > 0 and (ttl < 0 or t < ttl) then ttl = t end
+end
+return {usage, tokens, allowed, ver, redis.call('GET', KEYS[3]) or '', redis.call('GET', KEYS[4]) or '', conv,
+        redis.call('GET', KEYS[7]) or '', ttl}
+"""
+
+
+@dataclass
+class Session:
+    """Everything _handle_message reads about a user, fetched in one round-trip."""
+    usage: int
+    allowed: bool
+    tokens: int = 0
+    blocked_by: Optional[str] = None  # quota.MESSAGES / quota.TOKENS when not allowed
+    quote_flow: Optional[dict] = None
+    lead_flow: Optional[dict] = None
+    history: List[Dict[str, str]] = field(default_factory=list)
+    summary: Optional[dict] = None  # earlier turns folded out of history (app/core/summarizer.py)
+
 
 class ConversationStore:
     """
     Conversation history and usage store.  Uses Redis when REDIS_URL is set (24h TTL
-    per user); falls back to an in-process defaultdict when Redis is unavailable.
+    per user); falls back to a bounded in-process LocalBackend while Redis is unavailable.
+    A circuit breaker decides when to stop trying Redis and when to probe it again,
+    so a Redis restart degrades the store temporarily instead of for the process lifetime.
+
+    With the optional per-process L1 cache on (l1_users > 0, see app/memory/l1.py), every
+    Redis write also bumps a per-user version (ver:{user_id}) and publishes it, which keeps
+    the L1 copies in other processes coherent.
     """
 
-    def __init__(self, max_history: int = 10, redis_url: Optional[str] = None):
+    def __init__(
+        self,
+        max_history: int = 10,
+        redis_url: Optional[str] = None,
+        max_connections: int = 20,
+        op_timeout_ms: int = 500,
+        memory_max_entries: int = 100_000,
+        memory_max_bytes: int = 64 * 1024 * 1024,
+        l1_users: int = 0,
+        codec: Optional[Codec] = None,
+    ):
         self._max_history = max_history
         self._redis_url = redis_url
         self._redis = None
-        self._memory: Dict[str, deque] = defaultdict(lambda: deque(maxlen=max_history))
-        self._usage: Dict[str, int] = {}
-        self._quote_flows: Dict[str, dict] = {}
-        self._lead_flows: Dict[str, dict] = {}
+        self._max_connections = max_connections
+        self._op_timeout = op_timeout_ms / 1000
+        self._breaker = CircuitBreaker("redis")
+        self._local = LocalBackend(max_history, memory_max_entries, memory_max_bytes)
+        self._instance_id = uuid.uuid4().hex[:12]
+        self._l1 = L1Cache(l1_users, self._instance_id) if l1_users > 0 else None
+        self._codec = codec or Codec()
 
     async def _get_redis(self):
-        if not self._redis_url:
+        """Pooled client, or None while the breaker is open (degraded in-memory mode)."""
+        if not self._redis_url or not self._breaker.allow():
             return None
-        if self._redis is None:
-            try:
+        try:
+            if self._redis is None:
                 import redis.asyncio as aioredis  # optional dependency
-                self._redis = aioredis.from_url(self._redis_url, decode_responses=True)
+                self._redis = aioredis.from_url(
+                    self._redis_url,
+                    decode_responses=False,  # values are codec bytes (app/memory/codec.py)
+                    max_connections=self._max_connections,
+                    socket_timeout=self._op_timeout,
+                    socket_connect_timeout=self._op_timeout,
+                )
                 await self._redis.ping()
                 logger.info("Redis conversation store connected")
-            except Exception as e:
-                logger.warning("Redis unavailable, using in-memory store: %s", type(e).__name__)
-                self._redis_url = None
-                self._redis = None
+                self._breaker.record_success()
+            elif self._breaker.state == HALF_OPEN:
+                await self._redis.ping()
+                self._breaker.record_success()
+        except Exception as e:
+            logger.warning("Redis unavailable, using in-memory store: %s", type(e).__name__)
+            self._breaker.trip()
+            if self._l1:
+                self._l1.clear()
+            return None
+        if self._l1:
+            self._l1.ensure_listener(self._redis)
         return self._redis
 
+    def _redis_failed(self) -> None:
+        self._breaker.record_failure()
+        if self._l1:
+            self._l1.clear()  # a write may or may not have landed — stop trusting local copies
+
+    def _bump(self, pipe, user_id: str) -> None:
+        """Version bump + invalidation PUBLISH for other processes' L1; nothing to keep coherent without L1."""
+        if self._l1 is None:
+            return
+        pipe.eval(BUMP_LUA, 1, f"ver:{user_id}", CHANNEL, self._instance_id, user_id, CONV_TTL)
+
+    async def _write(self, r, user_id: str, field: str, update, *ops) -> None:
+        """Run (method, *args) ops plus the version bump in one MULTI, then write through L1."""
+        pipe = r.pipeline(transaction=True)
+        for op, *args in ops:
+            getattr(pipe, op)(*args)
+        self._bump(pipe, user_id)
+        results = await pipe.execute()
+        if self._l1:
+            self._l1.apply(user_id, int(results[-1]), field, update)
+
+    async def _read(self, r, user_id: str, op: str, key: str, *args):
+        """(version, value, PTTL of key): GET ver + the read in one MULTI, so L1 can be filled safely."""
+        pipe = r.pipeline(transaction=True)
+        pipe.get(f"ver:{user_id}")
+        getattr(pipe, op)(key, *args)
+        pipe.pttl(key)
+        ver, value, ttl_ms = await pipe.execute()
+        return int(ver or 0), value, ttl_ms
+
     async def add_message(self, user_id: str, role: str, content: str) -> None:
         r = await self._get_redis()
         if r:
             key = f"conv:{user_id}"
             try:
-                raw = await r.get(key)
-                messages = json.loads(raw) if raw else []
-                messages.append({"role": role, "content": content})
-                messages = messages[-self._max_history:]
-                await r.set(key, json.dumps(messages), ex=86400)
+                await self._push_message(r, user_id, key, role, content)
                 return
             except Exception as e:
+                self._redis_failed()
                 logger.warning("Redis write error, falling back to memory: %s", type(e).__name__)
-        self._memory[user_id].append({"role": role, "content": content})
+        self._local.add_message(user_id, role, content)
+
+    async def _push_message(self, r, user_id: str, key: str, role: str, content: str) -> None:
+        """RPUSH + LTRIM + EXPIRE in one MULTI round-trip — O(1) per message, no lost updates."""
+        message = {"role": role, "content": content}
+        entry = self._codec.encode(message)
+        for _ in range(2):
+            pipe = r.pipeline(transaction=True)
+            pipe.rpush(key, entry)
+            pipe.ltrim(key, -self._max_history, -1)
+            pipe.expire(key, CONV_TTL)
+            self._bump(pipe, user_id)
+            results = await pipe.execute(raise_on_error=False)
+            pushed = results[0]
+            if not isinstance(pushed, Exception):
+                if self._l1:
+                    self._l1.apply(user_id, int(results[-1]), "history",
+                                   lambda h: (h + [message])[-self._max_history:])
+                return
+            # WRONGTYPE: still a legacy JSON document — convert it and push again
+            if not await self._migrate_key(r, key):
+                raise pushed
+        raise pushed
+
+    async def _migrate_key(self, r, key: str) -> bool:
+        """Convert a legacy conv:{user_id} JSON document into a list, keeping its TTL."""
+        if await r.type(key) != b"string":
+            return False
+        raw = await r.get(key)
+        ttl = await r.ttl(key)
+        messages = self._codec.decode(raw) if raw else []
+        pipe = r.pipeline(transaction=True)
+        pipe.delete(key)
+        if messages:
+            pipe.rpush(key, *(self._codec.encode(m) for m in messages[-self._max_history:]))
+            pipe.expire(key, ttl if ttl > 0 else CONV_TTL)
+        await pipe.execute()
+        return True
+
+    async def migrate_history(self) -> int:
+        """Convert every legacy conv:* JSON key to a list; returns how many were migrated."""
+        r = await self._get_redis()
+        if not r:
+            return 0
+        migrated = 0
+        async for key in r.scan_iter(match="conv:*", count=500, _type="string"):
+            migrated += await self._migrate_key(r, key)
+        return migrated
 
     async def get_history(self, user_id: str) -> List[Dict[str, str]]:
         r = await self._get_redis()
         if r:
             key = f"conv:{user_id}"
+            if self._l1:
+                hit, history = self._l1.get(user_id, "history")
+                if hit:
+                    return list(history)
             try:
-                raw = await r.get(key)
-                return json.loads(raw) if raw else []
+                return await self._read_history(r, user_id, key)
             except Exception as e:
+                self._redis_failed()
                 logger.warning("Redis read error, falling back to memory: %s", type(e).__name__)
-        return list(self._memory[user_id])
+        return self._local.get_history(user_id)
+
+    async def _read_history(self, r, user_id: str, key: str) -> List[Dict[str, str]]:
+        import redis.exceptions
+
+        try:
+            ver, raw, ttl_ms = await self._read(r, user_id, "lrange", key, 0, -1)
+        except redis.exceptions.ResponseError:
+            if not await self._migrate_key(r, key):
+                raise
+            ver, raw, ttl_ms = await self._read(r, user_id, "lrange", key, 0, -1)
+        history = [self._codec.decode(m) for m in raw]
+        if self._l1:
+            self._l1.fill(user_id, ver, ttl_ms, history=history)
+        return history
 
     async def clear(self, user_id: str) -> None:
         r = await self._get_redis()
         if r:
             try:
-                await r.delete(f"conv:{user_id}")
+                pipe = r.pipeline(transaction=True)
+                pipe.delete(f"conv:{user_id}", f"summary:{user_id}")
+                self._bump(pipe, user_id)
+                results = await pipe.execute()
+                if self._l1:
+                    self._l1.invalidate(user_id, int(results[-1]))
                 return
             except Exception as e:
+                self._redis_failed()
                 logger.warning("Redis delete error: %s", type(e).__name__)
-        self._memory[user_id].clear()
+        self._local.clear(user_id)
 
     async def get_daily_usage(self, user_id: str) -> int:
-        today = datetime.date.today().isoformat()
+        today = bangkok_day()
         r = await self._get_redis()
         if r:
             key = f"usage:{today}:{user_id}"
@@ -82,93 +261,298 @@ class ConversationStore:
                 val = await r.get(key)
                 return int(val) if val else 0
             except Exception as e:
+                self._redis_failed()
                 logger.warning("Redis usage read error: %s", type(e).__name__)
-        return self._usage.get(f"{today}:{user_id}", 0)
+        return self._local.get_usage(today, user_id)
 
     async def get_quote_flow(self, user_id: str) -> Optional[dict]:
         r = await self._get_redis()
         if r:
             try:
-                raw = await r.get(f"qflow:{user_id}")
-                return json.loads(raw) if raw else None
+                return await self._get_flow(r, user_id, "qflow", "quote_flow")
             except Exception:
-                pass
-        return self._quote_flows.get(user_id)
+                self._redis_failed()
+        return self._local.get_flow("qflow", user_id)
+
+    async def _get_flow(self, r, user_id: str, kind: str, field: str) -> Optional[dict]:
+        # L1 keeps the encoded value, so callers mutating the returned dict never touch the cache
+        if self._l1:
+            hit, raw = self._l1.get(user_id, field)
+            if hit:
+                return self._codec.decode(raw) if raw else None
+        ver, raw, ttl_ms = await self._read(r, user_id, "get", f"{kind}:{user_id}")
+        if self._l1:
+            self._l1.fill(user_id, ver, ttl_ms, **{field: raw or b""})
+        return self._codec.decode(raw) if raw else None
 
     async def set_quote_flow(self, user_id: str, state: dict) -> None:
         r = await self._get_redis()
         if r:
             try:
-                await r.set(f"qflow:{user_id}", json.dumps(state), ex=1800)
+                raw = self._codec.encode(state)
+                await self._write(r, user_id, "quote_flow", lambda _: raw, ("set", f"qflow:{user_id}", raw, FLOW_TTL))
                 return
             except Exception:
-                pass
-        self._quote_flows[user_id] = state
+                self._redis_failed()
+        self._local.set_flow("qflow", user_id, state)
 
     async def get_lead_flow(self, user_id: str) -> Optional[dict]:
         r = await self._get_redis()
         if r:
             try:
-                raw = await r.get(f"lflow:{user_id}")
-                return json.loads(raw) if raw else None
+                return await self._get_flow(r, user_id, "lflow", "lead_flow")
             except Exception:
-                pass
-        return self._lead_flows.get(user_id)
+                self._redis_failed()
+        return self._local.get_flow("lflow", user_id)
 
     async def set_lead_flow(self, user_id: str, state: dict) -> None:
         r = await self._get_redis()
         if r:
             try:
-                await r.set(f"lflow:{user_id}", json.dumps(state), ex=1800)
+                raw = self._codec.encode(state)
+                await self._write(r, user_id, "lead_flow", lambda _: raw, ("set", f"lflow:{user_id}", raw, FLOW_TTL))
                 return
             except Exception:
-                pass
-        self._lead_flows[user_id] = state
+                self._redis_failed()
+        self._local.set_flow("lflow", user_id, state)
 
     async def clear_lead_flow(self, user_id: str) -> None:
         r = await self._get_redis()
         if r:
             try:
-                await r.delete(f"lflow:{user_id}")
+                await self._write(r, user_id, "lead_flow", lambda _: b"", ("delete", f"lflow:{user_id}"))
                 return
             except Exception:
-                pass
-        self._lead_flows.pop(user_id, None)
+                self._redis_failed()
+        self._local.clear_flow("lflow", user_id)
 
     async def clear_quote_flow(self, user_id: str) -> None:
         r = await self._get_redis()
         if r:
             try:
-                await r.delete(f"qflow:{user_id}")
+                await self._write(r, user_id, "quote_flow", lambda _: b"", ("delete", f"qflow:{user_id}"))
                 return
             except Exception:
-                pass
-        self._quote_flows.pop(user_id, None)
+                self._redis_failed()
+        self._local.clear_flow("qflow", user_id)
+
+    async def get_summary(self, user_id: str) -> Optional[dict]:
+        r = await self._get_redis()
+        if r:
+            try:
+                return await self._get_flow(r, user_id, SUMMARY, "summary")
+            except Exception:
+                self._redis_failed()
+        return self._local.get_flow(SUMMARY, user_id)
+
+    async def fold_history(
+        self, user_id: str, expected: Optional[dict], summary: dict, folded: List[Dict[str, str]]
+    ) -> Optional[int]:
+        """
+        Replace the summary and drop the `folded` messages from the head of the history,
+        in one write and only if the stored summary is still `expected` (see
+        app/memory/summary.py).  Returns how many messages were dropped (0: none was
+        left at the head, nothing written), or None when the summary changed meanwhile.
+        """
+        r = await self._get_redis()
+        if r:
+            try:
+                # FOLD_LUA compares bytes: match by decoded value and hand it the stored bytes,
+                # since legacy json or another codec never re-encodes to the same value
+                pipe = r.pipeline(transaction=True)
+                pipe.get(f"summary:{user_id}")
+                pipe.lrange(f"conv:{user_id}", 0, len(folded) - 1)
+                current, head = await pipe.execute()
+                if (self._codec.decode(current) if current else None) != expected:
+                    return None
+                stored = {}
+                for raw in head:
+                    m = self._codec.decode(raw)
+                    stored.setdefault((m["role"], m["content"]), raw)
+                entries = [
+                    stored.get((m["role"], m["content"])) or self._codec.encode({"role": m["role"], "content": m["content"]})
+                    for m in folded
+                ]
+                pipe = r.pipeline(transaction=True)
+                pipe.eval(
+                    FOLD_LUA, 2, f"summary:{user_id}", f"conv:{user_id}",
+                    current or b"", self._codec.encode(summary), SUMMARY_TTL, *entries,
+                )
+                self._bump(pipe, user_id)
+                dropped, *ver = await pipe.execute()
+                if self._l1:
+                    self._l1.invalidate(user_id, int(ver[0]))  # two fields changed: refill on the next read
+                return None if dropped < 0 else dropped
+            except Exception as e:
+                self._redis_failed()
+                logger.warning("Redis summary write error, falling back to memory: %s", type(e).__name__)
+        if self._local.get_flow(SUMMARY, user_id) != expected:
+            return None
+        dropped = self._local.drop_oldest(user_id, folded)
+        if dropped:
+            self._local.set_flow(SUMMARY, user_id, summary, ttl=SUMMARY_TTL)
+        return dropped
+
+    async def get_session(
+        self,
+        user_id: str,
+        daily_limit: Optional[int] = None,
+        token_limit: Optional[int] = None,
+        admitted: bool = False,
+    ) -> Session:
+        """
+        Quota, both flow states, summary and history in one Redis call.  The message is counted
+        against today's usage atomically, and only if the user is under daily_limit
+        messages and token_limit tokens (see app/memory/quota.py).  admitted: the message
+        was counted by an earlier attempt, so it is let through without counting it again.
+        """
+        today = bangkok_day()
+        limit, tok_limit = limit_arg(daily_limit), limit_arg(token_limit)
+        r = await self._get_redis()
+        if r:
+            keys = (f"usage:{today}:{user_id}", f"tokens:{today}:{user_id}", f"qflow:{user_id}",
+                    f"lflow:{user_id}", f"conv:{user_id}", f"ver:{user_id}", f"summary:{user_id}")
+            cached = self._l1.session_version(user_id) if self._l1 else -1
+            try:
+                usage, tokens, allowed, ver, *payload = await r.eval(
+                    _SESSION_LUA, 7, *keys, limit, tok_limit, USAGE_TTL, cached, int(admitted)
+                )
+                usage, tokens, allowed = int(usage), int(tokens), bool(allowed)
+                blocked = None if allowed else blocked_by(usage, limit)
+                if payload:
+                    qflow, lflow, conv, summary, ttl_ms = payload
+                    history = ([self._codec.decode(m) for m in conv] if isinstance(conv, list)
+                               else self._codec.decode(conv) if conv else [])
+                    if self._l1:
+                        self._l1.fill(user_id, int(ver), int(ttl_ms), history=list(history), quote_flow=qflow,
+                                      lead_flow=lflow, summary=summary)
+                else:
+                    # Redis only counted the message: the L1 copy is current
+                    cached_values = self._l1.values(user_id, int(ver))
+                    if cached_values is None:  # invalidated while the call was in flight
+                        qflow, lflow, summary = await r.mget(keys[2], keys[3], keys[6])
+                        history = await self._read_history(r, user_id, keys[4])
+                    else:
+                        history = list(cached_values["history"])
+                        qflow, lflow = cached_values["quote_flow"], cached_values["lead_flow"]
+                        summary = cached_values["summary"]
+                return Session(
+                    usage=usage,
+                    allowed=allowed,
+                    tokens=tokens,
+                    blocked_by=blocked,
+                    quote_flow=self._codec.decode(qflow) if qflow else None,
+                    lead_flow=self._codec.decode(lflow) if lflow else None,
+                    history=history,
+                    summary=self._codec.decode(summary) if summary else None,
+                )
+            except Exception as e:
+                self._redis_failed()
+                logger.warning("Redis session read error: %s", type(e).__name__)
+        usage = self._local.get_usage(today, user_id)
+        tokens = self._local.get_usage(today, user_id, kind="tokens")
+        allowed = admitted or admits(usage, tokens, limit, tok_limit)
+        if allowed and not admitted:
+            usage = self._local.incr_usage(today, user_id)
+        return Session(
+            usage=usage,
+            allowed=allowed,
+            tokens=tokens,
+            blocked_by=None if allowed else blocked_by(usage, limit),
+            quote_flow=self._local.get_flow("qflow", user_id),
+            lead_flow=self._local.get_flow("lflow", user_id),
+            history=self._local.get_history(user_id),
+            summary=self._local.get_flow(SUMMARY, user_id),
+        )
+
+    async def record_tokens(self, user_id: str, tokens: int) -> int:
+        """Charge a completion's usage.total_tokens to today's token budget; returns the day's total."""
+        key = f"tokens:{bangkok_day()}:{user_id}"
+        r = await self._get_redis()
+        if r:
+            try:
+                return int(await r.eval(CHARGE_LUA, 1, key, tokens, SPEND_TTL))
+            except Exception as e:
+                self._redis_failed()
+                logger.warning("Redis token charge error: %s", type(e).__name__)
+        return self._local.incr_usage(bangkok_day(), user_id, tokens, kind="tokens", ttl=SPEND_TTL)
+
+    async def get_spend(self, user_id: str, days: int = 7) -> Dict[str, int]:
+        """Tokens charged per Bangkok day over the last `days` days (newest first, days with usage only)."""
+        day_keys = [bangkok_day(i) for i in range(days)]
+        r = await self._get_redis()
+        if r:
+            try:
+                values = await r.mget([f"tokens:{d}:{user_id}" for d in day_keys])
+                return {d: int(v) for d, v in zip(day_keys, values) if v}
+            except Exception as e:
+                self._redis_failed()
+                logger.warning("Redis spend read error: %s", type(e).__name__)
+        spend = {d: self._local.get_usage(d, user_id, kind="tokens") for d in day_keys}
+        return {d: v for d, v in spend.items() if v}
+
+    def restore_snapshot(self, path: str):
+        """Attach the previous process's snapshot to the in-memory backend (read lazily)."""
+        reader = open_snapshot(path)
+        if reader is not None:
+            self._local.attach_snapshot(reader)
+            logger.info("Memory snapshot attached: %s (%d entries)", path, reader.count)
+        return reader
+
+    def save_snapshot(self, path: str) -> int:
+        return save_snapshot(self._local, path)
+
+    async def close(self) -> None:
+        if self._l1:
+            await self._l1.close()
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
 
     async def increment_daily_usage(self, user_id: str) -> int:
-        today = datetime.date.today().isoformat()
+        today = bangkok_day()
         r = await self._get_redis()
         if r:
             key = f"usage:{today}:{user_id}"
             try:
                 count = await r.incr(key)
                 if count == 1:
-                    await r.expire(key, 90000)  # 25h so it safely spans a midnight rollover
+                    await r.expire(key, USAGE_TTL)
                 return count
             except Exception as e:
+                self._redis_failed()
                 logger.warning("Redis usage write error: %s", type(e).__name__)
-        mem_key = f"{today}:{user_id}"
-        self._usage[mem_key] = self._usage.get(mem_key, 0) + 1
-        return self._usage[mem_key]
+        return self._local.incr_usage(today, user_id)
 
 
 _store: Optional[ConversationStore] = None
 
 
+def redis_health() -> Optional[dict]:
+    """Breaker snapshot for /health; None when no store exists yet or Redis is not configured."""
+    if not isinstance(_store, ConversationStore) or not _store._redis_url:
+        return None
+    return _store._breaker.snapshot()
+
+
 def get_store() -> ConversationStore:
     global _store
     if _store is None:
         from app.config import get_settings
         s = get_settings()
-        _store = ConversationStore(max_history=s.max_history_messages, redis_url=s.redis_url)
+        codec = Codec(s.store_codec, s.store_compress_min_bytes)
+        if s.store_backend == "sqlite":
+            from app.memory.sqlite import SqliteStore
+            _store = SqliteStore(s.sqlite_path, max_history=s.max_history_messages, codec=codec)
+            return _store
+        _store = ConversationStore(
+            max_history=s.max_history_messages,
+            redis_url=s.redis_url,
+            max_connections=s.redis_max_connections,
+            op_timeout_ms=s.redis_op_timeout_ms,
+            memory_max_entries=s.memory_max_entries,
+            memory_max_bytes=s.memory_max_bytes,
+            l1_users=s.l1_cache_users,
+            codec=codec,
+        )
     return _store
@@ -0,0 +1,51 @@
+"""
+Per-user conversation summary (summary:{user_id}), shared by the store backends.
+
+The summarizer (app/core/summarizer.py) folds the oldest history messages into the
+summary and then drops them from the history.  Both happen in one write, and only if
+the summary is still the one it started from.  That way two processes folding the same
+conversation cannot overwrite each other.  Messages pushed meanwhile are appended at
+the tail and never touched.  Folded messages that the history window has already
+trimmed are skipped.  When none of them is left at the head, nothing is written, so
+the same messages are never folded into the summary twice.  The summary lives as long
+as the conversation (CONV_TTL).
+"""
+from typing import Sequence
+
+from app.memory.local import CONV_TTL
+
+SUMMARY = "summary"
+SUMMARY_TTL = CONV_TTL
+
+# KEYS: summary, conv — ARGV: expected summary ('' = none), new summary, ttl, folded entries
+# oldest first, all as stored.  Returns how many messages were dropped from the head (the
+# summary is only replaced when that is > 0), or -1 when the summary changed since it was
+# read (nothing written).  Same rule as dropped_prefix.
+FOLD_LUA = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then return -1 end
+local i = 4
+local head = redis.call('LINDEX', KEYS[2], 0)
+while head and i <= #ARGV and ARGV[i] ~= head do i = i + 1 end
+local dropped = 0
+while head and i <= #ARGV and ARGV[i] == head do
+  redis.call('LPOP', KEYS[2])
+  dropped = dropped + 1
+  i = i + 1
+  head = redis.call('LINDEX', KEYS[2], 0)
+end
+if dropped > 0 then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return dropped
+"""
+
+
+def dropped_prefix(history: Sequence, folded: Sequence) -> int:
+    """How many of the oldest `history` entries are (a contiguous run of) the `folded` ones."""
+    if not history or history[0] not in folded:
+        return 0
+    start = list(folded).index(history[0])
+    n = 0
+    while n < len(history) and start + n < len(folded) and history[n] == folded[start + n]:
+        n += 1
+    return n
@@ -0,0 +1,90 @@
+"""
+In-process metrics registry — counters, gauges and latency summaries.
+
+Modules record with `metrics.incr / gauge / observe`; the snapshot is served as JSON on
+GET /metrics.  Summaries keep a bounded reservoir of recent samples for percentiles.
+"""
+import threading
+from collections import deque
+from typing import Deque, Dict
+
+_RESERVOIR = 1024
+
+
+class _Summary:
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=_RESERVOIR)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def to_dict(self) -> dict:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))], 2) if ordered else 0.0
+
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 2) if self.count else 0.0,
+            "p50": pct(0.5),
+            "p95": pct(0.95),
+            "max": round(self.max, 2),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()  # Sheets logging records from worker threads
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._summaries: Dict[str, _Summary] = {}
+
+    def incr(self, name: str, value: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            summary = self._summaries.get(name)
+            if summary is None:
+                summary = self._summaries[name] = _Summary()
+            summary.add(value)
+
+    def counter(self, name: str) -> float:
+        return self._counters.get(name, 0)
+
+    def summary(self, name: str) -> dict:
+        with self._lock:
+            s = self._summaries.get(name)
+            return s.to_dict() if s else _Summary().to_dict()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": {k: v.to_dict() for k, v in self._summaries.items()},
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._summaries.clear()
+
+
+metrics = Metrics()
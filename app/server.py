@@ -0,0 +1,6 @@
+"""Gunicorn worker class for gunicorn.conf.py: uvicorn pinned to uvloop and httptools."""
+from uvicorn_worker import UvicornWorker as _UvicornWorker
+
+
+class UvicornWorker(_UvicornWorker):
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "lifespan": "on"}
@@ -35,9 +35,10 @@ async def start_lead_flow(user_id: str, store) -> LeadReply:
     return LeadReply(text=_COLLECT_PROMPT)
 
 
-async def handle_lead_flow(user_id: str, text: str, store) -> Optional[LeadReply]:
+async def handle_lead_flow(user_id: str, text: str, store, session=None) -> Optional[LeadReply]:
     """Returns LeadReply if user is in an active lead flow, None otherwise."""
-    state = await store.get_lead_flow(user_id)
+    # session: a ConversationStore.get_session snapshot taken for this message, if any
+    state = session.lead_flow if session is not None else await store.get_lead_flow(user_id)
     if state is None:
         return None
 
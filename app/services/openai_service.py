@@ -1,6 +1,6 @@
 import asyncio
 import logging
-from typing import List, Dict, Optional
+from typing import AsyncIterator, Dict, List, Optional
 
 from openai import AsyncOpenAI, APIError, RateLimitError, APITimeoutError
 
@@ -18,20 +18,77 @@ def get_client() -> AsyncOpenAI:
     return _client
 
 
-async def create_completion(messages: list, tools: Optional[list] = None, max_retries: int = 3):
-    """Return the raw ChatCompletion response object (with optional tool definitions)."""
-    client = get_client()
-    settings = get_settings()
+class CompletionStream:
+    """
+    Content deltas of a streamed completion.  `usage` and `finish_reason` are set once the
+    stream has been read to the end; close() stops generation early.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self.usage = None
+        self.finish_reason: Optional[str] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for chunk in self._stream:
+            if getattr(chunk, "usage", None):
+                self.usage = chunk.usage
+            for choice in chunk.choices:
+                if choice.finish_reason:
+                    self.finish_reason = choice.finish_reason
+                if choice.delta.content:
+                    yield choice.delta.content
 
-    kwargs: dict = {
-        "model": settings.openai_model,
+    async def close(self) -> None:
+        await self._stream.close()
+
+
+def _completion_kwargs(messages: list, model: Optional[str] = None) -> dict:
+    settings = get_settings()
+    kwargs = {
+        "model": model or settings.openai_model,
         "messages": messages,
         "max_tokens": settings.openai_max_tokens,
         "temperature": settings.openai_temperature,
     }
+    if settings.openai_prompt_cache_key:
+        # Routes requests sharing the static system prompt to the same cache shard
+        kwargs["prompt_cache_key"] = settings.openai_prompt_cache_key
+    return kwargs
+
+
+async def create_completion(
+    messages: list,
+    tools: Optional[list] = None,
+    max_retries: int = 3,
+    response_format: Optional[dict] = None,
+    model: Optional[str] = None,
+):
+    """
+    Return the raw ChatCompletion response object (with optional tool definitions / response
+    format).  model defaults to OPENAI_MODEL (see app/core/router.py for per-turn tiers).
+    """
+    kwargs = _completion_kwargs(messages, model)
     if tools:
         kwargs["tools"] = tools
+    if response_format:
+        kwargs["response_format"] = response_format
+    return await _create_with_retries(kwargs, max_retries)
+
 
+async def stream_completion(messages: list, max_retries: int = 3, model: Optional[str] = None) -> CompletionStream:
+    """
+    Start a streamed completion.  Retries cover opening the stream only; once deltas are
+    flowing an error surfaces from the iteration.
+    """
+    kwargs = _completion_kwargs(messages, model)
+    kwargs["stream"] = True
+    kwargs["stream_options"] = {"include_usage": True}
+    return CompletionStream(await _create_with_retries(kwargs, max_retries))
+
+
+async def _create_with_retries(kwargs: dict, max_retries: int):
+    client = get_client()
     for attempt in range(max_retries):
         try:
             return await client.chat.completions.create(**kwargs)
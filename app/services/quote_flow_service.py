@@ -124,9 +124,10 @@ async def start_quote_flow(user_id: str, store) -> FlowReply:
     )
 
 
-async def handle_quote_flow(user_id: str, text: str, store) -> Optional[FlowReply]:
+async def handle_quote_flow(user_id: str, text: str, store, session=None) -> Optional[FlowReply]:
     """Returns FlowReply if user is in an active flow, None otherwise."""
-    state = await store.get_quote_flow(user_id)
+    # session: a ConversationStore.get_session snapshot taken for this message, if any
+    state = session.quote_flow if session is not None else await store.get_quote_flow(user_id)
     if state is None:
         return None
 
@@ -18,6 +18,7 @@ LINE_LOG_SHEET = "📱 LINE Log"
 SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
 
 _log_counter = 0
+LOG_ID_TTL = 2 * 86400
 
 
 @lru_cache(maxsize=1)
@@ -35,15 +36,43 @@ def _get_client() -> Optional[gspread.Client]:
         return None
 
 
+@lru_cache(maxsize=1)
+def _get_redis():
+    """Sync client for the shared log-id counter (Sheets writes already run in a thread)."""
+    from app.config import get_settings
+    url = get_settings().redis_url
+    if not url:
+        return None
+    import redis  # optional dependency
+    return redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+
+
+def _next_log_id(now: datetime) -> str:
+    """BOT-YYYYMMDD-NNNN — numbered per day in Redis so workers never hand out the same id."""
+    global _log_counter
+    day = now.strftime("%Y%m%d")
+    r = _get_redis()
+    if r is not None:
+        try:
+            pipe = r.pipeline(transaction=False)
+            pipe.incr(f"logid:{day}")
+            pipe.expire(f"logid:{day}", LOG_ID_TTL)
+            return f"BOT-{day}-{pipe.execute()[0]:04d}"
+        except Exception as e:
+            logger.warning("Shared log id counter unavailable: %s", type(e).__name__)
+    _log_counter += 1
+    if r is not None:  # Redis down: the pid keeps ids unique across workers
+        return f"BOT-{day}-P{os.getpid()}-{_log_counter:04d}"
+    return f"BOT-{day}-{_log_counter:04d}"
+
+
 def _append_sync(user_id: str, user_text: str, bot_reply: str, response_ms: int) -> None:
     client = _get_client()
     if client is None:
         return
     try:
-        global _log_counter
-        _log_counter += 1
         now = datetime.now()
-        log_id = f"BOT-{now.strftime('%Y%m%d')}-{_log_counter:04d}"
+        log_id = _next_log_id(now)
 
         sheet = client.open_by_key(_spreadsheet_id()).worksheet(LINE_LOG_SHEET)
         sheet.append_row(
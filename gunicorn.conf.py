@@ -0,0 +1,22 @@
+"""
+Multi-process server: gunicorn master + uvicorn workers on uvloop and httptools.
+
+  gunicorn -c gunicorn.conf.py main:app
+
+WEB_CONCURRENCY sets the worker count (default 1).  With more than one worker the app
+refuses to start without REDIS_URL (main.check_deployment): history, quotas, dedup,
+rate limits, per-user locks, Sheets log ids and the scheduler lease must be shared.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '10000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+worker_class = "app.server.UvicornWorker"
+# LINE needs the ack within seconds; a worker stuck longer than this is restarted
+timeout = 30
+graceful_timeout = 20  # lifespan shutdown: drain the ingress pool, save state
+keepalive = 75  # above LINE's and typical load balancers' idle timeouts
+# Recycle workers now and then so slow leaks cannot build up; jitter avoids restarting all at once
+max_requests = 20_000
+max_requests_jitter = 2_000
+accesslog = None
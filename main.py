@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import os
 from contextlib import asynccontextmanager
@@ -59,19 +60,69 @@ _init_sentry()
 logger = logging.getLogger(__name__)
 
 
+def check_deployment(settings) -> None:
+    """Refuse to start several workers on state that would be private to each process."""
+    if settings.web_concurrency <= 1:
+        return
+    problems = []
+    if not settings.redis_url:
+        problems.append("REDIS_URL is not set — history, quotas, dedup, rate limits, user locks "
+                        "and the scheduler lease would all be per-worker")
+    if settings.memory_snapshot_path and settings.store_backend != "sqlite":
+        problems.append("MEMORY_SNAPSHOT_PATH is set — every worker would overwrite the same snapshot")
+    if problems:
+        raise RuntimeError(f"WEB_CONCURRENCY={settings.web_concurrency} needs shared state: " + "; ".join(problems))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Clawbot LINE bot starting up")
     settings = get_settings()
-    scheduler = None
+    check_deployment(settings)
+    from app.core.tokens import preload
+    # The tokenizer file may still need downloading: never on the event loop mid-request
+    await preload((settings.openai_model, settings.openai_model_light, settings.openai_model_strong))
+    from app.memory.store import get_store
+    store = get_store()
+    snapshot_path = settings.memory_snapshot_path if settings.store_backend != "sqlite" else ""
+    if snapshot_path:
+        reader = store.restore_snapshot(snapshot_path)
+        if reader:
+            # Index the keys off the startup path; entries are decoded on first access
+            asyncio.get_running_loop().run_in_executor(None, reader.load_index)
+    scheduler = lease = None
     if settings.agents_enabled and settings.app_env != "test":
+        from app.agents.leader import LeaderLease
         from app.agents.scheduler import build_scheduler
+        # Every worker builds the scheduler; only the lease holder runs it
         scheduler = build_scheduler()
-        scheduler.start()
+        scheduler.start(paused=True)
+        lease = LeaderLease(settings.redis_url, on_elected=scheduler.resume, on_deposed=scheduler.pause)
+        lease.start()
         logger.info("Agent scheduler started (%d jobs)", len(scheduler.get_jobs()))
+    worker_pool = None
+    if settings.ingress_mode == "queue" and settings.ingress_role != "web":
+        from app.api.webhook import handle_queued_event
+        from app.ingress.worker import get_worker_pool
+        worker_pool = get_worker_pool(handle_queued_event)
+        worker_pool.start()
     yield
+    if worker_pool:
+        await worker_pool.stop()
+        from app.ingress.queue import get_event_queue
+        await get_event_queue().close()
+    if lease:
+        await lease.stop()
     if scheduler and scheduler.running:
         scheduler.shutdown(wait=False)
+    from app.core.summarizer import get_summarizer
+    await get_summarizer().close()
+    if snapshot_path:
+        try:
+            logger.info("Memory snapshot saved: %d entries", store.save_snapshot(snapshot_path))
+        except OSError as e:
+            logger.error("Memory snapshot failed: %s", e)
+    await store.close()
     logger.info("Clawbot LINE bot shutting down")
 
 
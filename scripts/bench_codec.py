@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Stored size and encode/decode time of conversation values per codec.
+
+Builds --conversations Thai sales transcripts of --history messages: customer lines
+as they arrive over LINE, bot replies taken from the shipped FAQ answers (greeting,
+warranty, shipping, ...) plus quote-flow prompts, and a quote flow state with a Thai
+name and address.  Each value is encoded the way ConversationStore stores it (one
+list element per message, one key per flow) and the totals are reported per
+conversation.  "json ascii" is the old json.dumps default with \\uXXXX escapes.
+
+Usage: python3 scripts/bench_codec.py [--conversations 2000] [--history 10]
+"""
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_CUSTOMER = [
+    "สวัสดีค่ะ",
+    "สนใจโถสุขภัณฑ์รุ่น CF-13022 ค่ะ ราคาเท่าไหร่คะ",
+    "ใช้ในโครงการคอนโด 120 ห้องค่ะ ต้องการประมาณ 150 ชุด",
+    "รับประกันกี่ปีคะ",
+    "ส่งต่างจังหวัดได้ไหมคะ อยู่เชียงใหม่ค่ะ",
+    "มีบริการติดตั้งไหมครับ",
+    "ขอใบเสนอราคาด้วยครับ ชื่อบริษัท สยามพร็อพเพอร์ตี้ ดีเวลลอปเม้นท์ จำกัด",
+    "อ่างล้างหน้าแบบฝังเคาน์เตอร์มีสีอะไรบ้างคะ",
+    "ขอบคุณมากค่ะ เดี๋ยวปรึกษาทีมก่อนนะคะ",
+    "โชว์รูมอยู่ที่ไหนครับ อยากไปดูของจริง",
+]
+
+_QUOTE_PROMPTS = [
+    "รบกวนขอชื่อ-นามสกุลสำหรับออกใบเสนอราคาด้วยค่ะ",
+    "ขอที่อยู่สำหรับจัดส่งสินค้า พร้อมรหัสไปรษณีย์ค่ะ",
+    "ขอเบอร์โทรศัพท์สำหรับติดต่อกลับด้วยนะคะ",
+    "ได้รับข้อมูลครบแล้วค่ะ ทีมงานจะส่งใบเสนอราคาให้ภายใน 1 วันทำการค่ะ 🙏",
+]
+
+_FLOW = {
+    "step": "retail_address",
+    "type": "retail",
+    "name": "คุณสมศรี ใจดีมาก",
+    "address": "99/123 หมู่บ้านศุภาลัย ถนนรัตนาธิเบศร์ ตำบลบางกระสอ อำเภอเมืองนนทบุรี นนทบุรี 11000",
+    "items": [{"sku": "CF-13022", "qty": 2}, {"sku": "CF-2101", "qty": 1}],
+}
+
+
+def _transcripts(n: int, history: int):
+    faq = json.loads((Path(__file__).resolve().parent.parent / "app/knowledge/faq.json").read_text(encoding="utf-8"))
+    replies = list(_QUOTE_PROMPTS)
+    for intent in faq.values():
+        answers = intent["answers"]
+        replies += [answers["th"]] if "th" in answers else [a["th"] for a in answers.values()]
+    rng = random.Random(13022)
+    out = []
+    for _ in range(n):
+        conv = []
+        for i in range(history):
+            if i % 2 == 0:
+                conv.append({"role": "user", "content": rng.choice(_CUSTOMER)})
+            else:
+                conv.append({"role": "assistant", "content": rng.choice(replies)})
+        out.append(conv)
+    return out
+
+
+class _JsonAscii:
+    """What the store wrote before the codec layer (json.dumps defaults)."""
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+    @staticmethod
+    def decode(raw: bytes):
+        return json.loads(raw)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--conversations", type=int, default=2000)
+    ap.add_argument("--history", type=int, default=10)
+    args = ap.parse_args()
+
+    from app.memory.codec import Codec
+
+    convs = _transcripts(args.conversations, args.history)
+    codecs = [
+        ("json ascii", _JsonAscii()),
+        ("json utf-8", Codec("json")),
+        ("orjson", Codec("orjson", compress_min=0)),
+        ("orjson+zlib>=512", Codec("orjson", compress_min=512)),
+        ("orjson+zlib all", Codec("orjson", compress_min=1)),
+    ]
+    print(f"{args.conversations} Thai transcripts x {args.history} messages, plus one quote flow each")
+    print(f"{'codec':<18}{'bytes/conv':>12}{'vs ascii':>10}{'encode us':>12}{'decode us':>12}")
+    baseline = None
+    for name, codec in codecs:
+        t0 = time.perf_counter()
+        encoded = [[codec.encode(m) for m in conv] + [codec.encode(_FLOW)] for conv in convs]
+        t1 = time.perf_counter()
+        for values in encoded:
+            for raw in values:
+                codec.decode(raw)
+        t2 = time.perf_counter()
+        size = sum(len(raw) for values in encoded for raw in values) / len(convs)
+        baseline = baseline or size
+        print(f"{name:<18}{size:>12,.0f}{size / baseline:>10.2f}"
+              f"{(t1 - t0) / len(convs) * 1e6:>12.1f}{(t2 - t1) / len(convs) * 1e6:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
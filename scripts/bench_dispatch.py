@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Tail latency of multi-event webhook bodies: serial BackgroundTasks vs EventDispatcher.
+
+Each body carries N events from distinct users (plus optional repeats of one user);
+the handler sleeps for a simulated OpenAI round-trip.  Latency is measured per event
+from the ack until its reply would be sent.
+
+Usage: python3 scripts/bench_dispatch.py [--bodies 200] [--events 5] [--mean-ms 40]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.ingress.dispatcher import EventDispatcher  # noqa: E402
+
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def _body_serial(events, handler):
+    # Starlette BackgroundTasks: one task after another
+    for e in events:
+        await handler(*e)
+
+
+async def _run(mode: str, bodies: int, n_events: int, mean_ms: float, seed: int) -> list:
+    rng = random.Random(seed)
+    latencies = []
+
+    async def handler(user_id, t_ack, cost):
+        await asyncio.sleep(cost)
+        latencies.append((time.perf_counter() - t_ack) * 1000)
+
+    dispatcher = EventDispatcher(handler, max_concurrency=16)
+    for b in range(bodies):
+        t_ack = time.perf_counter()
+        events = [
+            (f"u{b}-{i}", t_ack, rng.lognormvariate(0, 0.5) * mean_ms / 1000)
+            for i in range(n_events)
+        ]
+        if mode == "serial":
+            await _body_serial(events, handler)
+        else:
+            await dispatcher.dispatch(events)
+    return latencies
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--bodies", type=int, default=200)
+    ap.add_argument("--events", type=int, default=5)
+    ap.add_argument("--mean-ms", type=float, default=40.0)
+    args = ap.parse_args()
+
+    print(f"{args.bodies} bodies x {args.events} events, simulated completion ~{args.mean_ms:.0f} ms")
+    print(f"{'mode':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for mode in ("serial", "dispatcher"):
+        lat = asyncio.run(_run(mode, args.bodies, args.events, args.mean_ms, seed=1))
+        print(f"{mode:<12}{statistics.median(lat):>10.1f}{_pct(lat, 0.95):>10.1f}"
+              f"{_pct(lat, 0.99):>10.1f}{max(lat):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
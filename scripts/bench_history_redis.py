@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Conversation history on Redis: whole-document JSON rewrite vs list ops (RPUSH/LTRIM/LRANGE).
+
+Against fakeredis, each "turn" appends a user and an assistant message and reads the
+history once, as the AI path does.  Reports turns per second, round-trips and payload
+bytes moved per turn (command arguments out + replies back), with a full history of
+--history messages of --chars characters.  --rtt-ms adds a simulated network delay per
+round-trip; in-process fakeredis alone mostly measures Python command overhead.
+
+Usage: python3 scripts/bench_history_redis.py [--turns 2000] [--history 10] [--chars 200] [--rtt-ms 0]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _size(value) -> int:
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    if isinstance(value, bytes):
+        return len(value)
+    return len(str(value).encode())
+
+
+class _Meter:
+    def __init__(self, rtt: float):
+        self.trips = 0
+        self.bytes = 0
+        self.rtt = rtt
+
+    def command(self, fn):
+        async def wrapped(client, *args, **kwargs):
+            self.trips += 1
+            if self.rtt:
+                await asyncio.sleep(self.rtt)
+            result = await fn(client, *args, **kwargs)
+            self.bytes += _size(args) + _size(result)
+            return result
+        return wrapped
+
+    def pipeline(self, fn):
+        async def wrapped(pipe, *args, **kwargs):
+            self.trips += 1
+            self.bytes += sum(_size(c[0]) for c in pipe.command_stack)
+            if self.rtt:
+                await asyncio.sleep(self.rtt)
+            result = await fn(pipe, *args, **kwargs)
+            self.bytes += _size(result)
+            return result
+        return wrapped
+
+
+class _LegacyStore:
+    """The previous add_message / get_history: GET, decode, append, slice, encode, SET."""
+
+    def __init__(self, r, max_history: int):
+        self._r = r
+        self._max_history = max_history
+
+    async def add_message(self, user_id: str, role: str, content: str) -> None:
+        key = f"conv:{user_id}"
+        raw = await self._r.get(key)
+        messages = json.loads(raw) if raw else []
+        messages.append({"role": role, "content": content})
+        messages = messages[-self._max_history:]
+        await self._r.set(key, json.dumps(messages), ex=86400)
+
+    async def get_history(self, user_id: str) -> list:
+        raw = await self._r.get(f"conv:{user_id}")
+        return json.loads(raw) if raw else []
+
+
+async def run(name: str, turns: int, history: int, chars: int, rtt: float) -> None:
+    import fakeredis
+    import redis.asyncio.client as rc
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    if name == "json document":
+        store = _LegacyStore(fake, history)
+    else:
+        with patch("redis.asyncio.from_url", return_value=fake):
+            store = ConversationStore(max_history=history, redis_url="redis://bench")
+            await store.get_history("warmup")
+
+    text = ("สุขภัณฑ์ CERAFIELD " * chars)[:chars]
+    users = [f"U{i:032d}" for i in range(50)]
+    for u in users:  # start from a full history, the steady state
+        for _ in range(history):
+            await store.add_message(u, "user", text)
+
+    meter = _Meter(rtt)
+    with patch.object(rc.Redis, "execute_command", meter.command(rc.Redis.execute_command)), \
+         patch.object(rc.Pipeline, "execute", meter.pipeline(rc.Pipeline.execute)):
+        t0 = time.perf_counter()
+        for i in range(turns):
+            u = users[i % len(users)]
+            await store.add_message(u, "user", text)
+            await store.get_history(u)
+            await store.add_message(u, "assistant", text)
+        elapsed = time.perf_counter() - t0
+    print(f"{name:<16}{turns / elapsed:>12,.0f}{meter.trips / turns:>14.1f}{meter.bytes / turns:>16,.0f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=2000)
+    ap.add_argument("--history", type=int, default=10)
+    ap.add_argument("--chars", type=int, default=200)
+    ap.add_argument("--rtt-ms", type=float, default=0.0)
+    args = ap.parse_args()
+
+    print(f"{args.turns} turns, history {args.history} x {args.chars} chars, simulated RTT {args.rtt_ms} ms")
+    print(f"{'layout':<16}{'turns/s':>12}{'trips/turn':>14}{'bytes/turn':>16}")
+    for name in ("json document", "redis list"):
+        asyncio.run(run(name, args.turns, args.history, args.chars, args.rtt_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
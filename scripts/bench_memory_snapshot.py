@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Memory snapshot cost: save time and file size, then what a restart pays.
+
+Fills the in-memory store with --users users (a full history of --history Thai
+messages each, a quote flow for every 5th user, today's usage), saves a snapshot
+and restores it into a fresh store.  "attach" is what startup waits for; "index"
+runs in the background after startup; "first read" decodes one user on demand.
+"eager decode" is what loading every entry up front would cost instead.
+
+Usage: python3 scripts/bench_memory_snapshot.py [--users 100000] [--history 10]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_TEXT = "สนใจโถสุขภัณฑ์รุ่น CF-13022 ค่ะ ใช้ในโครงการคอนโด 120 ห้อง"
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=100_000)
+    ap.add_argument("--history", type=int, default=10)
+    args = ap.parse_args()
+
+    from app.memory.store import ConversationStore
+
+    store = ConversationStore(max_history=args.history, memory_max_entries=10**9, memory_max_bytes=2**40)
+    for i in range(args.users):
+        uid = f"U{i:032x}"
+        for j in range(args.history):
+            await store.add_message(uid, "user" if j % 2 == 0 else "assistant", f"{_TEXT} #{j}")
+        if i % 5 == 0:
+            await store.set_quote_flow(uid, {"step": "retail_address", "name": "คุณสมศรี ใจดีมาก"})
+        await store.increment_daily_usage(uid)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "memory.snapshot")
+        t0 = time.perf_counter()
+        count = store.save_snapshot(path)
+        save = time.perf_counter() - t0
+        size = os.path.getsize(path)
+
+        restored = ConversationStore(max_history=args.history, memory_max_entries=10**9, memory_max_bytes=2**40)
+        t0 = time.perf_counter()
+        reader = restored.restore_snapshot(path)
+        attach = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        reader.load_index()
+        index = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        await restored.get_history(f"U{args.users // 2:032x}")
+        first = time.perf_counter() - t0
+
+        eager = ConversationStore(max_history=args.history, memory_max_entries=10**9, memory_max_bytes=2**40)
+        eager.restore_snapshot(path)
+        t0 = time.perf_counter()
+        for key, _, _ in list(eager._local.snapshot.pending()):
+            eager._local._get(key)
+        decode_all = time.perf_counter() - t0
+
+    print(f"{count:,} entries, {size / 1024 / 1024:.1f} MiB ({size / args.users:,.0f} B/user), save {save * 1000:,.0f} ms")
+    print(f"attach {attach * 1000:.2f} ms   index {index * 1000:,.0f} ms (background)   "
+          f"first read {first * 1000:.3f} ms   eager decode {decode_all * 1000:,.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
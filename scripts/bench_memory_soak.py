@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Soak test of the in-memory store: RSS while --users synthetic LINE users each send a message.
+
+Each user goes through what _handle_message does without Redis: get_session (usage
+check + increment), a user and an assistant add_message, and every 20th user opens a
+quote flow.  RSS is sampled ten times along the way.  "bounded" is the LocalBackend
+with its default budgets; "legacy" replays the old unbounded defaultdict/dict layout.
+Each mode runs in its own subprocess so the RSS figures are independent.
+
+Usage: python3 scripts/bench_memory_soak.py [--users 1000000] [--modes bounded,legacy]
+"""
+import argparse
+import asyncio
+import datetime
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_REPLY = "สวัสดีค่ะ ยินดีต้อนรับสู่ CERAFIELD ลูกค้าสนใจสำหรับใช้ส่วนตัวหรืองานโปรเจคคะ?"
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+class _LegacyStore:
+    """The previous fallback: four unbounded dicts, history as a deque of dicts."""
+
+    def __init__(self, max_history: int = 10):
+        self._memory = defaultdict(lambda: deque(maxlen=max_history))
+        self._usage = {}
+        self._quote_flows = {}
+
+    async def get_session(self, user_id: str, daily_limit: int):
+        key = f"{datetime.date.today().isoformat()}:{user_id}"
+        self._usage[key] = self._usage.get(key, 0) + 1
+        return list(self._memory[user_id])
+
+    async def add_message(self, user_id: str, role: str, content: str) -> None:
+        self._memory[user_id].append({"role": role, "content": content})
+
+    async def set_quote_flow(self, user_id: str, state: dict) -> None:
+        self._quote_flows[user_id] = state
+
+
+async def soak(mode: str, users: int) -> None:
+    from app.memory.store import ConversationStore
+
+    store = ConversationStore() if mode == "bounded" else _LegacyStore()
+    step = max(1, users // 10)
+    base = _rss_mb()
+    t0 = time.perf_counter()
+    samples = []
+    for i in range(users):
+        uid = f"U{i:032x}"
+        await store.get_session(uid, 100)
+        await store.add_message(uid, "user", f"สนใจ CF-13022 จำนวน {i % 500} ชิ้นค่ะ")
+        await store.add_message(uid, "assistant", _REPLY)
+        if i % 20 == 0:
+            await store.set_quote_flow(uid, {"step": "retail_name", "type": "retail"})
+        if (i + 1) % step == 0:
+            samples.append(f"{_rss_mb() - base:.0f}")
+    elapsed = time.perf_counter() - t0
+    extra = ""
+    if mode == "bounded":
+        stats = store._local.stats()
+        extra = f"  entries={stats['entries']:,} evictions={stats['evictions']:,}"
+    print(f"{mode:<8} {users / elapsed:>9,.0f} users/s  RSS growth MB @10%..100%: {' '.join(samples)}{extra}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=1_000_000)
+    ap.add_argument("--modes", default="bounded,legacy")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        import logging
+        logging.disable(logging.WARNING)
+        asyncio.run(soak(args.child, args.users))
+        return
+
+    print(f"{args.users:,} synthetic users, one message each")
+    for mode in args.modes.split(","):
+        subprocess.run([sys.executable, __file__, "--child", mode, "--users", str(args.users)], check=True)
+
+
+if __name__ == "__main__":
+    main()
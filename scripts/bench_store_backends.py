@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Throughput of the ConversationStore backends on the per-message path.
+
+Each "turn" is what _handle_message does with the store: get_session (usage check +
+increment, flows, history), add_message for the user and the assistant, and every
+10th turn a set_quote_flow.  --concurrency turns run at once, as concurrent webhooks
+would.  Backends: "memory" (LocalBackend), "redis" (in-process fakeredis — command
+overhead only, no network) and "sqlite" (WAL file in a temp dir, group-committed
+writes).  Each backend runs in its own subprocess.
+
+Usage: python3 scripts/bench_store_backends.py [--turns 5000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+_TEXT = "สนใจโถสุขภัณฑ์รุ่น CF-13022 ค่ะ ใช้ในโครงการคอนโด 120 ห้อง"
+_REPLY = "ได้เลยค่ะ รบกวนขอชื่อ-นามสกุลสำหรับออกใบเสนอราคาด้วยค่ะ"
+
+
+async def _turn(store, i: int, latencies: list) -> None:
+    uid = f"U{i % 500:032x}"
+    t0 = time.perf_counter()
+    await store.get_session(uid, 1_000_000)
+    await store.add_message(uid, "user", _TEXT)
+    await store.add_message(uid, "assistant", _REPLY)
+    if i % 10 == 0:
+        await store.set_quote_flow(uid, {"step": "retail_name", "type": "retail"})
+    latencies.append(time.perf_counter() - t0)
+
+
+async def run(backend: str, turns: int, concurrency: int) -> None:
+    from app.memory.store import ConversationStore
+
+    with tempfile.TemporaryDirectory() as tmp, patch("redis.asyncio.from_url") as from_url:
+        if backend == "sqlite":
+            from app.memory.sqlite import SqliteStore
+            store = SqliteStore(os.path.join(tmp, "bench.db"))
+        elif backend == "redis":
+            import fakeredis
+            from_url.return_value = fakeredis.FakeAsyncRedis()
+            store = ConversationStore(redis_url="redis://bench")
+        else:
+            store = ConversationStore()
+
+        latencies: list = []
+        sem = asyncio.Semaphore(concurrency)
+
+        async def limited(i: int) -> None:
+            async with sem:
+                await _turn(store, i, latencies)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(limited(i) for i in range(turns)))
+        elapsed = time.perf_counter() - t0
+        await store.close()
+
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{backend:<8}{turns / elapsed:>12,.0f}{p50:>10.2f}{p99:>10.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--turns", type=int, default=5000)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--backends", default="memory,redis,sqlite")
+    ap.add_argument("--child", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.child:
+        logging.disable(logging.WARNING)
+        asyncio.run(run(args.child, args.turns, args.concurrency))
+        return
+
+    print(f"{args.turns} turns over 500 users, {args.concurrency} concurrent")
+    print(f"{'backend':<8}{'turns/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    for backend in args.backends.split(","):
+        subprocess.run([sys.executable, __file__, "--child", backend, "--turns", str(args.turns),
+                        "--concurrency", str(args.concurrency)], check=True)
+
+
+if __name__ == "__main__":
+    main()
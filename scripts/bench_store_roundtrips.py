@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Redis round-trips per handled message: per-call store reads vs ConversationStore.get_session.
+
+Runs a customer message through the pre-AI store access of _handle_message against
+fakeredis, counting every command / pipeline sent to Redis.  "before" replays the old
+sequence (get_daily_usage, increment_daily_usage, get_lead_flow, get_quote_flow,
+get_history for priority, add_message, get_history, add_message); "after" runs the real
+_handle_message with the completion and LINE reply stubbed.  The "+l1" variants enable the
+per-process L1 cache (L1_CACHE_USERS); "bytes in" is the reply payload Redis sends back.
+--rtt-ms adds a simulated network delay per round-trip to show what the count costs in
+wall time.
+
+Usage: python3 scripts/bench_store_roundtrips.py [--messages 200] [--rtt-ms 1.0]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock, patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+os.environ.setdefault("LINE_CHANNEL_SECRET", "bench_secret_that_is_long_enough_32c")
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("APP_ENV", "test")
+os.environ.setdefault("FAQ_ENABLED", "false")
+
+
+def _size(value) -> int:
+    if isinstance(value, (list, tuple)):
+        return sum(_size(v) for v in value)
+    if isinstance(value, bytes):
+        return len(value)
+    return len(str(value).encode())
+
+
+class _Counter:
+    def __init__(self, rtt: float):
+        self.calls = 0
+        self.bytes = 0
+        self.rtt = rtt
+
+    def wrap(self, fn):
+        async def counted(*args, **kwargs):
+            self.calls += 1
+            if self.rtt:
+                await asyncio.sleep(self.rtt)
+            result = await fn(*args, **kwargs)
+            self.bytes += _size(result)
+            return result
+        return counted
+
+
+def _completion():
+    choice = MagicMock()
+    choice.message.content = "รับทราบค่ะ"
+    resp = MagicMock()
+    resp.choices = [choice]
+    resp.usage = None
+    return resp
+
+
+async def _before(store, user_id: str, text: str) -> None:
+    await store.get_daily_usage(user_id)
+    await store.increment_daily_usage(user_id)
+    await store.get_lead_flow(user_id)
+    await store.get_quote_flow(user_id)
+    await store.get_history(user_id)  # admission priority
+    await store.add_message(user_id, "user", text)
+    await store.get_history(user_id)
+    await store.add_message(user_id, "assistant", "รับทราบค่ะ")
+
+
+async def _after(store, user_id: str, text: str) -> None:
+    from app.api.webhook import _handle_message
+    await _handle_message(user_id, text, "token")
+
+
+async def run(mode: str, messages: int, rtt: float) -> None:
+    import fakeredis
+    import redis.asyncio.client as rc
+    import app.memory.store as st
+    import app.ingress.admission as iad
+
+    counter = _Counter(rtt)
+    fake = fakeredis.FakeAsyncRedis()
+    st._store = None
+    iad._controller = None
+    with patch("redis.asyncio.from_url", return_value=fake), \
+         patch.object(rc.Redis, "execute_command", counter.wrap(rc.Redis.execute_command)), \
+         patch.object(rc.Pipeline, "execute", counter.wrap(rc.Pipeline.execute)), \
+         patch("app.core.ai_engine.create_completion", new=AsyncMock(return_value=_completion())), \
+         patch("app.api.webhook.reply_text", new=AsyncMock()), \
+         patch("app.api.webhook.log_line_message", new=AsyncMock()):
+        store = st.ConversationStore(max_history=10, redis_url="redis://bench",
+                                     l1_users=1000 if mode.endswith("+l1") else 0)
+        st._store = store
+        await store.get_history("warmup")  # connect + PING outside the measurement
+        while store._l1 and not store._l1.listening:
+            await asyncio.sleep(0.01)
+        counter.calls = counter.bytes = 0
+        fn = _before if mode.startswith("before") else _after
+        t0 = time.perf_counter()
+        for i in range(messages):
+            await fn(store, f"U{i % 20:032d}", "สนใจ CF-13022 ค่ะ")
+        elapsed = time.perf_counter() - t0
+        await store.close()
+    print(f"{mode:<10}{counter.calls / messages:>14.1f}{counter.bytes / messages:>12,.0f}"
+          f"{elapsed / messages * 1000:>16.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--messages", type=int, default=200)
+    ap.add_argument("--rtt-ms", type=float, default=1.0)
+    args = ap.parse_args()
+
+    logging.disable(logging.WARNING)
+    print(f"{args.messages} messages over 20 users, simulated RTT {args.rtt_ms} ms")
+    print(f"{'path':<10}{'round-trips':>14}{'bytes in':>12}{'ms / message':>16}")
+    for mode in ("before", "before+l1", "after", "after+l1"):
+        asyncio.run(run(mode, args.messages, args.rtt_ms / 1000))
+
+
+if __name__ == "__main__":
+    main()
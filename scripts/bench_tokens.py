@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Token estimates vs the true tokenizer on conversation transcripts.
+
+Compares app.core.tokens.estimate_tokens (the fallback used when tiktoken has no
+encoding) and the old `len(content) // 4` against the exact o200k_base count, per
+message, grouped by script.  The true count comes from tiktoken, or from rs-bpe (which
+bundles o200k_base) when tiktoken cannot load the encoding offline.
+
+Transcripts come from a SQLite store (--sqlite data/clawbot.db, the messages table) or a
+JSONL export (--jsonl, one {"role", "content"} per line).  Without either, a built-in set
+is used: customer turns as they arrive on LINE plus the reply templates quoted in
+SYSTEM_PROMPT and the FAQ answers.
+
+It also times fit_history against the old insert(0)-based trim over history windows of
+--windows messages, with counts cached (and cold, for fit_history).
+--fit prints least-squares weights for the estimator, to refresh _WEIGHTS.
+
+Usage: python3 scripts/bench_tokens.py [--sqlite PATH | --jsonl FILE] [--windows 10,100,1000] [--fit]
+"""
+import argparse
+import json
+import re
+import sqlite3
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+CUSTOMER_TURNS = [
+    "สวัสดีค่ะ", "สนใจโถสุขภัณฑ์แบบชิ้นเดียวค่ะ ราคาเท่าไหร่คะ", "ใช้เองที่บ้านค่ะ กำลังรีโนเวทห้องน้ำ",
+    "งานโปรเจคคอนโด 120 ห้องครับ", "CF-13022 ราคาเท่าไหร่ครับ", "เอา 2 ชิ้นค่ะ", "ขอแคตตาล็อกหน่อยค่ะ",
+    "มีสีดำด้านไหมคะ", "CF-15001 สั่ง 150 ชิ้น ได้ราคาเท่าไหร่", "ส่งฟรีไหมคะ ต่างจังหวัดค่ะ เชียงใหม่",
+    "ติดตั้งให้ด้วยไหมครับ", "งบไม่เกิน 10,000 บาท แนะนำรุ่นไหนดีคะ", "CF-13022 กับ CF-2495 ต่างกันยังไงคะ",
+    "ขอใบเสนอราคาค่ะ", "ชื่อ สมศรี ใจดี เบอร์ 081-234-5678 อีเมล somsri@example.com",
+    "บริษัท ไทยคอนสตรัคชั่น จำกัด ผู้ติดต่อ คุณวิชัย โปรเจค The Riverside ส่งมอบ มีนาคม 2027",
+    "รับประกันกี่ปีคะ", "ผู้สูงอายุใช้ รุ่นไหนนั่งสบายคะ มีราวจับด้วยไหม", "ขอพูดกับเจ้าหน้าที่หน่อยครับ",
+    "ลดได้อีกไหมคะ ถ้าสั่ง 50 ชิ้น", "ไม่เอาเพิ่มค่ะ แค่นี้", "ท่อน้ำทิ้งกี่มิลคะ ห้องน้ำเก่าเป็นระยะ 30 ซม.",
+    "Hi, do you ship to Phuket?", "How much is CF-15005 for 100 pcs in matt black?",
+    "We need 200 wall hung toilets for a hotel project in Pattaya, can you quote?",
+    "你好，请问这款马桶多少钱？", "我们是酒店项目，需要一百套，有优惠吗？",
+    "โอเคค่ะ ขอบคุณมากนะคะ 🙏", "ok ค่ะ CF-600 เพิ่มอีก 4 ตัว", "ขอ spec CF-FT07 ด้วยค่ะ ขนาดเท่าไหร่",
+]
+
+
+def _builtin_messages() -> list:
+    from app.core.ai_engine import SYSTEM_PROMPT
+
+    replies = [m.strip() for m in re.findall(r'"([^"]{12,})"', SYSTEM_PROMPT)]
+    faq = json.loads((ROOT / "app" / "knowledge" / "faq.json").read_text(encoding="utf-8"))
+    stack = [entry.get("answers", {}) for entry in faq.values()]
+    while stack:  # answers are per language, some further split by audience
+        node = stack.pop()
+        for value in node.values():
+            if isinstance(value, dict):
+                stack.append(value)
+            else:
+                replies.append(value)
+    return ([{"role": "user", "content": c} for c in CUSTOMER_TURNS]
+            + [{"role": "assistant", "content": r} for r in replies])
+
+
+def _load(args) -> list:
+    if args.sqlite:
+        with sqlite3.connect(args.sqlite) as conn:
+            return [{"role": r, "content": c} for r, c in conn.execute("SELECT role, content FROM messages")]
+    if args.jsonl:
+        return [json.loads(line) for line in Path(args.jsonl).read_text(encoding="utf-8").splitlines() if line]
+    return _builtin_messages()
+
+
+def _true_counter():
+    from app.core import tokens
+
+    enc = tokens._encoding(tokens.DEFAULT_ENCODING)
+    if enc is not None:
+        return "tiktoken " + enc.name, lambda text: len(enc.encode(text, disallowed_special=()))
+    try:
+        from rs_bpe.bpe import openai
+    except ImportError:
+        sys.exit("needs tiktoken with a cached o200k_base, or `pip install rs-bpe`")
+    bpe = openai.o200k_base()
+    return "rs-bpe o200k_base", bpe.count
+
+
+def _script(text: str) -> str:
+    counts = {
+        "thai": len(re.findall(r"[฀-๿]", text)),
+        "cjk": len(re.findall(r"[぀-ヿ㐀-鿿가-힯]", text)),
+        "latin": len(re.findall(r"[A-Za-z]", text)),
+    }
+    return max(counts, key=counts.get)
+
+
+def _report(texts: list, truth: list) -> None:
+    from app.core.tokens import estimate_tokens
+
+    rows = {}
+    for text, true in zip(texts, truth):
+        rows.setdefault(_script(text), []).append((true, estimate_tokens(text), len(text) // 4 + 1))
+    rows["all"] = [r for group in list(rows.values()) for r in group]
+    print(f"{'script':<8}{'msgs':>6}{'true tok':>10}{'estimate':>10}{'err':>8}{'len//4':>10}{'err':>8}")
+    for script, group in rows.items():
+        true = sum(r[0] for r in group)
+        est = sum(r[1] for r in group)
+        old = sum(r[2] for r in group)
+        est_err = statistics.mean(abs(r[1] - r[0]) / r[0] for r in group)
+        old_err = statistics.mean(abs(r[2] - r[0]) / r[0] for r in group)
+        print(f"{script:<8}{len(group):>6}{true:>10,}{est:>10,}{est_err:>8.0%}{old:>10,}{old_err:>8.0%}")
+    print("(err = mean absolute error per message; token columns are totals)")
+
+
+def _fit(texts: list, truth: list) -> None:
+    from app.core.tokens import _WEIGHTS
+
+    patterns = [p for p, _ in _WEIGHTS]
+    X = [[len(p.findall(t)) for p in patterns] for t in texts]
+    n = len(patterns)
+    # Normal equations, solved by Gauss-Jordan elimination
+    m = [[sum(r[i] * r[j] for r in X) + (1e-3 if i == j else 0) for j in range(n)]
+         + [sum(r[i] * y for r, y in zip(X, truth))] for i in range(n)]
+    for i in range(n):
+        p = max(range(i, n), key=lambda r: abs(m[r][i]))
+        m[i], m[p] = m[p], m[i]
+        for r in range(n):
+            if r != i:
+                f = m[r][i] / m[i][i]
+                m[r] = [a - f * b for a, b in zip(m[r], m[i])]
+    for i, pattern in enumerate(patterns):
+        print(f"{pattern.pattern:<24}{m[i][n] / m[i][i]:.3f}")
+
+
+def _old_trim(history: list, max_tokens: int) -> list:
+    """The previous ai_engine._trim_history, for the timing comparison."""
+    total = 0
+    trimmed = []
+    for msg in reversed(history):
+        total += len(msg.get("content") or "") // 4 + 1
+        if total > max_tokens:
+            break
+        trimmed.insert(0, msg)
+    return trimmed
+
+
+def _time_trim(messages: list, windows: list, model: str) -> None:
+    from app.core import tokens
+
+    print(f"{'window':>8}{'len//4 trim µs':>16}{'fit_history µs':>16}{'(cold)':>10}   tokenizer: "
+          f"{tokens.tokenizer_name(model)}")
+    for window in windows:
+        history = (messages * (window // len(messages) + 1))[:window]
+        budget = 10 ** 9  # keep everything: the worst case for both
+        n = max(10, 20_000 // window)
+        tokens._count.cache_clear()
+        t0 = time.perf_counter()
+        tokens.fit_history(history, budget, model)
+        cold = (time.perf_counter() - t0) * 1e6
+        t0 = time.perf_counter()
+        for _ in range(n):
+            tokens.fit_history(history, budget, model)
+        new = (time.perf_counter() - t0) / n * 1e6
+        t0 = time.perf_counter()
+        for _ in range(n):
+            _old_trim(history, budget)
+        old = (time.perf_counter() - t0) / n * 1e6
+        print(f"{window:>8}{old:>16,.1f}{new:>16,.1f}{cold:>10,.0f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--sqlite")
+    src.add_argument("--jsonl")
+    ap.add_argument("--model", default="gpt-4o-mini")
+    ap.add_argument("--windows", default="10,100,1000", help="history lengths to time trimming at")
+    ap.add_argument("--fit", action="store_true", help="print least-squares estimator weights")
+    args = ap.parse_args()
+
+    messages = [m for m in _load(args) if m.get("content")]
+    texts = [m["content"] for m in messages]
+    name, count = _true_counter()
+    truth = [max(1, count(t)) for t in texts]
+    print(f"{len(texts)} messages, true counts from {name}\n")
+    _report(texts, truth)
+    print()
+    _time_trim(messages, [int(w) for w in args.windows.split(",")], args.model)
+    if args.fit:
+        print()
+        _fit(texts, truth)
+
+
+if __name__ == "__main__":
+    main()
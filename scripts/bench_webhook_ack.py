@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark of the /callback ack path: line-bot-sdk WebhookParser vs the lean fast path.
+
+Measures requests per second for (1) signature check + decode only and (2) the full
+ASGI endpoint with the background dispatch stubbed out, on a body carrying a mix of
+text, sticker and follow events.
+
+Usage: python3 scripts/bench_webhook_ack.py [--seconds 2]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+SECRET = "bench_secret_that_is_long_enough_32c"
+os.environ.setdefault("LINE_CHANNEL_SECRET", SECRET)
+os.environ.setdefault("LINE_CHANNEL_ACCESS_TOKEN", "bench")
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("APP_ENV", "test")
+os.environ.setdefault("AGENTS_ENABLED", "false")
+
+
+def _body() -> bytes:
+    events = []
+    for i in range(3):
+        events.append({
+            "type": "message", "mode": "active", "timestamp": 1625665161000,
+            "source": {"type": "user", "userId": f"U{i:032d}"},
+            "webhookEventId": f"01H{i:023d}", "deliveryContext": {"isRedelivery": False},
+            "replyToken": f"token{i}",
+            "message": {"id": str(i), "type": "text", "quoteToken": "q", "text": "สนใจ CF-13022 100 ชิ้นค่ะ"},
+        })
+    events.append({
+        "type": "message", "mode": "active", "timestamp": 1625665161000,
+        "source": {"type": "user", "userId": "U" + "9" * 32},
+        "webhookEventId": "01Hsticker", "deliveryContext": {"isRedelivery": False}, "replyToken": "t9",
+        "message": {"id": "9", "type": "sticker", "quoteToken": "q", "packageId": "446", "stickerId": "1988",
+                    "stickerResourceType": "STATIC"},
+    })
+    events.append({
+        "type": "follow", "mode": "active", "timestamp": 1625665161000,
+        "source": {"type": "user", "userId": "U" + "8" * 32},
+        "webhookEventId": "01Hfollow", "deliveryContext": {"isRedelivery": False}, "replyToken": "t8",
+        "follow": {"isUnblocked": False},
+    })
+    return json.dumps({"destination": "Ubench", "events": events}, ensure_ascii=False).encode()
+
+
+def _sign(body: bytes) -> str:
+    return base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+
+
+def _rate(fn, seconds: float) -> float:
+    n = 0
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        for _ in range(100):
+            fn()
+        n += 100
+    return n / seconds
+
+
+def bench_decode(body: bytes, sig: str, seconds: float) -> None:
+    from linebot.v3 import WebhookParser
+    from app.ingress.events import parse_text_events, verify_signature
+
+    parser = WebhookParser(SECRET)
+
+    def sdk():
+        parser.parse(body.decode("utf-8"), sig)
+
+    def fast():
+        assert verify_signature(body, sig, SECRET)
+        parse_text_events(body)
+
+    print(f"{'decode path':<28}{'req/s':>12}")
+    for name, fn in (("WebhookParser.parse", sdk), ("verify + parse_text_events", fast)):
+        print(f"{name:<28}{_rate(fn, seconds):>12,.0f}")
+
+
+async def bench_endpoint(body: bytes, sig: str, seconds: float) -> None:
+    import httpx
+    from main import app
+
+    logging.disable(logging.INFO)
+
+    headers = {"X-Line-Signature": sig, "Content-Type": "application/json"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        with patch("app.api.webhook._dispatch_events"), \
+             patch("app.ingress.dedup.EventDeduplicator.claim", side_effect=lambda ev: [True] * len(ev)), \
+             patch("app.ingress.ratelimit.UserRateLimiter.admit", side_effect=lambda ids: [True] * len(ids)):
+            n = 0
+            end = time.perf_counter() + seconds
+            while time.perf_counter() < end:
+                resp = await client.post("/callback", content=body, headers=headers)
+                assert resp.status_code == 200, resp.text
+                n += 1
+    print(f"{'full /callback (ASGI)':<28}{n / seconds:>12,.0f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--seconds", type=float, default=2.0)
+    args = ap.parse_args()
+
+    body = _body()
+    sig = _sign(body)
+    print(f"body: {len(body)} bytes, 3 text + 1 sticker + 1 follow events")
+    bench_decode(body, sig, args.seconds)
+    asyncio.run(bench_endpoint(body, sig, args.seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Throughput of the gunicorn multi-worker mode (gunicorn.conf.py) at 1, 2 and 4 workers.
+
+Starts the real server with WEB_CONCURRENCY=N against a shared Redis and posts signed
+webhooks (one text event each, unique event ids over 1,000 users) from --concurrency
+connections for --seconds.  Each request runs the full ack path — signature, parse,
+dedup claim, per-user rate limit — and its background turn does the store work of a
+message (get_session + two add_message); the OpenAI and LINE calls are stubbed out.
+
+Without --redis-url a fakeredis TCP server is started in a subprocess: it is single-threaded
+Python, so it caps throughput long before a real Redis would.  Run the load generator
+on a different machine / cores than the server for numbers that mean anything.
+
+--ack-only drops the background turn to measure the web tier alone.
+
+Usage: python3 scripts/bench_workers.py [--workers 1,2,4] [--seconds 10] [--concurrency 64]
+                                        [--redis-url redis://localhost:6379/15] [--ack-only]
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SECRET = "bench_secret_that_is_long_enough_32c"
+
+
+def bench_app():
+    """gunicorn app factory: the real app with the AI turn replaced by its store work."""
+    import app.api.webhook as webhook
+    from app.memory.store import get_store
+    from main import app
+
+    async def store_turn(user_id: str, user_text: str, reply_token: str) -> None:
+        store = get_store()
+        await store.get_session(user_id, 1_000_000)
+        await store.add_message(user_id, "user", user_text)
+        await store.add_message(user_id, "assistant", "ได้เลยค่ะ รบกวนขอชื่อ-นามสกุลด้วยค่ะ")
+
+    async def ack_only(user_id: str, user_text: str, reply_token: str) -> None:
+        pass
+
+    webhook._handle_message = ack_only if os.environ.get("BENCH_ACK_ONLY") else store_turn
+    return app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _body(n: int) -> bytes:
+    return json.dumps({"destination": "Ubench", "events": [{
+        "type": "message", "mode": "active", "timestamp": 1625665161000,
+        "source": {"type": "user", "userId": f"U{n % 1000:032d}"},
+        "webhookEventId": f"01B{os.getpid()}{n:020d}", "deliveryContext": {"isRedelivery": False},
+        "replyToken": f"token{n}",
+        "message": {"id": str(n), "type": "text", "quoteToken": "q", "text": "สนใจ CF-13022 100 ชิ้นค่ะ"},
+    }]}, ensure_ascii=False).encode()
+
+
+async def _load(port: int, seconds: float, concurrency: int, counter) -> list:
+    """Keep-alive HTTP/1.1 on raw streams — an HTTP client library would cost more CPU than the server."""
+    latencies: list = []
+    end = time.perf_counter() + seconds
+
+    async def loop() -> None:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < end:
+                body = _body(next(counter))
+                sig = base64.b64encode(hmac.new(SECRET.encode(), body, hashlib.sha256).digest()).decode()
+                head = (f"POST /callback HTTP/1.1\r\nHost: bench\r\nContent-Type: application/json\r\n"
+                        f"X-Line-Signature: {sig}\r\nContent-Length: {len(body)}\r\n\r\n")
+                t0 = time.perf_counter()
+                writer.write(head.encode() + body)
+                status = await reader.readline()
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    if line.lower().startswith(b"content-length:"):
+                        length = int(line.split(b":")[1])
+                await reader.readexactly(length)
+                latencies.append(time.perf_counter() - t0)
+                assert b" 200 " in status, status
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return latencies
+
+
+async def _wait_ready(port: int, proc: subprocess.Popen) -> None:
+    import httpx
+
+    async with httpx.AsyncClient() as client:
+        for _ in range(200):
+            if proc.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with {proc.returncode}")
+            try:
+                await client.get(f"http://127.0.0.1:{port}/")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("gunicorn did not come up")
+
+
+def run(workers: int, redis_url: str, seconds: float, concurrency: int, counter, ack_only: bool) -> None:
+    port = _free_port()
+    env = {
+        **os.environ,
+        "LINE_CHANNEL_SECRET": SECRET, "LINE_CHANNEL_ACCESS_TOKEN": "bench", "OPENAI_API_KEY": "bench",
+        "REDIS_URL": redis_url, "WEB_CONCURRENCY": str(workers), "PORT": str(port),
+        "AGENTS_ENABLED": "false", "APP_ENV": "bench", "USER_RATE_PER_MINUTE": "0",
+        "BENCH_ACK_ONLY": "1" if ack_only else "",
+    }
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+         "scripts.bench_workers:bench_app()"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        asyncio.run(_wait_ready(port, proc))
+        asyncio.run(_load(port, 1.0, concurrency, counter))  # warm-up: connections, imports, Lua scripts
+        latencies = asyncio.run(_load(port, seconds, concurrency, counter))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    latencies.sort()
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{workers:<8}{len(latencies) / seconds:>12,.0f}{p50:>10.2f}{p99:>10.2f}")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", default="1,2,4")
+    ap.add_argument("--seconds", type=float, default=10.0)
+    ap.add_argument("--concurrency", type=int, default=64)
+    ap.add_argument("--redis-url")
+    ap.add_argument("--ack-only", action="store_true", help="skip the background store turn")
+    ap.add_argument("--fake-redis", type=int, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.fake_redis:
+        from fakeredis import TcpFakeServer
+        TcpFakeServer(("127.0.0.1", args.fake_redis), server_type="redis").serve_forever()
+        return
+
+    redis_url = args.redis_url
+    fake = None
+    if not redis_url:
+        port = _free_port()
+        fake = subprocess.Popen([sys.executable, __file__, "--fake-redis", str(port)])
+        redis_url = f"redis://127.0.0.1:{port}/0"
+
+    counter = itertools.count()
+    print(f"{os.cpu_count()} CPU(s), {args.concurrency} connections, {args.seconds:.0f}s per run, "
+          f"redis: {'given' if args.redis_url else 'fakeredis subprocess'}")
+    print(f"{'workers':<8}{'req/s':>12}{'p50 ms':>10}{'p99 ms':>10}")
+    try:
+        for n in args.workers.split(","):
+            run(int(n), redis_url, args.seconds, args.concurrency, counter, args.ack_only)
+    finally:
+        if fake is not None:
+            fake.terminate()
+
+
+if __name__ == "__main__":
+    main()
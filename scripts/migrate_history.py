@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Convert legacy conv:{user_id} JSON-document histories in Redis to Redis lists.
+
+The store also migrates a key lazily the first time it is read or written, so running
+this is optional; it just finishes the job in one pass after a deploy.
+
+Usage: REDIS_URL=redis://... python3 scripts/migrate_history.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.memory.store import ConversationStore  # noqa: E402
+
+
+async def main() -> None:
+    url = os.environ.get("REDIS_URL")
+    if not url:
+        print("Set REDIS_URL")
+        sys.exit(1)
+    store = ConversationStore(max_history=int(os.environ.get("MAX_HISTORY_MESSAGES", "10")), redis_url=url)
+    print(f"migrated {await store.migrate_history()} conversation keys")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Prompt tokens per turn with the full SYSTEM_PROMPT vs the scoped one (PROMPT_SCOPING).
+
+Replays logged conversations turn by turn.  Each customer message is laid out the way
+get_ai_reply does it: the last --history messages, the spec context for the message,
+trimmed to --budget.  The prompt is counted twice, once with the full SYSTEM_PROMPT and
+once with build_system_prompt's selection.  Summaries are not replayed, so a fold that
+would have carried the order or the customer type shows up as a larger selection here.
+
+Conversations come from a SQLite store (--sqlite data/clawbot.db, the messages table,
+per user in time order) or a JSONL export (--jsonl, one {"user_id", "role", "content"}
+per line, in order).  Without either, a built-in set of sample chats is used.
+Counts use app.core.tokens (tiktoken, or its estimate when the encoding is missing).
+
+Usage: python3 scripts/prompt_report.py [--sqlite PATH | --jsonl FILE] [--history 10] [--budget 8000]
+"""
+import argparse
+import json
+import sqlite3
+import statistics
+import sys
+from collections import Counter
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+SAMPLE_CHATS = [
+    [
+        ("user", "สวัสดีค่ะ"),
+        ("assistant", "สวัสดีค่ะ ยินดีต้อนรับสู่ CERAFIELD ลูกค้าสนใจสำหรับใช้ส่วนตัวหรืองานโปรเจคคะ?"),
+        ("user", "ใช้เองที่บ้านค่ะ กำลังรีโนเวทห้องน้ำ"),
+        ("assistant", "ขอบคุณค่ะ สนใจสินค้าหมวดไหนคะ 1. One Piece 2. Two Piece 3. Wall Hung ..."),
+        ("user", "แบบชิ้นเดียวค่ะ"),
+        ("assistant", "โถสุขภัณฑ์แบบ 1 ชิ้น มีหลายรุ่นเลยค่ะ ส่งแคตตาล็อกให้ดูก่อนนะคะ [CATALOG]"),
+        ("user", "CF-13022 ราคาเท่าไหร่คะ"),
+        ("assistant", "CF-13022 ราคา 10,800 บาทค่ะ ต้องการจำนวนเท่าไหร่คะ?"),
+        ("user", "เอา 2 ชิ้นค่ะ"),
+        ("assistant", "CF-13022 จำนวน 2 ชิ้น รับทราบค่ะ มีสินค้าอื่นที่ต้องการเพิ่มไหมคะ เช่น CF-S01 (850 บาท)"),
+        ("user", "ไม่เอาเพิ่มค่ะ แค่นี้"),
+        ("assistant", "ทวนรายการนะคะ CF-13022 x2 รวม 21,600 บาท ต้องการให้จัดทำใบเสนอราคาไหมคะ?"),
+        ("user", "ไม่เป็นไรค่ะ ขอบคุณค่ะ"),
+    ],
+    [
+        ("user", "ขอแคตตาล็อกหน่อยค่ะ"),
+        ("assistant", "[CATALOG]"),
+        ("user", "รับประกันกี่ปีคะ"),
+        ("assistant", "CERAFIELD รับประกันค่ะ ตัวเซรามิก 10 ปี ฝารองนั่งและปุ่มกด 2 ปี"),
+        ("user", "ส่งฟรีไหมคะ ต่างจังหวัดค่ะ เชียงใหม่"),
+        ("assistant", "จัดส่งฟรีทั่วประเทศค่ะ ระยะเวลาขึ้นอยู่กับรุ่นและจำนวน"),
+        ("user", "ติดตั้งให้ด้วยไหมครับ"),
+        ("assistant", "ทาง CERAFIELD ไม่มีบริการติดตั้งนะคะ"),
+        ("user", "โอเคค่ะ ขอบคุณมากนะคะ 🙏"),
+    ],
+    [
+        ("user", "งานโปรเจคคอนโด 120 ห้องครับ"),
+        ("assistant", "ขอบคุณค่ะ สนใจสินค้าหมวดไหนคะ"),
+        ("user", "CF-15001 สั่ง 150 ชิ้น ได้ราคาเท่าไหร่"),
+        ("assistant", "CF-15001 สั่ง 100+ ชิ้น มีให้เลือกสีค่ะ White (9,580/ชิ้น) หรือ Matt (20,880/ชิ้น) สนใจสีไหนคะ?"),
+        ("user", "สีขาวครับ"),
+        ("assistant", "CF-15001 White จำนวน 150 ชิ้น รับทราบค่ะ แนะนำ CF-25008 ถังพักน้ำซ่อน (จำเป็นสำหรับติดตั้ง)"),
+        ("user", "เอาด้วยครับ 150 ชุด"),
+        ("assistant", "ทวนรายการนะคะ CF-15001 x150 ... ต้องการให้จัดทำใบเสนอราคาไหมคะ?"),
+        ("user", "ลดได้อีกไหมครับ"),
+        ("assistant", "ราคาที่ให้เป็น best price ตามปริมาณแล้วค่ะ"),
+        ("user", "โอเคครับ ขอใบเสนอราคาครับ"),
+        ("assistant", "ขอข้อมูลสำหรับใบเสนอราคาโปรเจคนะคะ ชื่อบริษัท ชื่อผู้ติดต่อ ชื่อโปรเจค กำหนดการส่งมอบ"),
+        ("user", "บริษัท ไทยคอนสตรัคชั่น จำกัด ผู้ติดต่อ คุณวิชัย โปรเจค The Riverside ส่งมอบ มีนาคม 2027"),
+        ("assistant", "ขอบคุณค่ะ ได้รับข้อมูลเรียบร้อยแล้ว [NOTIFY_LEAD]"),
+        ("user", "การชำระเงินเป็นแบบไหนครับ"),
+    ],
+    [
+        ("user", "งบไม่เกิน 10,000 บาท แนะนำรุ่นไหนดีคะ"),
+        ("assistant", "แนะนำ CF-2495 (8,580) CF-2507 (8,580) CF-2493 (8,800) ค่ะ สนใจรุ่นไหนคะ"),
+        ("user", "CF-2495 กับ CF-2493 ต่างกันยังไงคะ"),
+        ("assistant", "CF-2493 ท่อน้ำทิ้ง 50 มม. ลดการอุดตัน CF-2495 ประหยัดกว่าค่ะ"),
+        ("user", "ผู้สูงอายุใช้ รุ่นไหนนั่งสบายคะ มีราวจับด้วยไหม"),
+        ("assistant", "แนะนำ CF-13022 ที่นั่งกว้าง 410 มม. คู่กับราวจับ CF-600 ค่ะ"),
+        ("user", "ท่อน้ำทิ้งกี่มิลคะ ห้องน้ำเก่าเป็นระยะ 30 ซม."),
+    ],
+    [
+        ("user", "Hi, do you ship to Phuket?"),
+        ("assistant", "Yes, we deliver free of charge nationwide."),
+        ("user", "How much is CF-15005 for 100 pcs in matt black?"),
+        ("assistant", "CF-15005 Matt Black at 100+ pcs is 14,980 THB per piece."),
+        ("user", "Can I talk to someone from sales?"),
+        ("assistant", "Of course. Tel: +66 956162552"),
+        ("user", "Thanks!"),
+    ],
+    [
+        ("user", "你好，请问这款马桶多少钱？"),
+        ("assistant", "您好，请问您要的是哪个型号？"),
+        ("user", "我们是酒店项目，需要一百套，有优惠吗？"),
+        ("assistant", "100套以上可享受项目价。请告诉我型号。"),
+        ("user", "产品有什么认证？"),
+    ],
+    [
+        ("user", "โถที่ซื้อไปแตกค่ะ ไม่พอใจมาก"),
+        ("assistant", "ขออภัยในความไม่สะดวกเป็นอย่างยิ่งค่ะ รบกวนแจ้งรหัสสินค้าและรายละเอียด"),
+        ("user", "CF-2507 ค่ะ ซื้อเมื่อเดือนที่แล้ว"),
+        ("assistant", "รับทราบค่ะ ทีมงานจะดำเนินการให้โดยเร็วที่สุดค่ะ"),
+        ("user", "เคยสั่งไปแล้ว อยากสั่งซ้ำอีก 3 ชิ้นค่ะ"),
+    ],
+]
+
+
+def _load(args) -> list:
+    """Conversations, each a list of {"role", "content"} in order."""
+    if args.sqlite:
+        chats: dict = {}
+        with sqlite3.connect(args.sqlite) as conn:
+            rows = conn.execute("SELECT user_id, role, content FROM messages ORDER BY user_id, ts, id")
+            for user_id, role, content in rows:
+                chats.setdefault(user_id, []).append({"role": role, "content": content})
+        return list(chats.values())
+    if args.jsonl:
+        chats = {}
+        for line in Path(args.jsonl).read_text(encoding="utf-8").splitlines():
+            if line.strip():
+                record = json.loads(line)
+                chats.setdefault(record.get("user_id", ""), []).append(record)
+        return list(chats.values())
+    return [[{"role": r, "content": c} for r, c in chat] for chat in SAMPLE_CHATS]
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    src = ap.add_mutually_exclusive_group()
+    src.add_argument("--sqlite")
+    src.add_argument("--jsonl")
+    ap.add_argument("--model", default="gpt-4o-mini")
+    ap.add_argument("--history", type=int, default=10, help="MAX_HISTORY_MESSAGES")
+    ap.add_argument("--budget", type=int, default=8000, help="MAX_CONTEXT_TOKENS")
+    args = ap.parse_args()
+
+    from app.core.ai_engine import _build_messages
+    from app.core.prompt import SYSTEM_PROMPT, build_system_prompt, select_modules
+    from app.core.tokens import count_messages, count_tokens, fit_history, tokenizer_name
+    from app.knowledge.lookup import build_spec_context
+
+    def prompt_tokens(system: str, window: list, context: list) -> int:
+        fixed = count_messages(_build_messages([], context, system), args.model)
+        messages = _build_messages(fit_history(window, args.budget - fixed, args.model), context, system)
+        return count_messages(messages, args.model)
+
+    before, after, system_after = [], [], []
+    scopes: Counter = Counter()
+    modules: Counter = Counter()
+    chats = _load(args)
+    for chat in chats:
+        for i, message in enumerate(chat):
+            if message.get("role") != "user" or not message.get("content"):
+                continue
+            window = chat[max(0, i + 1 - args.history):i + 1]
+            text = message["content"]
+            context = [build_spec_context(text)]
+            system, scope = build_system_prompt(text, window)
+            scopes[scope] += 1
+            modules.update(select_modules(text, window) or ["(full prompt)"])
+            before.append(prompt_tokens(SYSTEM_PROMPT, window, context))
+            after.append(prompt_tokens(system, window, context))
+            system_after.append(count_tokens(system, args.model))
+
+    if not before:
+        sys.exit("no customer messages to replay")
+    turns = len(before)
+    full = count_tokens(SYSTEM_PROMPT, args.model)
+    print(f"{len(chats)} conversations, {turns} customer turns, tokenizer: {tokenizer_name(args.model)}\n")
+    print(f"{'':<28}{'full':>10}{'scoped':>10}{'change':>10}")
+    mean_system = statistics.mean(system_after)
+    print(f"{'system prompt tokens/turn':<28}{full:>10,}{mean_system:>10,.0f}{mean_system / full - 1:>10.0%}")
+    mean_before, mean_after = statistics.mean(before), statistics.mean(after)
+    print(f"{'prompt tokens/turn':<28}{mean_before:>10,.0f}{mean_after:>10,.0f}{mean_after / mean_before - 1:>10.0%}")
+    p95 = lambda xs: sorted(xs)[int(0.95 * (len(xs) - 1))]  # noqa: E731
+    print(f"{'prompt tokens p95':<28}{p95(before):>10,}{p95(after):>10,}")
+    print(f"\nturns sent the full prompt: {scopes['full']} ({scopes['full'] / turns:.0%})")
+    print("modules added to the core, by share of turns:")
+    for name, n in modules.most_common():
+        print(f"  {name:<22}{n / turns:>6.0%}")
+
+
+if __name__ == "__main__":
+    main()
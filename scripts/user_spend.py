@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+LLM token spend of one LINE user per Bangkok day (usage.total_tokens of each completion).
+
+Reads the configured store (REDIS_URL, or STORE_BACKEND=sqlite with SQLITE_PATH);
+counters are kept for 32 days.
+
+Usage: REDIS_URL=redis://... python3 scripts/user_spend.py <line_user_id> [--days 7]
+"""
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings  # noqa: E402
+from app.memory.store import get_store  # noqa: E402
+
+
+async def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("user_id")
+    ap.add_argument("--days", type=int, default=7)
+    args = ap.parse_args()
+
+    settings = get_settings()
+    if not settings.redis_url and settings.store_backend != "sqlite":
+        print("Set REDIS_URL (or STORE_BACKEND=sqlite)")
+        sys.exit(1)
+    store = get_store()
+    try:
+        spend = await store.get_spend(args.user_id, args.days)
+    finally:
+        await store.close()
+    for day, tokens in sorted(spend.items()):
+        print(f"{day}  {tokens:>10,}")
+    print(f"{'total':<10}  {sum(spend.values()):>10,}  ({len(spend)} of the last {args.days} days)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,3 +1,5 @@
+import asyncio
+
 import pytest
 from unittest.mock import AsyncMock, MagicMock, patch
 
@@ -13,6 +15,31 @@ def _make_completion_response(content: str = "Hello from bot"):
     return resp
 
 
+class _FakeStream:
+    """CompletionStream stand-in: yields the given deltas; records how far it was read."""
+
+    def __init__(self, deltas, usage=None):
+        self._deltas = list(deltas)
+        self.consumed = 0
+        self.closed = False
+        self.usage = None
+        self._usage = usage
+
+    async def __aiter__(self):
+        for delta in self._deltas:
+            await asyncio.sleep(0)  # a network read: other tasks run between deltas
+            self.consumed += 1
+            yield delta
+        self.usage = self._usage
+
+    async def close(self):
+        self.closed = True
+
+
+def _make_completion_stream(*deltas, usage=None):
+    return _FakeStream(deltas, usage)
+
+
 @pytest.fixture(autouse=True)
 def mock_settings(monkeypatch):
     """
@@ -23,6 +50,9 @@ def mock_settings(monkeypatch):
     monkeypatch.setenv("LINE_CHANNEL_SECRET", "test_secret_that_is_long_enough_32c")
     monkeypatch.setenv("LINE_CHANNEL_ACCESS_TOKEN", "test_token")
     monkeypatch.setenv("OPENAI_API_KEY", "test-openai-key")
+    monkeypatch.setenv("FAQ_ENABLED", "false")  # test_faq.py turns the local FAQ path back on
+    monkeypatch.setenv("SUMMARY_TRIGGER_MESSAGES", "0")  # so does test_summarizer.py for folding
+    monkeypatch.setenv("PROMPT_SCOPING", "false")  # and test_prompt.py for scoped prompts
 
     from app.config import get_settings
     get_settings.cache_clear()
@@ -39,17 +69,33 @@ def reset_singletons():
     import app.services.openai_service as ois
     import app.services.line_service as ls
     import app.memory.store as st
+    import app.ingress.queue as iq
+    import app.ingress.worker as iw
+    import app.ingress.dispatcher as idp
+    import app.ingress.mailbox as imb
+    import app.ingress.coalescer as ico
+    import app.ingress.dedup as idd
+    import app.ingress.admission as iad
+    import app.ingress.ratelimit as irl
+    import app.core.summarizer as csum
+    from app.limiter import limiter
+    from app.metrics import metrics
 
     ois._client = None
     ls._api_client = None
     ls._messaging_api = None
     st._store = None
-
-    try:
-        from app.api import webhook as wh
-        wh._get_parser.cache_clear()
-    except Exception:
-        pass
+    iq._queue = None
+    iw._pool = None
+    idp._dispatcher = None
+    imb._mailbox = None
+    ico._coalescer = None
+    idd._dedup = None
+    iad._controller = None
+    irl._limiter = None
+    csum._summarizer = None
+    limiter.reset()
+    metrics.reset()
 
     yield
 
@@ -57,6 +103,17 @@ def reset_singletons():
     ls._api_client = None
     ls._messaging_api = None
     st._store = None
+    iq._queue = None
+    iw._pool = None
+    idp._dispatcher = None
+    imb._mailbox = None
+    ico._coalescer = None
+    idd._dedup = None
+    iad._controller = None
+    irl._limiter = None
+    csum._summarizer = None
+    limiter.reset()
+    metrics.reset()
 
 
 @pytest.fixture
@@ -69,7 +126,9 @@ def mock_line_reply():
 
 @pytest.fixture
 def mock_openai_reply():
-    """Patch create_completion at the ai_engine module where it was imported."""
-    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock:
+    """Patch create_completion (and its streaming variant) at the ai_engine module where imported."""
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock, \
+         patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock) as stream:
         mock.return_value = _make_completion_response("Hello from bot")
+        stream.side_effect = lambda messages, **kw: _make_completion_stream("Hello ", "from bot")
         yield mock
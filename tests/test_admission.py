@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+async def _occupy(ctrl, priority, hold: asyncio.Event, order=None, tag=None):
+    async with ctrl.admit(priority):
+        if order is not None:
+            order.append(tag)
+        await hold.wait()
+
+
+@pytest.mark.asyncio
+async def test_inflight_cap_and_priority_order():
+    from app.ingress.admission import (
+        AdmissionController, PRIORITY_ADMIN, PRIORITY_IN_FLOW, PRIORITY_NEW_CHAT,
+    )
+
+    ctrl = AdmissionController(max_inflight=1, max_queue=10)
+    gate = asyncio.Event()
+    released = asyncio.Event()
+    released.set()
+    order = []
+
+    first = asyncio.create_task(_occupy(ctrl, PRIORITY_NEW_CHAT, gate))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.create_task(_occupy(ctrl, PRIORITY_NEW_CHAT, released, order, "new")),
+        asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, released, order, "flow")),
+        asyncio.create_task(_occupy(ctrl, PRIORITY_ADMIN, released, order, "admin")),
+    ]
+    await asyncio.sleep(0.01)
+    assert ctrl.inflight == 1
+    assert ctrl.queue_depth == 3
+
+    gate.set()
+    await asyncio.gather(first, *waiters)
+
+    assert order == ["admin", "flow", "new"]
+    assert ctrl.inflight == 0
+    assert ctrl.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_new_chat_shed_when_queue_full_but_flow_user_waits():
+    from app.ingress.admission import AdmissionController, PRIORITY_IN_FLOW, PRIORITY_NEW_CHAT, Shed
+    from app.metrics import metrics
+
+    ctrl = AdmissionController(max_inflight=1, max_queue=1)
+    gate = asyncio.Event()
+    busy = asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, gate))
+    queued_new = asyncio.create_task(_occupy(ctrl, PRIORITY_NEW_CHAT, gate))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(Shed):
+        await ctrl.acquire(PRIORITY_NEW_CHAT)
+
+    # A flow user evicts the queued new chat instead of being rejected
+    flow = asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, gate))
+    await asyncio.sleep(0.01)
+    with pytest.raises(Shed):
+        await queued_new
+
+    gate.set()
+    await asyncio.gather(busy, flow)
+    assert metrics.counter("admission.shed.new_chat") == 2
+    assert ctrl.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_new_chat_wait_timeout_sheds():
+    from app.ingress.admission import AdmissionController, PRIORITY_IN_FLOW, PRIORITY_NEW_CHAT, Shed
+
+    ctrl = AdmissionController(max_inflight=1, max_queue=5, new_chat_timeout_ms=20)
+    gate = asyncio.Event()
+    busy = asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, gate))
+    await asyncio.sleep(0)
+
+    with pytest.raises(Shed):
+        await ctrl.acquire(PRIORITY_NEW_CHAT)
+    assert ctrl.queue_depth == 0
+
+    gate.set()
+    await busy
+    assert ctrl.inflight == 0
+
+
+@pytest.mark.asyncio
+async def test_shed_new_chat_gets_busy_reply():
+    from app.api.webhook import _handle_message
+    from app.ingress.admission import BUSY_MESSAGE, Shed
+
+    ctrl = MagicMock()
+    ctrl.admit.return_value.__aenter__ = AsyncMock(side_effect=Shed("queue full"))
+    ctrl.admit.return_value.__aexit__ = AsyncMock(return_value=False)
+
+    with patch("app.api.webhook.get_admission_controller", return_value=ctrl), \
+         patch("app.api.webhook.get_ai_reply", new_callable=AsyncMock) as ai, \
+         patch("app.api.webhook.reply_text", new_callable=AsyncMock) as reply, \
+         patch("app.api.webhook.log_line_message", new_callable=AsyncMock):
+        await _handle_message("Unew", "สวัสดีค่ะ", "tok")
+
+    ai.assert_not_called()
+    reply.assert_called_once_with("tok", BUSY_MESSAGE)
+
+
+@pytest.mark.asyncio
+async def test_protected_classes_have_hard_cap_and_timeout():
+    from app.ingress.admission import AdmissionController, PRIORITY_ADMIN, PRIORITY_IN_FLOW, Shed
+
+    ctrl = AdmissionController(max_inflight=1, max_queue=1, protected_timeout_ms=50)
+    gate = asyncio.Event()
+    busy = asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, gate))
+    queued = [asyncio.create_task(_occupy(ctrl, PRIORITY_IN_FLOW, gate)) for _ in range(2)]
+    await asyncio.sleep(0.01)
+    assert ctrl.queue_depth == 2
+
+    with pytest.raises(Shed):
+        await ctrl.acquire(PRIORITY_ADMIN)  # past twice AI_MAX_QUEUE
+    for task in queued:
+        with pytest.raises(Shed):
+            await task  # waited longer than the protected timeout
+    assert ctrl.queue_depth == 0
+
+    gate.set()
+    await busy
+    assert ctrl.inflight == 0
+
+
+def test_ai_priority_follows_quote_progress_not_any_history():
+    from app.api.webhook import _ai_priority
+    from app.ingress.admission import PRIORITY_IN_FLOW, PRIORITY_NEW_CHAT
+
+    chatted = [{"role": "user", "content": "สวัสดีค่ะ"}, {"role": "assistant", "content": "สวัสดีค่ะ ยินดีให้บริการค่ะ"}]
+    quoting = chatted + [{"role": "assistant", "content": "ต้องการเพิ่มไหมคะ"}]
+    assert _ai_priority("U1", []) == PRIORITY_NEW_CHAT
+    assert _ai_priority("U1", chatted) == PRIORITY_NEW_CHAT
+    assert _ai_priority("U1", quoting) == PRIORITY_IN_FLOW
+    assert _ai_priority("U1", chatted, {"items": [{"sku": "A1"}]}) == PRIORITY_IN_FLOW
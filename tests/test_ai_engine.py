@@ -1,7 +1,7 @@
 import pytest
 from unittest.mock import AsyncMock, patch
 
-from tests.conftest import _make_completion_response
+from tests.conftest import _make_completion_response, _make_completion_stream
 
 
 @pytest.mark.asyncio
@@ -29,6 +29,59 @@ async def test_system_prompt_prepended():
     assert call_messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
 
 
+@pytest.mark.asyncio
+async def test_completion_tokens_charged_to_user():
+    from app.core.ai_engine import get_ai_reply
+    from app.memory.store import get_store
+
+    response = _make_completion_response("ok")
+    response.usage.prompt_tokens = 900
+    response.usage.total_tokens = 1200
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock, return_value=response):
+        await get_ai_reply("user5", "test")
+        await get_ai_reply("user5", "again")
+
+    assert list((await get_store().get_spend("user5")).values()) == [2400]
+
+
+@pytest.mark.asyncio
+async def test_stream_cut_at_leading_token_only_command():
+    from app.core.ai_engine import get_ai_reply
+    from app.memory.store import get_store
+    from app.metrics import metrics
+
+    stream = _make_completion_stream("[PRO", "FILE]", " ขอบคุณค่ะ", " ยินดีให้บริการค่ะ")
+    calls = []
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream):
+        reply = await get_ai_reply("user6", "ขอข้อมูลบริษัทค่ะ", on_control=lambda *a: calls.append(a))
+
+    assert reply == "[PROFILE]"
+    assert calls == [("[PROFILE]", True)]
+    assert (stream.consumed, stream.closed) == (2, True)  # generation stopped at the token
+    assert metrics.summary("ai.ttft_ms")["count"] == 1
+    assert metrics.summary("ai.time_to_action_ms")["count"] == 1
+    assert metrics.counter("ai.stream_cut") == 1
+    assert (await get_store().get_history("user6"))[-1] == {"role": "assistant", "content": "[PROFILE]"}
+    assert sum((await get_store().get_spend("user6")).values()) > 0  # cut streams are charged an estimate
+
+
+@pytest.mark.asyncio
+async def test_stream_reports_embedded_token_before_the_end():
+    from unittest.mock import MagicMock
+    from app.core.ai_engine import get_ai_reply
+    from app.memory.store import get_store
+
+    text = ["โถแขวนผนังมีหลายรุ่นค่ะ ส่งแคตตาล็อกให้ดูก่อนนะคะ [CATA", "LOG]", "\n\nมีรหัสสินค้า", "ที่สนใจแจ้งได้เลยค่ะ"]
+    stream = _make_completion_stream(*text, usage=MagicMock(prompt_tokens=900, total_tokens=950))
+    seen = []
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream):
+        reply = await get_ai_reply("user7", "wall hung", on_control=lambda tok, lead: seen.append((tok, lead, stream.consumed)))
+
+    assert seen == [("[CATALOG]", False, 2)]  # while two deltas were still to come
+    assert reply == "".join(text)
+    assert list((await get_store().get_spend("user7")).values()) == [950]
+
+
 @pytest.mark.asyncio
 async def test_fallback_returned_on_exception():
     from app.core.ai_engine import get_ai_reply, FALLBACK_MESSAGE
@@ -68,27 +121,45 @@ async def test_cerafield_reply_returned():
     assert mock_chat.call_count == 1
 
 
-def test_trim_history_keeps_recent_messages():
-    from app.core.ai_engine import _trim_history
+@pytest.mark.asyncio
+async def test_spec_context_kept_out_of_cached_prefix():
+    from app.core.ai_engine import get_ai_reply, SYSTEM_PROMPT
+    from app.metrics import metrics
 
-    history = [{"role": "user", "content": "a" * 40} for _ in range(10)]
-    result = _trim_history(history, max_tokens=50)
-    assert len(result) < len(history)
-    assert result == history[len(history) - len(result):]
+    response = _make_completion_response("ok")
+    response.usage.prompt_tokens = 5000
+    response.usage.prompt_tokens_details.cached_tokens = 4096
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock, return_value=response) as mock_chat:
+        await get_ai_reply("user8", "สวัสดีค่ะ")
+        await get_ai_reply("user8", "ขอสเปค CF-13022 ค่ะ")
 
+    first, second = (c[0][0] for c in mock_chat.call_args_list)
+    # The system prompt stays byte-identical whether or not a SKU was mentioned
+    assert first[0] == second[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert second[1] == first[1]
+    assert second[-2]["role"] == "system" and "CF-13022" in second[-2]["content"]
+    assert second[-1] == {"role": "user", "content": "ขอสเปค CF-13022 ค่ะ"}
+    assert metrics.counter("ai.cached_tokens") == 8192
+    assert metrics.snapshot()["gauges"]["ai.cache_hit_rate"] == pytest.approx(0.8192)
 
-def test_trim_history_keeps_all_when_within_budget():
-    from app.core.ai_engine import _trim_history
 
-    history = [
-        {"role": "user", "content": "hi"},
-        {"role": "assistant", "content": "hello"},
-    ]
-    result = _trim_history(history, max_tokens=3500)
-    assert result == history
+@pytest.mark.asyncio
+async def test_context_budget_includes_system_prompt(monkeypatch):
+    from app.config import get_settings
+    from app.core.ai_engine import get_ai_reply, SYSTEM_PROMPT
+    from app.core.tokens import count_messages
+    from app.memory.store import get_store
 
+    for i in range(4):
+        await get_store().add_message("user9", "user", f"ข้อความเก่าที่ {i} สนใจโถสุขภัณฑ์ค่ะ")
+    fixed = count_messages([{"role": "system", "content": SYSTEM_PROMPT}])
+    monkeypatch.setenv("MAX_CONTEXT_TOKENS", str(fixed + 20))
+    get_settings.cache_clear()
 
-def test_trim_history_empty():
-    from app.core.ai_engine import _trim_history
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock_chat:
+        mock_chat.return_value = _make_completion_response("ok")
+        await get_ai_reply("user9", "ขอราคาหน่อยค่ะ")
 
-    assert _trim_history([], max_tokens=3500) == []
+    messages = mock_chat.call_args[0][0]
+    assert messages == [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": "ขอราคาหน่อยค่ะ"}]
+    assert count_messages(messages) <= fixed + 20
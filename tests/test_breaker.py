@@ -0,0 +1,118 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    c = _Clock()
+    with patch("app.memory.breaker.time", MagicMock(monotonic=c)):
+        yield c
+
+
+def test_trips_after_threshold_and_backs_off(clock):
+    from app.memory.breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+    from app.metrics import metrics
+
+    b = CircuitBreaker("t", failure_threshold=3, base_backoff=1.0, max_backoff=4.0)
+    b.record_failure()
+    b.record_failure()
+    assert b.state == CLOSED and b.allow()
+    b.record_failure()
+    assert b.state == OPEN and not b.allow()
+    assert metrics.counter("breaker.t.trips") == 1
+    assert metrics.snapshot()["gauges"]["breaker.t.state"] == 2
+
+    clock.now += 1.0
+    assert b.state == HALF_OPEN
+    assert b.allow()
+    assert not b.allow()  # one probe at a time
+
+    b.record_failure()  # probe failed → backoff doubles
+    clock.now += 1.5
+    assert not b.allow()
+    clock.now += 0.5
+    assert b.allow()
+    b.record_failure()
+    clock.now += 4.0  # capped at max_backoff
+    assert b.allow()
+
+    b.record_success()
+    assert b.state == CLOSED and b.allow()
+    assert b.snapshot() == {"state": CLOSED, "trips": 1, "retry_in_s": 0.0}
+
+
+def test_failures_outside_window_do_not_trip(clock):
+    from app.memory.breaker import CLOSED, FAILURE_WINDOW, CircuitBreaker
+
+    b = CircuitBreaker("t", failure_threshold=2)
+    b.record_failure()
+    clock.now += FAILURE_WINDOW + 1
+    b.record_failure()
+    assert b.state == CLOSED
+
+
+@pytest.mark.asyncio
+async def test_store_reconnects_after_redis_outage(clock):
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    real_ping = fake.ping
+    fake.ping = AsyncMock(side_effect=ConnectionError("down"))
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(redis_url="redis://localhost")
+
+        await store.add_message("u1", "user", "during outage")  # degraded: memory
+        assert await fake.exists("conv:u1") == 0
+        fake.ping.reset_mock()
+        await store.add_message("u1", "user", "still open")
+        fake.ping.assert_not_called()  # breaker open, Redis not retried yet
+
+        fake.ping = real_ping
+        clock.now += 1.0
+        await store.add_message("u1", "user", "recovered")
+        assert await store.get_history("u1") == [{"role": "user", "content": "recovered"}]
+        assert store._breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_operation_errors_trip_breaker(clock):
+    from app.memory.store import ConversationStore
+
+    mock_redis = MagicMock()
+    mock_redis.ping = AsyncMock()
+    mock_redis.pipeline.return_value.execute = AsyncMock(side_effect=TimeoutError())
+    with patch("redis.asyncio.from_url", return_value=mock_redis):
+        store = ConversationStore(redis_url="redis://localhost")
+        for _ in range(3):
+            assert await store.get_history("u1") == []
+        assert store._breaker.state == "open"
+        await store.get_history("u1")
+        assert mock_redis.pipeline.return_value.execute.call_count == 3
+
+
+def test_health_reports_breaker():
+    import time
+    from fastapi.testclient import TestClient
+    import app.api.health as health
+    import app.memory.store as st
+
+    st._store = st.ConversationStore(redis_url="redis://localhost")
+    # Serve the OpenAI / LINE checks from cache; the redis field is added live
+    health._cache.update(ts=time.monotonic(), result={"http_status": 200, "body": {"status": "ok"}})
+    try:
+        from main import app
+        with TestClient(app) as c:
+            body = c.get("/health").json()
+    finally:
+        health._cache.update(ts=0.0, result=None)
+
+    assert body == {"status": "ok", "redis": {"state": "closed", "trips": 0, "retry_in_s": 0.0}}
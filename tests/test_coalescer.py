@@ -0,0 +1,106 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+
+def _recorder():
+    calls = []
+
+    async def handler(user_id, text, reply_token):
+        calls.append((user_id, text, reply_token))
+
+    return calls, handler
+
+
+@pytest.mark.asyncio
+async def test_burst_merged_into_one_turn_on_newest_token():
+    from app.ingress.coalescer import BurstCoalescer
+
+    calls, handler = _recorder()
+    c = BurstCoalescer(handler, window_ms=30)
+
+    async def typed(text, token, delay):
+        await asyncio.sleep(delay)
+        await c.offer("u1", text, token)
+
+    await asyncio.gather(
+        typed("สวัสดีค่ะ", "t1", 0),
+        typed("สนใจ CF-13022", "t2", 0.01),
+        typed("100 ชิ้น", "t3", 0.02),
+    )
+
+    assert calls == [("u1", "สวัสดีค่ะ\nสนใจ CF-13022\n100 ชิ้น", "t3")]
+
+
+@pytest.mark.asyncio
+async def test_messages_outside_window_handled_separately():
+    from app.ingress.coalescer import BurstCoalescer
+
+    calls, handler = _recorder()
+    c = BurstCoalescer(handler, window_ms=10)
+
+    await c.offer("u1", "a", "t1")
+    await c.offer("u1", "b", "t2")
+
+    assert [t for _, t, _ in calls] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_users_are_not_merged_together():
+    from app.ingress.coalescer import BurstCoalescer
+
+    calls, handler = _recorder()
+    c = BurstCoalescer(handler, window_ms=20)
+    await asyncio.gather(c.offer("u1", "a", "t1"), c.offer("u2", "b", "t2"))
+
+    assert sorted(calls) == [("u1", "a", "t1"), ("u2", "b", "t2")]
+
+
+@pytest.mark.asyncio
+async def test_max_wait_caps_debounce():
+    from app.ingress.coalescer import BurstCoalescer
+
+    calls, handler = _recorder()
+    c = BurstCoalescer(handler, window_ms=40, max_wait_ms=45)
+
+    async def typed(text, delay):
+        await asyncio.sleep(delay)
+        await c.offer("u1", text, text)
+
+    # "1" would extend the window to 60 ms, but the first message may only be held 45 ms
+    await asyncio.gather(typed("0", 0), typed("1", 0.02), typed("2", 0.08))
+
+    assert [t for _, t, _ in calls] == ["0\n1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_savings_counters():
+    from app.ingress.coalescer import BurstCoalescer
+    from app.metrics import metrics
+
+    metrics.observe("ai.prompt_tokens", 5000)
+    _, handler = _recorder()
+    c = BurstCoalescer(handler, window_ms=20)
+    await asyncio.gather(c.offer("u1", "a", "t1"), c.offer("u1", "b", "t2"), c.offer("u1", "c", "t3"))
+
+    assert metrics.counter("coalesce.completions_saved") == 2
+    assert metrics.counter("coalesce.prompt_tokens_saved") == 10000
+
+
+@pytest.mark.asyncio
+async def test_form_answers_not_merged(monkeypatch):
+    monkeypatch.setenv("COALESCE_WINDOW_MS", "50")
+    from app.config import get_settings
+    get_settings.cache_clear()
+    from app.api import webhook
+    from app.memory.store import get_store
+
+    calls, handler = _recorder()
+    await get_store().set_lead_flow("u1", {"step": "name"})
+    with patch.object(webhook, "_handle_message", handler):
+        await webhook._dispatch_events([("u1", "สมศรี ใจดี", "t1"), ("u1", "081-234-5678", "t2"),
+                                        ("u2", "สวัสดีค่ะ", "t3"), ("u2", "สนใจ CF-13022", "t4")])
+
+    assert calls[:2] == [("u1", "สมศรี ใจดี", "t1"), ("u1", "081-234-5678", "t2")]
+    assert calls[2:] == [("u2", "สวัสดีค่ะ\nสนใจ CF-13022", "t4")]
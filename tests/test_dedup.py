@@ -0,0 +1,94 @@
+import json
+
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, patch
+
+
+@pytest.mark.asyncio
+async def test_repeated_event_id_dropped_in_memory():
+    from app.ingress.dedup import EventDeduplicator
+    from app.metrics import metrics
+
+    d = EventDeduplicator()
+    assert await d.claim([("e1", False), ("e2", False)]) == [True, True]
+    assert await d.claim([("e1", True), ("e3", False)]) == [False, True]
+    assert metrics.counter("dedup.dropped") == 1
+    assert metrics.counter("dedup.redeliveries") == 1
+
+
+@pytest.mark.asyncio
+async def test_duplicate_within_one_body_and_missing_id():
+    from app.ingress.dedup import EventDeduplicator
+
+    d = EventDeduplicator()
+    assert await d.claim([("e1", False), ("e1", False), ("", False), ("", False)]) == [True, False, True, True]
+
+
+@pytest.mark.asyncio
+async def test_local_set_is_bounded():
+    from app.ingress.dedup import EventDeduplicator
+
+    d = EventDeduplicator(max_entries=3)
+    for i in range(10):
+        await d.claim([(f"e{i}", False)])
+    assert len(d._seen) == 3
+    assert list(d._seen) == ["e7", "e8", "e9"]
+
+
+@pytest.mark.asyncio
+async def test_redis_claim_shared_across_instances():
+    from app.ingress.dedup import EventDeduplicator
+
+    server = fakeredis.FakeServer()
+    with patch("redis.asyncio.from_url",
+               side_effect=lambda *a, **k: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)):
+        node_a = EventDeduplicator(redis_url="redis://x")
+        node_b = EventDeduplicator(redis_url="redis://x")
+        assert await node_a.claim([("e1", False)]) == [True]
+        assert await node_b.claim([("e1", True)]) == [False]
+
+        node_c = EventDeduplicator(redis_url="redis://x")
+        await node_a.release("e1")
+        assert await node_c.claim([("e1", True)]) == [True]
+
+
+@pytest.mark.asyncio
+async def test_redis_hang_times_out_to_local_set():
+    import asyncio
+    from unittest.mock import MagicMock
+
+    from app.ingress.dedup import EventDeduplicator
+
+    async def hang():
+        await asyncio.sleep(60)
+
+    hung = MagicMock()
+    hung.pipeline.return_value.execute.side_effect = hang
+    with patch("redis.asyncio.from_url", return_value=hung):
+        dedup = EventDeduplicator(redis_url="redis://x", op_timeout_ms=20)
+        for i in range(3):
+            assert await asyncio.wait_for(dedup.claim([(f"e{i}", False)]), 1) == [True]
+        calls = hung.pipeline.call_count
+        assert await dedup.claim([("e0", True), ("e9", False)]) == [False, True]
+        assert hung.pipeline.call_count == calls  # breaker open: local set only
+
+
+def test_redelivered_webhook_not_processed_twice(mock_openai_reply, mock_line_reply):
+    from fastapi.testclient import TestClient
+    from app.config import get_settings
+    from tests.test_webhook import _signed_post, _text_event_body
+
+    first = _text_event_body(text="hi")
+    redelivery = json.loads(first)
+    redelivery["events"][0]["deliveryContext"]["isRedelivery"] = True
+    redelivery = json.dumps(redelivery).encode()
+
+    with patch("app.api.webhook._handle_message", new_callable=AsyncMock) as handle:
+        from main import app
+        with TestClient(app) as c:
+            secret = get_settings().line_channel_secret
+            assert _signed_post(c, first, secret).status_code == 200
+            assert _signed_post(c, redelivery, secret).status_code == 200
+
+    assert handle.call_count == 1
@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_different_users_run_concurrently():
+    from app.ingress.dispatcher import EventDispatcher
+
+    running = 0
+    peak = 0
+
+    async def handler(user_id, text):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.02)
+        running -= 1
+
+    d = EventDispatcher(handler, max_concurrency=10)
+    await d.dispatch([(f"u{i}", "hi") for i in range(5)])
+
+    assert peak == 5
+    assert d.active_users == 0
+
+
+@pytest.mark.asyncio
+async def test_same_user_events_keep_order():
+    from app.ingress.dispatcher import EventDispatcher
+
+    order = []
+
+    async def handler(user_id, text):
+        # Earlier messages take longer — ordering must still hold
+        await asyncio.sleep(0.03 if text == "1" else 0.001)
+        order.append((user_id, text))
+
+    d = EventDispatcher(handler, max_concurrency=10)
+    await d.dispatch([("a", "1"), ("b", "1"), ("a", "2"), ("a", "3")])
+
+    assert [t for u, t in order if u == "a"] == ["1", "2", "3"]
+
+
+@pytest.mark.asyncio
+async def test_global_concurrency_cap():
+    from app.ingress.dispatcher import EventDispatcher
+
+    running = 0
+    peak = 0
+
+    async def handler(user_id):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+
+    d = EventDispatcher(handler, max_concurrency=2)
+    await d.dispatch([(f"u{i}",) for i in range(6)])
+
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_failed_event_does_not_block_user_chain():
+    from app.ingress.dispatcher import EventDispatcher
+
+    seen = []
+
+    async def handler(user_id, text):
+        if text == "bad":
+            raise RuntimeError("boom")
+        seen.append(text)
+
+    d = EventDispatcher(handler)
+    await d.dispatch([("a", "bad"), ("a", "good")])
+
+    assert seen == ["good"]
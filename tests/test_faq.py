@@ -0,0 +1,102 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from tests.conftest import _make_completion_response
+
+
+@pytest.fixture
+def faq_on(monkeypatch):
+    monkeypatch.setenv("FAQ_ENABLED", "true")
+    from app.config import get_settings
+    get_settings.cache_clear()
+
+
+def test_detect_language():
+    from app.knowledge.faq import detect_language
+
+    assert detect_language("รับประกันกี่ปีครับ") == "th"
+    assert detect_language("How long is the warranty?") == "en"
+    assert detect_language("保修多久？") == "zh"
+    assert detect_language("") == "th"
+
+
+@pytest.mark.parametrize("text,intent", [
+    ("รับประกันกี่ปีคะ", "warranty"),
+    ("What's the WARRANTY?", "warranty"),
+    ("运费怎么算？", "shipping"),
+    ("มีบริการติดตั้งไหมครับ", "installation"),
+    ("ชำระเงินยังไงคะ", "payment"),  # keyword with sara am, which NFKC splits
+    ("Where is your showroom?", "showroom"),
+    ("สวัสดีค่ะ", "greeting"),
+    ("Hi!", "greeting"),
+])
+def test_detect_intent_matches(text, intent):
+    from app.knowledge.faq import detect_intent
+    assert detect_intent(text) == intent
+
+
+@pytest.mark.parametrize("text", [
+    "CF-12014 รับประกันกี่ปี",                 # SKU → needs spec context
+    "ขอราคาพร้อมค่าส่งหน่อยค่ะ",                 # price question
+    "warranty and shipping?",                 # two intents
+    "สวัสดีค่ะ สนใจโถสุขภัณฑ์ค่ะ",               # greeting plus a real question
+    "this relationship is great",             # 'ship' only inside a word
+    "รับประกัน" + "ก" * 100,                   # long message
+])
+def test_detect_intent_defers_to_llm(text):
+    from app.knowledge.faq import detect_intent
+    assert detect_intent(text) is None
+
+
+def test_answer_greeting_first_turn_only():
+    from app.knowledge.faq import answer
+
+    assert answer("greeting", "hello", []).text.startswith("Hello, welcome to CERAFIELD")
+    assert answer("greeting", "hello", [{"role": "user", "content": "x"}]) is None
+
+
+def test_answer_payment_needs_customer_type():
+    from app.knowledge.faq import answer
+
+    assert answer("payment", "ชำระเงินยังไงคะ", []) is None
+    history = [{"role": "user", "content": "ใช้ในโครงการคอนโดค่ะ"}]
+    assert "มัดจำ 40%" in answer("payment", "ชำระเงินยังไงคะ", history).text
+    assert answer("payment", "How do I pay by card? It's for my home", []).text.startswith("Full payment")
+
+
+@pytest.mark.asyncio
+async def test_faq_hit_skips_completion_and_records_turn(faq_on):
+    from app.core.ai_engine import get_ai_reply
+    from app.knowledge.faq import answer
+    from app.memory.store import get_store
+    from app.metrics import metrics
+
+    metrics.observe("ai.completion_ms", 1200)
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock_create:
+        reply = await get_ai_reply("ufaq", "รับประกันกี่ปีคะ")
+
+    mock_create.assert_not_called()
+    assert reply == answer("warranty", "รับประกันกี่ปีคะ", []).text
+    history = await get_store().get_history("ufaq")
+    assert history == [
+        {"role": "user", "content": "รับประกันกี่ปีคะ"},
+        {"role": "assistant", "content": reply},
+    ]
+    assert metrics.counter("faq.hits") == 1
+    assert metrics.counter("faq.latency_saved_ms") == 1200
+    assert metrics.snapshot()["gauges"]["faq.hit_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_faq_miss_goes_to_llm(faq_on):
+    from app.core.ai_engine import get_ai_reply
+    from app.metrics import metrics
+
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock_create:
+        mock_create.return_value = _make_completion_response("จากโมเดล")
+        assert await get_ai_reply("ufaq2", "สวัสดีค่ะ") != "จากโมเดล"  # first greeting: canned
+        assert await get_ai_reply("ufaq2", "สวัสดีค่ะ") == "จากโมเดล"  # repeat greeting: LLM
+
+    mock_create.assert_called_once()
+    assert metrics.counter("faq.misses") == 1
+    assert metrics.snapshot()["gauges"]["faq.hit_rate"] == 0.5
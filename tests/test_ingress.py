@@ -0,0 +1,138 @@
+import asyncio
+
+import fakeredis
+import pytest
+from unittest.mock import AsyncMock, patch
+
+
+async def _drain(pool, queue, timeout: float = 2.0):
+    """Wait until the queue has nothing ready or pending."""
+    deadline = asyncio.get_running_loop().time() + timeout
+    while await queue.depth() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_memory_queue_worker_handles_and_acks():
+    from app.ingress.queue import MemoryEventQueue
+    from app.ingress.worker import WorkerPool
+
+    queue = MemoryEventQueue()
+    seen = []
+
+    async def handler(payload, last):
+        seen.append(payload["text"])
+
+    pool = WorkerPool(queue, handler, concurrency=2)
+    pool.start()
+    await queue.enqueue({"text": "a"})
+    await queue.enqueue({"text": "b"})
+    await _drain(pool, queue)
+    await pool.stop()
+
+    assert sorted(seen) == ["a", "b"]
+    assert await queue.depth() == 0
+
+
+@pytest.mark.asyncio
+async def test_failing_event_retried_then_dead_lettered():
+    from app.ingress.queue import MemoryEventQueue
+    from app.ingress.worker import WorkerPool
+
+    queue = MemoryEventQueue()
+    handler = AsyncMock(side_effect=RuntimeError("boom"))
+
+    pool = WorkerPool(queue, handler, concurrency=1, max_attempts=3, base_backoff=0.01)
+    pool.start()
+    await queue.enqueue({"text": "x"})
+    await _drain(pool, queue)
+    await pool.stop()
+
+    assert handler.call_count == 3
+    dead = await queue.dead_letters()
+    assert dead == [{"payload": {"text": "x"}, "attempts": 2, "error": "RuntimeError"}]
+
+
+@pytest.mark.asyncio
+async def test_redis_stream_queue_roundtrip_and_reclaim():
+    from app.ingress.queue import RedisStreamQueue
+
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch("redis.asyncio.from_url", return_value=fake):
+        queue = RedisStreamQueue("redis://localhost", "test:events", claim_idle_ms=0)
+
+        await queue.enqueue({"user_id": "u1", "text": "สวัสดี"})
+        event = await queue.consume("crashed-worker", block_ms=10)
+        assert event.payload == {"user_id": "u1", "text": "สวัสดี"}
+
+        # consumer died without acking — another consumer reclaims the entry
+        queue._last_claim = 0.0
+        reclaimed = await queue.consume("worker-2", block_ms=10)
+        assert reclaimed.id == event.id
+
+        await queue.retry(reclaimed, delay=0)
+        retried = await queue.consume("worker-2", block_ms=10)
+        assert retried.attempts == 1
+
+        await queue.dead_letter(retried, "RuntimeError")
+        assert await queue.depth() == 0
+        dead = await queue.dead_letters()
+        assert dead[0]["payload"]["text"] == "สวัสดี"
+        assert dead[0]["error"] == "RuntimeError"
+
+
+def test_callback_enqueues_in_queue_mode(monkeypatch, mock_line_reply):
+    from fastapi.testclient import TestClient
+    from tests.test_webhook import _signed_post, _text_event_body
+
+    monkeypatch.setenv("INGRESS_MODE", "queue")
+    from app.config import get_settings
+    get_settings.cache_clear()
+
+    handled = asyncio.Event()
+    seen = []
+
+    async def fake_handle(user_id, text, reply_token, last_attempt=True, event=None):
+        seen.append((user_id, text))
+        handled.set()
+
+    with patch("app.api.webhook._handle_message", side_effect=fake_handle):
+        from main import app
+        with TestClient(app) as c:
+            resp = _signed_post(c, _text_event_body(text="hi"), get_settings().line_channel_secret)
+            assert resp.status_code == 200
+            c.portal.call(asyncio.wait_for, handled.wait(), 2.0)
+
+    assert seen == [("U12345678", "hi")]
+
+
+@pytest.mark.asyncio
+async def test_queued_event_raises_until_last_attempt(mock_line_reply):
+    from app.api.webhook import handle_queued_event
+    from app.core.ai_engine import FALLBACK_MESSAGE
+    from app.memory.store import get_store
+
+    payload = {"user_id": "Uretry", "text": "สวัสดีค่ะ", "reply_token": "tok"}
+    down = AsyncMock(side_effect=RuntimeError("down"))
+    with patch("app.core.ai_engine.create_completion", down), patch("app.core.ai_engine.stream_completion", down):
+        with pytest.raises(RuntimeError):
+            await handle_queued_event(payload, last=False)
+        mock_line_reply.assert_not_called()
+        assert await get_store().get_history("Uretry") == []  # nothing stored: the retry starts clean
+
+        await handle_queued_event(payload, last=True)
+    mock_line_reply.assert_called_once_with("tok", FALLBACK_MESSAGE)
+    assert await get_store().get_daily_usage("Uretry") == 1  # the retry was not counted again
+
+
+@pytest.mark.asyncio
+async def test_queued_event_not_retried_after_reply_stored(mock_openai_reply, mock_line_reply):
+    from app.api.webhook import handle_queued_event
+    from app.memory.store import get_store
+
+    payload = {"user_id": "Ustored", "text": "สวัสดีค่ะ", "reply_token": "tok"}
+    mock_line_reply.side_effect = [RuntimeError("LINE down"), None]
+    await handle_queued_event(payload, last=False)  # handled here: a retry would store and charge twice
+
+    assert len(await get_store().get_history("Ustored")) == 2
+    assert mock_line_reply.call_args_list[-1][0][1].startswith("Sorry")
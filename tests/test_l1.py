@@ -0,0 +1,138 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+import pytest
+from unittest.mock import patch
+
+
+async def _until(cond, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not cond():
+        assert asyncio.get_running_loop().time() < deadline, "condition not reached"
+        await asyncio.sleep(0.01)
+
+
+@asynccontextmanager
+async def two_instances():
+    """Two stores (two app instances) sharing one fake Redis server."""
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    server = fakeredis.FakeServer()
+    with patch("redis.asyncio.from_url",
+               side_effect=lambda *a, **k: fakeredis.FakeAsyncRedis(server=server)):
+        a = ConversationStore(redis_url="redis://localhost", l1_users=100)
+        b = ConversationStore(redis_url="redis://localhost", l1_users=100)
+        try:
+            for store in (a, b):
+                await store.get_history("warmup")
+                await _until(lambda: store._l1.listening)
+            yield a, b
+        finally:
+            await a.close()
+            await b.close()
+
+
+@pytest.mark.asyncio
+async def test_reads_served_from_l1_after_fill():
+    from app.metrics import metrics
+
+    async with two_instances() as (a, _):
+        await a.add_message("u1", "user", "hello")
+        await a.set_quote_flow("u1", {"step": "retail_name"})
+
+        assert await a.get_history("u1") == [{"role": "user", "content": "hello"}]
+        assert await a.get_quote_flow("u1") == {"step": "retail_name"}
+        hits = metrics.counter("l1.hits")
+        with patch.object(a._redis, "pipeline", side_effect=AssertionError("should not reach Redis")):
+            assert await a.get_history("u1") == [{"role": "user", "content": "hello"}]
+            flow = await a.get_quote_flow("u1")
+            flow["step"] = "mutated"  # callers get a copy
+            assert await a.get_quote_flow("u1") == {"step": "retail_name"}
+        assert metrics.counter("l1.hits") == hits + 3
+
+
+@pytest.mark.asyncio
+async def test_write_through_keeps_own_copy_current():
+    async with two_instances() as (a, _):
+        await a.get_history("u1")
+        await a.add_message("u1", "user", "one")
+        await a.add_message("u1", "assistant", "two")
+        with patch.object(a._redis, "pipeline", side_effect=AssertionError("should not reach Redis")):
+            assert [m["content"] for m in await a.get_history("u1")] == ["one", "two"]
+
+
+@pytest.mark.asyncio
+async def test_write_on_other_instance_invalidates():
+    from app.metrics import metrics
+
+    async with two_instances() as (a, b):
+        await a.add_message("u1", "user", "from a")
+        assert len(await a.get_history("u1")) == 1
+
+        await b.add_message("u1", "assistant", "from b")
+        await b.set_lead_flow("u1", {"step": "collect"})
+        await _until(lambda: metrics.counter("l1.invalidations") >= 1)
+
+        assert [m["content"] for m in await a.get_history("u1")] == ["from a", "from b"]
+        assert await a.get_lead_flow("u1") == {"step": "collect"}
+
+
+@pytest.mark.asyncio
+async def test_session_skips_payload_when_current_and_is_consistent_when_not():
+    async with two_instances() as (a, b):
+        await a.add_message("u1", "user", "hi")
+        first = await a.get_session("u1", daily_limit=10)  # fills every field
+        assert first.history == [{"role": "user", "content": "hi"}]
+
+        replies = []
+        real_eval = a._redis.eval
+
+        async def recording_eval(*args):
+            replies.append(await real_eval(*args))
+            return replies[-1]
+
+        with patch.object(a._redis, "eval", recording_eval):
+            second = await a.get_session("u1", daily_limit=10)
+        assert len(replies[0]) == 4  # usage, tokens, allowed, version — no history / flows transferred
+        assert (second.usage, second.history) == (2, first.history)
+
+        # Another instance writes; even before the pub/sub message lands, get_session sees it
+        await b.add_message("u1", "assistant", "hello")
+        third = await a.get_session("u1", daily_limit=10)
+        assert third.usage == 3
+        assert [m["content"] for m in third.history] == ["hi", "hello"]
+
+
+@pytest.mark.asyncio
+async def test_entry_does_not_outlive_redis_key_ttl():
+    async with two_instances() as (a, _):
+        await a.add_message("u1", "user", "hi")
+        await a.set_quote_flow("u1", {"step": "retail_name"})
+        await a._redis.pexpire("qflow:u1", 50)  # e.g. FLOW_TTL running out; no version bump
+        assert (await a.get_session("u1", daily_limit=10)).quote_flow == {"step": "retail_name"}
+
+        await asyncio.sleep(0.1)
+        assert (await a.get_session("u1", daily_limit=10)).quote_flow is None
+        assert await a.get_quote_flow("u1") is None
+
+
+@pytest.mark.asyncio
+async def test_no_version_bump_without_l1():
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    server = fakeredis.FakeServer()
+    with patch("redis.asyncio.from_url",
+               side_effect=lambda *a, **k: fakeredis.FakeAsyncRedis(server=server)):
+        store = ConversationStore(redis_url="redis://localhost")
+        try:
+            await store.add_message("u1", "user", "hello")
+            await store.set_quote_flow("u1", {"step": "retail_name"})
+            assert await store._redis.llen("conv:u1") == 1
+            assert await store.fold_history("u1", None, {"text": "s"}, [{"role": "user", "content": "hello"}]) == 1
+            assert await store._redis.exists("summary:u1")
+            await store.clear("u1")
+            assert await store._redis.get("ver:u1") is None
+        finally:
+            await store.close()
@@ -123,6 +123,7 @@ class TestNotifyAdmin:
              patch("app.services.lead_flow_service.asyncio.create_task") as mock_task, \
              patch("app.services.line_service.push_text", new_callable=AsyncMock):
             mock_settings.return_value.tony_line_user_id = "Uabc123"
+            mock_task.side_effect = lambda coro: coro.close()  # nothing runs it: do not leak the coroutine
             _notify_admin("user456", "lead info")
             mock_task.assert_called_once()
 
@@ -130,3 +131,30 @@ class TestNotifyAdmin:
         with patch("app.config.get_settings", side_effect=Exception("config error")):
             # Should not raise
             _notify_admin("user123", "lead info")
+
+
+class TestSessionSnapshot:
+    @pytest.mark.asyncio
+    async def test_uses_prefetched_state_without_store_read(self):
+        from app.memory.store import Session
+
+        store = make_store(lead_state={"step": "collect"})
+        reply = await handle_lead_flow("user123", "hello", store, Session(usage=1, allowed=True))
+        assert reply is None
+        store.get_lead_flow.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_uses_prefetched_collect_step_without_store_read(self):
+        from app.memory.store import Session
+
+        store = make_store(lead_state=None)
+        session = Session(usage=1, allowed=True, lead_flow={"step": "collect"})
+        with patch("app.services.lead_flow_service._save_lead") as mock_save, \
+             patch("app.services.lead_flow_service._notify_admin"):
+            reply = await handle_lead_flow("user123", "ชื่อ: สมชาย 0812345678", store, session)
+
+        assert isinstance(reply, LeadReply)
+        assert "ขอบคุณ" in reply.text
+        mock_save.assert_called_once_with("user123", "ชื่อ: สมชาย 0812345678")
+        store.get_lead_flow.assert_not_called()
+        store.clear_lead_flow.assert_called_once_with("user123")
@@ -0,0 +1,127 @@
+import asyncio
+
+import fakeredis
+import pytest
+from unittest.mock import patch
+
+
+async def _critical_section(mailbox, user_id, log, tag, delay=0.01):
+    async with mailbox.hold(user_id):
+        log.append(("start", tag))
+        await asyncio.sleep(delay)
+        log.append(("end", tag))
+
+
+@pytest.mark.asyncio
+async def test_same_user_serialized_and_evicted():
+    from app.ingress.mailbox import UserMailbox
+
+    mailbox = UserMailbox()
+    log = []
+    await asyncio.gather(*(_critical_section(mailbox, "u1", log, i) for i in range(3)))
+
+    assert log == [("start", 0), ("end", 0), ("start", 1), ("end", 1), ("start", 2), ("end", 2)]
+    assert mailbox.active_users == 0
+    assert mailbox.queue_depth == 0
+
+
+@pytest.mark.asyncio
+async def test_different_users_overlap():
+    from app.ingress.mailbox import UserMailbox
+
+    mailbox = UserMailbox()
+    log = []
+    await asyncio.gather(
+        _critical_section(mailbox, "u1", log, "a"),
+        _critical_section(mailbox, "u2", log, "b"),
+    )
+
+    assert log[:2] == [("start", "a"), ("start", "b")]
+
+
+@pytest.mark.asyncio
+async def test_wait_metrics_recorded():
+    from app.ingress.mailbox import UserMailbox
+    from app.metrics import metrics
+
+    mailbox = UserMailbox()
+    await asyncio.gather(*(_critical_section(mailbox, "u1", [], i, delay=0.02) for i in range(2)))
+
+    wait = metrics.summary("mailbox.wait_ms")
+    assert wait["count"] == 2
+    assert wait["max"] >= 15
+    assert metrics.snapshot()["gauges"]["mailbox.queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak():
+    from app.ingress.mailbox import UserMailbox
+
+    mailbox = UserMailbox()
+    holder = asyncio.create_task(_critical_section(mailbox, "u1", [], "a", delay=0.05))
+    await asyncio.sleep(0)
+    waiter = asyncio.create_task(_critical_section(mailbox, "u1", [], "b"))
+    await asyncio.sleep(0.01)
+    waiter.cancel()
+    await asyncio.gather(holder, waiter, return_exceptions=True)
+
+    assert mailbox.queue_depth == 0
+    assert mailbox.active_users == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_lease_serializes_across_instances():
+    from app.ingress.mailbox import UserMailbox
+
+    server = fakeredis.FakeServer()
+    log = []
+    with patch("redis.asyncio.from_url",
+               side_effect=lambda *a, **k: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)):
+        node_a = UserMailbox(redis_url="redis://x", poll_ms=5)
+        node_b = UserMailbox(redis_url="redis://x", poll_ms=5)
+        await asyncio.gather(
+            _critical_section(node_a, "u1", log, "a", delay=0.03),
+            _critical_section(node_b, "u1", log, "b", delay=0.03),
+        )
+        r = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        assert await r.get("lock:user:u1") is None
+
+    assert log[0][0] == "start" and log[1][0] == "end"
+    assert log[0][1] == log[1][1]
+
+
+def test_metrics_endpoint(mock_openai_reply, mock_line_reply, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app.config import get_settings
+    from app.metrics import metrics
+
+    metrics.incr("demo.counter", 3)
+    from main import app
+    with TestClient(app) as c:
+        assert c.get("/metrics").status_code == 404  # no METRICS_TOKEN: not served at all
+        monkeypatch.setenv("METRICS_TOKEN", "s3cret")
+        get_settings.cache_clear()
+        assert c.get("/metrics").status_code == 401
+        assert c.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+        resp = c.get("/metrics", headers={"Authorization": "Bearer s3cret"})
+
+    assert resp.status_code == 200
+    assert resp.json()["counters"]["demo.counter"] == 3
+
+
+@pytest.mark.asyncio
+async def test_lease_wait_timeout_raises_instead_of_running_unlocked():
+    from app.ingress.mailbox import LeaseTimeout, UserMailbox
+
+    server = fakeredis.FakeServer()
+    with patch("redis.asyncio.from_url",
+               side_effect=lambda *a, **k: fakeredis.FakeAsyncRedis(server=server, decode_responses=True)):
+        r = fakeredis.FakeAsyncRedis(server=server, decode_responses=True)
+        await r.set("lock:user:u1", "other-node", px=60_000)
+        mailbox = UserMailbox(redis_url="redis://x", lease_ms=20, poll_ms=5)
+        ran = []
+        with pytest.raises(LeaseTimeout):
+            await _critical_section(mailbox, "u1", ran, "a")
+
+    assert ran == []
+    assert mailbox.queue_depth == 0 and mailbox.active_users == 0
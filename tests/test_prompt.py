@@ -0,0 +1,61 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import _make_completion_response
+
+
+def test_full_selection_is_system_prompt():
+    from app.core.prompt import MODULE_NAMES, SYSTEM_PROMPT, assemble
+
+    assert assemble(frozenset(MODULE_NAMES)) == SYSTEM_PROMPT
+
+
+def test_catalog_request_gets_no_price_tables():
+    from app.core.prompt import build_system_prompt
+
+    system, scope = build_system_prompt("ขอแคตตาล็อกหน่อยค่ะ", [{"role": "user", "content": "ขอแคตตาล็อกหน่อยค่ะ"}])
+    assert scope == "scoped"
+    assert system.startswith('You are "Sera"')
+    for kept in ("=== SAFETY RULES ===", "[CATALOG]", "[NOTIFY_LEAD]", "=== CONVERSATION FLOW ===", "=== GREETING ==="):
+        assert kept in system
+    for dropped in ("=== RETAIL PRICES", "=== BUDGET-BASED", "=== COMMON QUESTIONS ===", "4-STEP FLOW ==="):
+        assert dropped not in system
+
+
+def test_selection_follows_conversation_state():
+    from app.core.prompt import select_modules
+
+    history = [
+        {"role": "user", "content": "งานโปรเจคคอนโดค่ะ CF-13022"},
+        {"role": "assistant", "content": "CF-13022 ราคา 10,800 บาทค่ะ ต้องการจำนวนเท่าไหร่คะ?"},
+    ]
+    # A bare quantity mid-flow still needs the 4-step flow and prices
+    modules = select_modules("100 ค่ะ", history)
+    assert {"order_flow", "retail_prices", "project_prices"} <= modules
+    assert "greeting" not in modules and "budget" not in modules
+
+    assert "customer_type" in select_modules("รับประกันกี่ปีคะ", history[1:])
+    # Customer type settled in the summary: not asked again
+    modules = select_modules("รับประกันกี่ปีคะ", [], summary={"customer_type": "retail", "items": []})
+    assert modules == {"faq.warranty"}
+    assert select_modules("ต้นไม้ชนิดไหนดี", []) is None  # nothing recognised: full prompt
+
+
+@pytest.mark.asyncio
+async def test_reply_uses_scoped_prompt(monkeypatch):
+    monkeypatch.setenv("PROMPT_SCOPING", "true")
+    from app.config import get_settings
+    get_settings.cache_clear()
+    from app.core.ai_engine import get_ai_reply, SYSTEM_PROMPT
+    from app.metrics import metrics
+
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock_chat:
+        mock_chat.return_value = _make_completion_response("ok")
+        await get_ai_reply("up1", "ขอบคุณค่ะ")
+        await get_ai_reply("up1", "อยากคุยเรื่องต้นไม้")
+
+    scoped, full = (c[0][0][0]["content"] for c in mock_chat.call_args_list)
+    assert len(scoped) < len(SYSTEM_PROMPT) / 2 and "=== SPECIAL COMMANDS ===" in scoped
+    assert full == SYSTEM_PROMPT
+    assert metrics.counter("prompt.scoped") == metrics.counter("prompt.full") == 1
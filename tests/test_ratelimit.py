@@ -0,0 +1,76 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_local_bucket_allows_burst_then_refills():
+    from app.ingress.ratelimit import UserRateLimiter
+    from app.metrics import metrics
+
+    now = [1000.0]
+    clock = MagicMock(monotonic=lambda: now[0], time=time.time, perf_counter=time.perf_counter)
+    rl = UserRateLimiter(per_minute=60, burst=3)
+    with patch("app.ingress.ratelimit.time", clock):
+        assert await rl.admit(["u1", "u1", "u2", "u1", "u1"]) == [True, True, True, True, False]
+        assert await rl.admit(["u1"]) == [False]
+        now[0] += 1.0  # one token back at 60/minute
+        assert await rl.admit(["u1", "u1"]) == [True, False]
+    assert metrics.counter("ratelimit.limited") == 3
+
+
+@pytest.mark.asyncio
+async def test_disabled_and_bounded():
+    from app.ingress.ratelimit import UserRateLimiter
+
+    assert await UserRateLimiter(per_minute=0, burst=1).admit(["u1"] * 50) == [True] * 50
+    rl = UserRateLimiter(per_minute=10, burst=1, max_entries=3)
+    for i in range(10):
+        await rl.admit([f"u{i}"])
+    assert list(rl._buckets) == ["u7", "u8", "u9"]
+
+
+@pytest.mark.asyncio
+async def test_redis_bucket_shared_across_instances():
+    from app.ingress.ratelimit import UserRateLimiter
+
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    with patch("redis.asyncio.from_url", return_value=fake):
+        a = UserRateLimiter(per_minute=1, burst=3, redis_url="redis://localhost")
+        b = UserRateLimiter(per_minute=1, burst=3, redis_url="redis://localhost")
+        assert await a.admit(["u1", "u1"]) == [True, True]
+        assert await b.admit(["u1", "u2", "u1"]) == [True, True, False]
+    assert 0 < await fake.ttl("rl:u1") <= 181
+
+
+@pytest.mark.asyncio
+async def test_redis_down_falls_back_to_local_buckets():
+    from app.ingress.ratelimit import UserRateLimiter
+
+    broken = MagicMock()
+    broken.eval.side_effect = ConnectionError("down")
+    with patch("redis.asyncio.from_url", return_value=broken):
+        rl = UserRateLimiter(per_minute=1, burst=1, redis_url="redis://localhost")
+        assert await rl.admit(["u1", "u1"]) == [True, False]
+
+
+@pytest.mark.asyncio
+async def test_redis_hang_times_out_then_breaker_skips_it():
+    import asyncio
+
+    from app.ingress.ratelimit import UserRateLimiter
+
+    async def hang(*args):
+        await asyncio.sleep(60)
+
+    hung = MagicMock()
+    hung.eval.side_effect = hang
+    with patch("redis.asyncio.from_url", return_value=hung):
+        rl = UserRateLimiter(per_minute=1, burst=1, redis_url="redis://localhost", op_timeout_ms=20)
+        for _ in range(3):
+            assert await asyncio.wait_for(rl.admit(["u1"]), 1) in ([True], [False])
+        calls = hung.eval.call_count
+        assert await rl.admit(["u2"]) == [True]
+        assert hung.eval.call_count == calls  # breaker open: local buckets only
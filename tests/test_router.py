@@ -0,0 +1,115 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import _make_completion_response
+
+
+@pytest.mark.parametrize("message,history,tier", [
+    ("ขอบคุณค่ะ", [], "light"),
+    ("CF-13022 ราคาเท่าไหร่คะ", [], "standard"),
+    ("ขอราคา CF-13022 CF-2495 และ CF-15001 ค่ะ", [], "strong"),
+    ("ขอบคุณค่ะ", [{"role": "user", "content": "CF-13022 ค่ะ"}], "standard"),  # mid-order
+    ("ไม่เอาเพิ่มค่ะ", [
+        {"role": "user", "content": "CF-13022 2 ชิ้นค่ะ"},
+        {"role": "assistant", "content": "CF-13022 จำนวน 2 ชิ้น รับทราบค่ะ\n\nมีสินค้าอื่นที่ต้องการเพิ่มไหมคะ เช่น"},
+    ], "strong"),  # Step 3 summary due
+])
+def test_choose_tier(message, history, tier):
+    from app.core import router
+
+    history = history + [{"role": "user", "content": message}]
+    assert router.choose_tier(router.extract_features(message, history)) == tier
+
+
+def test_mispriced_checks_catalog():
+    from app.core.router import mispriced
+
+    ok = (
+        "ทวนรายการนะคะ\n"
+        "- CF-13022 x100 — ราคาโปรเจค 5,880 บาท/ชิ้น รวม 588,000 บาท (ยังไม่รวม VAT 7%)\n"
+        "CF-15001 สั่ง 100+ ชิ้น มีให้เลือกสีค่ะ White (9,580/ชิ้น) หรือ Matt Black/Gray/White (20,880/ชิ้น)\n"
+        "แนะนำ CF-2495 (8,580), CF-2507 (8,580), CF-2493 (8,800) ค่ะ"
+    )
+    assert mispriced(ok) == []
+    assert mispriced("CF-13022 ราคา 9,990 บาทค่ะ\nCF-99999 ราคา 1,000 บาท") == ["CF-13022 9,990", "CF-99999 1,000"]
+
+
+@pytest.mark.parametrize("line", [
+    "CF-13022 จำนวน 1,000 ชิ้น ราคาโปรเจค 5,880",  # quantity before the unit price
+    "CF-13022 x2 รวม 21,600 บาท",  # total only
+    "CF-13022 x 1,200 pcs total 7,056,000",
+])
+def test_mispriced_skips_quantities_and_totals(line):
+    from app.core.router import mispriced
+
+    assert mispriced(line) == []
+    assert mispriced(line.replace("5,880", "5,990")) == ([] if "5,880" not in line else ["CF-13022 5,990"])
+
+
+def test_completion_model_defaults_to_setting():
+    from app.services.openai_service import _completion_kwargs
+
+    assert _completion_kwargs([])["model"] == "gpt-4o-mini"
+    assert _completion_kwargs([], "gpt-4.1")["model"] == "gpt-4.1"
+
+
+@pytest.mark.asyncio
+async def test_mispriced_reply_escalates_to_stronger_model(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL_LIGHT", "gpt-4.1-nano")
+    monkeypatch.setenv("OPENAI_MODEL_STRONG", "gpt-4.1")
+    from app.config import get_settings
+    get_settings.cache_clear()
+    from app.core.ai_engine import get_ai_reply
+    from app.metrics import metrics
+
+    wrong = _make_completion_response("CF-13022 ราคา 9,990 บาทค่ะ")
+    right = _make_completion_response("CF-13022 ราคา 10,800 บาทค่ะ")
+    for response in (wrong, right):
+        response.usage.prompt_tokens = 1000
+        response.usage.prompt_tokens_details.cached_tokens = 0
+        response.usage.completion_tokens = 20
+        response.usage.total_tokens = 1020
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock, side_effect=[wrong, right]) as mock_chat:
+        reply = await get_ai_reply("ur1", "ราคาเท่าไหร่คะ")
+
+    assert reply == "CF-13022 ราคา 10,800 บาทค่ะ"
+    assert [c.kwargs["model"] for c in mock_chat.call_args_list] == ["gpt-4.1-nano", "gpt-4o-mini"]
+    assert metrics.counter("router.tier.light") == metrics.counter("router.escalations.light") == 1
+    assert metrics.counter("router.light.cost_usd") == pytest.approx((1000 * 0.10 + 20 * 0.40) / 1e6)
+    assert metrics.counter("router.standard.completions") == 1
+    assert metrics.summary("router.standard.latency_ms")["count"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("first, held_runs", [
+    ("CF-13022 ราคา 9,990 บาทค่ะ ส่งแคตตาล็อกให้ค่ะ [CATALOG]", False),  # rejected: its actions are dropped
+    ("CF-13022 ราคา 10,800 บาทค่ะ ส่งแคตตาล็อกให้ค่ะ [CATALOG]", True),  # passes: started after the check
+])
+async def test_early_actions_held_until_price_check(monkeypatch, first, held_runs):
+    monkeypatch.setenv("OPENAI_MODEL_LIGHT", "gpt-4.1-nano")
+    from app.config import get_settings
+    get_settings.cache_clear()
+    from app.core.ai_engine import get_ai_reply
+    from tests.conftest import _make_completion_stream
+
+    right = _make_completion_response("CF-13022 ราคา 10,800 บาทค่ะ")
+    stream = _make_completion_stream(*first.split(" "), usage=right.usage)
+    events = []
+    original = type(stream).__aiter__
+
+    async def tracked(self):
+        async for delta in original(self):
+            events.append("delta")
+            yield delta + " "
+
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream), \
+         patch.object(type(stream), "__aiter__", tracked), \
+         patch("app.core.ai_engine.create_completion", new_callable=AsyncMock, return_value=right):
+        reply = await get_ai_reply("ur2", "ราคาเท่าไหร่คะ", on_control=lambda tok, lead: events.append(tok))
+
+    assert events.count("[CATALOG]") == int(held_runs)
+    if held_runs:
+        assert events[-1] == "[CATALOG]" and "[CATALOG]" in reply
+    else:
+        assert reply == "CF-13022 ราคา 10,800 บาทค่ะ"
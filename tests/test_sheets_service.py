@@ -36,3 +36,31 @@ async def test_log_line_message_noop_without_client(monkeypatch):
     # Should not raise
     await sheets_service.log_line_message("U123", "hello", "world", 1000)
     sheets_service._get_client.cache_clear()
+
+
+def test_log_ids_shared_across_workers_via_redis(monkeypatch):
+    import datetime
+    import fakeredis
+    from app.services import sheets_service
+
+    fake = fakeredis.FakeRedis()
+    monkeypatch.setattr(sheets_service, "_get_redis", lambda: fake)
+    now = datetime.datetime(2026, 3, 2, 10, 0)
+    # Every worker increments the same per-day counter, so ids never collide
+    ids = [sheets_service._next_log_id(now) for _ in range(3)]
+    assert ids == ["BOT-20260302-0001", "BOT-20260302-0002", "BOT-20260302-0003"]
+    assert sheets_service._next_log_id(now + datetime.timedelta(days=1)) == "BOT-20260303-0001"
+    assert 0 < fake.ttl("logid:20260302") <= sheets_service.LOG_ID_TTL
+
+
+def test_log_id_falls_back_to_pid_when_redis_down(monkeypatch):
+    import datetime
+    import os
+    from unittest.mock import MagicMock
+    from app.services import sheets_service
+
+    broken = MagicMock()
+    broken.pipeline.return_value.execute.side_effect = ConnectionError("down")
+    monkeypatch.setattr(sheets_service, "_get_redis", lambda: broken)
+    log_id = sheets_service._next_log_id(datetime.datetime(2026, 3, 2))
+    assert log_id.startswith(f"BOT-20260302-P{os.getpid()}-")
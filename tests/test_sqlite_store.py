@@ -0,0 +1,200 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "store.db")
+
+
+@pytest.mark.asyncio
+async def test_history_flows_and_usage(db_path):
+    from app.memory.sqlite import SqliteStore
+
+    store = SqliteStore(db_path, max_history=2)
+    try:
+        for text in ("Hello", "สวัสดีค่ะ", "Bye"):
+            await store.add_message("u1", "user", text)
+        assert [m["content"] for m in await store.get_history("u1")] == ["สวัสดีค่ะ", "Bye"]
+
+        await store.set_quote_flow("u1", {"step": "retail_name"})
+        await store.set_lead_flow("u1", {"step": "collect"})
+        await store.clear_lead_flow("u1")
+        assert await store.get_quote_flow("u1") == {"step": "retail_name"}
+        assert await store.get_lead_flow("u1") is None
+
+        s = await store.get_session("u1", daily_limit=2)
+        assert (s.usage, s.allowed, s.quote_flow, s.lead_flow) == (1, True, {"step": "retail_name"}, None)
+        assert [m["content"] for m in s.history] == ["สวัสดีค่ะ", "Bye"]
+        assert (await store.get_session("u1", daily_limit=2)).allowed
+        blocked = await store.get_session("u1", daily_limit=2)
+        assert (blocked.usage, blocked.allowed) == (2, False)
+        assert await store.increment_daily_usage("u1") == 3
+
+        await store.clear("u1")
+        assert await store.get_history("u1") == []
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_fold_history(db_path):
+    from app.memory.sqlite import SqliteStore
+
+    store = SqliteStore(db_path, max_history=6)
+    try:
+        for i in range(6):
+            await store.add_message("u1", "user", f"m{i}")
+        folded = (await store.get_history("u1"))[:4]
+        await store.add_message("u1", "user", "m6")  # trims m0
+
+        assert await store.fold_history("u1", None, {"messages": 4}, folded) == 3
+        assert [m["content"] for m in await store.get_history("u1")] == ["m4", "m5", "m6"]
+        assert (await store.get_session("u1")).summary == {"messages": 4}
+        assert await store.fold_history("u1", None, {"messages": 1}, folded) is None
+        # Already folded: nothing left at the head, so the summary stays as it is
+        assert await store.fold_history("u1", {"messages": 4}, {"messages": 8}, folded) == 0
+        assert await store.get_summary("u1") == {"messages": 4}
+
+        await store.clear("u1")
+        assert await store.get_summary("u1") is None
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_state_survives_restart_in_wal_mode(db_path):
+    from app.memory.sqlite import SqliteStore
+
+    store = SqliteStore(db_path)
+    await store.add_message("u1", "user", "สนใจ CF-13022 ค่ะ")
+    await store.set_quote_flow("u1", {"step": "retail_address"})
+    await store.increment_daily_usage("u1")
+    await store.close()
+
+    store = SqliteStore(db_path)
+    try:
+        assert await store.get_history("u1") == [{"role": "user", "content": "สนใจ CF-13022 ค่ะ"}]
+        assert await store.get_quote_flow("u1") == {"step": "retail_address"}
+        assert await store.get_daily_usage("u1") == 1
+    finally:
+        await store.close()
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_writes_are_group_committed(db_path):
+    from app.memory.sqlite import SqliteStore
+    from app.metrics import metrics
+
+    store = SqliteStore(db_path, max_history=50)
+    try:
+        await asyncio.gather(*(store.add_message(f"u{i % 5}", "user", f"m{i}") for i in range(100)))
+        assert [len(await store.get_history(f"u{i}")) for i in range(5)] == [20] * 5
+        batches = metrics.summary("sqlite.batch_size")
+        assert batches["count"] < 100  # fewer commits than writes
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_expired_rows_hidden_then_swept(db_path):
+    import time
+    from unittest.mock import MagicMock, patch
+    import app.memory.sqlite as sq
+    from app.memory.local import CONV_TTL, FLOW_TTL
+
+    store = sq.SqliteStore(db_path)
+    try:
+        await store.add_message("u1", "user", "old")
+        await store.set_quote_flow("u1", {"step": "retail_name"})
+        later = time.time() + max(CONV_TTL, FLOW_TTL) + 1
+        clock = MagicMock(time=lambda: later, monotonic=time.monotonic, perf_counter=time.perf_counter)
+        with patch("app.memory.sqlite.time", clock):
+            assert await store.get_history("u1") == []
+            assert await store.get_quote_flow("u1") is None
+            store._next_sweep = 0  # due now
+            await store.add_message("u2", "user", "new")
+        rows = store._rconn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        flows = store._rconn.execute("SELECT COUNT(*) FROM flows").fetchone()[0]
+        assert (rows, flows) == (1, 0)
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_token_budget_and_spend(db_path):
+    from app.memory.quota import bangkok_day
+    from app.memory.sqlite import SqliteStore
+
+    # A database from before token budgets: the usage table gains its column on open
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("CREATE TABLE usage (day TEXT NOT NULL, user_id TEXT NOT NULL, count INTEGER NOT NULL, "
+                     "expires REAL NOT NULL, PRIMARY KEY (day, user_id))")
+    store = SqliteStore(db_path)
+    try:
+        assert (await store.get_session("u1", daily_limit=10, token_limit=500)).allowed
+        assert await store.record_tokens("u1", 300) == 300
+        assert await store.record_tokens("u1", 300) == 600
+        blocked = await store.get_session("u1", daily_limit=10, token_limit=500)
+        assert (blocked.allowed, blocked.blocked_by, blocked.usage) == (False, "tokens", 1)
+        assert await store.get_spend("u1") == {bangkok_day(): 600}
+        assert await store.get_spend("u2", days=30) == {}
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_reads_run_off_the_event_loop(db_path):
+    import threading
+
+    from app.memory.sqlite import SqliteStore
+
+    store = SqliteStore(db_path)
+    threads = []
+    history = store._history
+    store._history = lambda conn, user_id: threads.append(threading.current_thread().name) or history(conn, user_id)
+    try:
+        await store.add_message("u1", "user", "hi")
+        assert await store.get_history("u1") == [{"role": "user", "content": "hi"}]
+        assert threads[0].startswith("sqlite-reader")
+    finally:
+        await store.close()
+
+
+@pytest.mark.asyncio
+async def test_writer_death_fails_queued_ops(db_path):
+    from unittest.mock import patch
+
+    from app.memory.sqlite import SqliteStore, WriterStopped
+
+    store = SqliteStore(db_path)
+    try:
+        with patch.object(store, "_run_batch", side_effect=MemoryError):
+            results = await asyncio.wait_for(asyncio.gather(
+                *(store.add_message("u1", "user", str(i)) for i in range(3)), return_exceptions=True
+            ), timeout=5)
+        assert all(isinstance(r, WriterStopped) for r in results)
+        assert store._writer.done()
+
+        await store.add_message("u1", "user", "after")  # a new writer takes over
+        assert [m["content"] for m in await store.get_history("u1")] == ["after"]
+    finally:
+        await store.close()
+
+
+def test_get_store_selects_sqlite(monkeypatch, tmp_path):
+    monkeypatch.setenv("STORE_BACKEND", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "data" / "clawbot.db"))
+    from app.config import get_settings
+    from app.memory.sqlite import SqliteStore
+    from app.memory.store import get_store, redis_health
+
+    get_settings.cache_clear()
+    store = get_store()
+    assert isinstance(store, SqliteStore)
+    assert redis_health() is None
+    asyncio.run(store.close())
@@ -1,4 +1,3 @@
-import datetime
 import pytest
 from unittest.mock import AsyncMock, patch
 
@@ -43,34 +42,48 @@ async def test_clear():
 
 @pytest.mark.asyncio
 async def test_redis_add_get_and_clear():
+    import fakeredis
     from app.memory.store import ConversationStore
 
-    stored: dict = {}
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(max_history=2, redis_url="redis://localhost")
 
-    async def fake_get(key):
-        return stored.get(key)
+        for text in ("Hello", "สวัสดีค่ะ", "Bye"):
+            await store.add_message("u1", "user", text)
+        history = await store.get_history("u1")
+        assert history == [{"role": "user", "content": "สวัสดีค่ะ"}, {"role": "user", "content": "Bye"}]
+        assert await fake.type("conv:u1") == b"list"
+        assert 0 < await fake.ttl("conv:u1") <= 86400
 
-    async def fake_set(key, value, ex=None):
-        stored[key] = value
+        await store.clear("u1")
+        assert await store.get_history("u1") == []
 
-    async def fake_delete(key):
-        stored.pop(key, None)
 
-    mock_redis = AsyncMock()
-    mock_redis.ping = AsyncMock()
-    mock_redis.get = AsyncMock(side_effect=fake_get)
-    mock_redis.set = AsyncMock(side_effect=fake_set)
-    mock_redis.delete = AsyncMock(side_effect=fake_delete)
+@pytest.mark.asyncio
+async def test_redis_legacy_json_history_migrated():
+    import json
+    import fakeredis
+    from app.memory.store import ConversationStore
 
-    with patch("redis.asyncio.from_url", return_value=mock_redis):
-        store = ConversationStore(max_history=5, redis_url="redis://localhost")
+    legacy = [{"role": "user", "content": f"m{i}"} for i in range(3)]
+    fake = fakeredis.FakeAsyncRedis()
+    await fake.set("conv:read", json.dumps(legacy), ex=600)
+    await fake.set("conv:write", json.dumps(legacy), ex=600)
+    await fake.set("conv:bulk", json.dumps(legacy))
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(max_history=3, redis_url="redis://localhost")
 
-        await store.add_message("u1", "user", "Hello")
-        history = await store.get_history("u1")
-        assert history == [{"role": "user", "content": "Hello"}]
+        assert (await store.get_session("read")).history == legacy
+        assert await store.get_history("read") == legacy
+        assert 0 < await fake.ttl("conv:read") <= 600
 
-        await store.clear("u1")
-        assert await store.get_history("u1") == []
+        await store.add_message("write", "assistant", "ok")
+        assert await store.get_history("write") == legacy[1:] + [{"role": "assistant", "content": "ok"}]
+
+        assert await store.migrate_history() == 1
+        assert await fake.type("conv:bulk") == b"list"
+        assert await store.migrate_history() == 0
 
 
 @pytest.mark.asyncio
@@ -117,9 +130,10 @@ async def test_daily_usage_different_users_independent():
 
 @pytest.mark.asyncio
 async def test_daily_usage_redis():
+    from app.memory.quota import bangkok_day
     from app.memory.store import ConversationStore
 
-    today = datetime.date.today().isoformat()
+    today = bangkok_day()
     stored: dict = {}
     expiry: dict = {}
 
@@ -153,3 +167,385 @@ async def test_daily_usage_redis():
         assert count == 2
         # expire only called on first increment (count == 1)
         assert mock_redis.expire.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_get_session_in_memory_counts_only_under_limit():
+    from app.memory.store import ConversationStore
+
+    store = ConversationStore()
+    await store.add_message("u1", "user", "Hello")
+    await store.set_lead_flow("u1", {"step": "collect"})
+
+    s = await store.get_session("u1", daily_limit=2)
+    assert (s.usage, s.allowed) == (1, True)
+    assert s.lead_flow == {"step": "collect"}
+    assert s.quote_flow is None
+    assert s.history == [{"role": "user", "content": "Hello"}]
+
+    assert (await store.get_session("u1", daily_limit=2)).allowed
+    blocked = await store.get_session("u1", daily_limit=2)
+    assert (blocked.usage, blocked.allowed) == (2, False)
+    assert await store.get_daily_usage("u1") == 2
+
+
+@pytest.mark.asyncio
+async def test_get_session_redis_is_one_call():
+    import fakeredis
+    from app.memory.quota import bangkok_day
+    from app.memory.store import ConversationStore
+
+    today = bangkok_day()
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(redis_url="redis://localhost")
+        await store.add_message("u1", "assistant", "Hi")
+        await store.set_quote_flow("u1", {"step": "retail_name"})
+
+        with patch.object(fake, "get", wraps=fake.get) as get, \
+             patch.object(fake, "eval", wraps=fake.eval) as ev:
+            s = await store.get_session("u1", daily_limit=1)
+            blocked = await store.get_session("u1", daily_limit=1)
+
+        assert ev.call_count == 2
+        get.assert_not_called()
+        assert (s.usage, s.allowed) == (1, True)
+        assert s.quote_flow == {"step": "retail_name"}
+        assert s.lead_flow is None
+        assert s.history == [{"role": "assistant", "content": "Hi"}]
+        assert (blocked.usage, blocked.allowed) == (1, False)
+        assert 0 < await fake.ttl(f"usage:{today}:u1") <= 90000
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sessions_never_exceed_limit_redis():
+    import asyncio
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    with patch("redis.asyncio.from_url", return_value=fakeredis.FakeAsyncRedis()):
+        store = ConversationStore(redis_url="redis://localhost")
+        sessions = await asyncio.gather(*(store.get_session("u1", daily_limit=5) for _ in range(20)))
+
+    assert sum(s.allowed for s in sessions) == 5
+    assert {s.blocked_by for s in sessions if not s.allowed} == {"messages"}
+    assert await store.get_daily_usage("u1") == 5
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_token_budget_blocks_and_spend_is_recorded(backend):
+    import fakeredis
+    from app.memory.quota import SPEND_TTL, bangkok_day
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(redis_url="redis://localhost" if backend == "redis" else None)
+        s = await store.get_session("u1", daily_limit=100, token_limit=1000)
+        assert (s.allowed, s.tokens) == (True, 0)
+        await store.record_tokens("u1", 600)
+        assert (await store.get_session("u1", daily_limit=100, token_limit=1000)).allowed
+        await store.record_tokens("u1", 600)
+
+        blocked = await store.get_session("u1", daily_limit=100, token_limit=1000)
+        assert (blocked.allowed, blocked.blocked_by, blocked.tokens, blocked.usage) == (False, "tokens", 1200, 2)
+        assert (await store.get_session("u1", daily_limit=100)).allowed  # no token budget
+        assert await store.get_spend("u1") == {bangkok_day(): 1200}
+        assert await store.get_spend("u2") == {}
+    if backend == "redis":
+        assert 86400 < await fake.ttl(f"tokens:{bangkok_day()}:u1") <= SPEND_TTL
+
+
+def test_quota_day_rolls_over_at_bangkok_midnight():
+    import datetime
+    from unittest.mock import MagicMock
+    from app.memory import quota
+
+    # 17:30 UTC is 00:30 the next day in Bangkok (UTC+7)
+    utc = datetime.datetime(2026, 3, 1, 17, 30, tzinfo=datetime.timezone.utc)
+    fake_datetime = MagicMock(now=lambda tz: utc.astimezone(tz))
+    with patch.object(quota.datetime, "datetime", fake_datetime):
+        assert quota.bangkok_day() == "2026-03-02"
+        assert quota.bangkok_day(1) == "2026-03-01"
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    from unittest.mock import MagicMock
+
+    c = _Clock()
+    with patch("app.memory.local.time", MagicMock(monotonic=c)):
+        yield c
+
+
+def test_local_backend_ttls_match_redis(clock):
+    from app.memory.local import CONV_TTL, FLOW_TTL, USAGE_TTL, LocalBackend
+
+    b = LocalBackend()
+    b.add_message("u1", "user", "hi")
+    b.set_flow("qflow", "u1", {"step": "retail_name"})
+    b.incr_usage("2026-01-01", "u1")
+
+    clock.now += FLOW_TTL
+    assert b.get_flow("qflow", "u1") is None
+    b.add_message("u1", "assistant", "hello")  # write refreshes the conversation TTL
+    b.incr_usage("2026-01-01", "u1")  # increment does not refresh the usage TTL
+
+    clock.now = 1000.0 + CONV_TTL + 1  # past the first write's expiry
+    assert len(b.get_history("u1")) == 2
+    assert b.get_usage("2026-01-01", "u1") == 2
+    clock.now = 1000.0 + USAGE_TTL
+    assert b.get_usage("2026-01-01", "u1") == 0
+    clock.now += CONV_TTL
+    assert b.get_history("u1") == []
+    assert b.stats()["entries"] == 0
+
+
+def test_local_backend_lru_entry_budget():
+    from app.memory.local import LocalBackend
+    from app.metrics import metrics
+
+    b = LocalBackend(max_entries=2)
+    b.add_message("a", "user", "1")
+    b.add_message("b", "user", "2")
+    b.get_history("a")  # a is now most recently used
+    b.add_message("c", "user", "3")
+
+    assert b.get_history("b") == []
+    assert b.get_history("a") == [{"role": "user", "content": "1"}]
+    assert b.stats()["evictions"] == 1
+    assert metrics.counter("memory_store.evictions") == 1
+
+
+def test_local_backend_quota_counters_survive_eviction():
+    from app.memory.local import LocalBackend
+
+    b = LocalBackend(max_entries=2, max_bytes=2_000, max_counters=2)
+    b.incr_usage("2026-01-01", "a", 5)
+    b.incr_usage("2026-01-01", "a", 300, kind="tokens")
+    for i in range(50):
+        b.add_message(f"u{i}", "user", "x" * 200)
+
+    assert b.get_usage("2026-01-01", "a") == 5
+    assert b.get_usage("2026-01-01", "a", kind="tokens") == 300
+    assert b.stats()["counters"] == 2
+
+    b.incr_usage("2026-01-02", "a")  # over max_counters: the oldest counter goes
+    assert b.get_usage("2026-01-01", "a") == 0
+    assert b.get_usage("2026-01-01", "a", kind="tokens") == 300
+
+
+def test_local_backend_byte_budget_and_compact_history():
+    from app.memory.local import LocalBackend
+
+    b = LocalBackend(max_history=3, max_bytes=20_000)
+    for i in range(100):
+        b.add_message(f"u{i}", "user", "x" * 1000)
+    stats = b.stats()
+    assert stats["bytes"] <= 20_000
+    assert 0 < stats["entries"] < 100
+
+    b2 = LocalBackend(max_history=3)
+    for i in range(10):
+        b2.add_message("u", "user", "y" * 500)
+    one_full = b2.stats()["bytes"]
+    b2.add_message("u", "assistant", "y" * 500)
+    assert b2.stats()["bytes"] == one_full  # oldest record's size is released on rollover
+    assert [m["role"] for m in b2.get_history("u")] == ["user", "user", "assistant"]
+
+
+def test_codec_formats_coexist():
+    import json
+    from app.memory.codec import V_ORJSON, V_ZLIB, Codec
+
+    message = {"role": "assistant", "content": "จัดส่งฟรีทั่วประเทศค่ะ"}
+    long_message = {"role": "assistant", "content": "สุขภัณฑ์ CERAFIELD " * 40}
+    codec = Codec("orjson", compress_min=512)
+
+    short = codec.encode(message)
+    assert short[0] == V_ORJSON and len(short) < len(json.dumps(message))
+    packed = codec.encode(long_message)
+    assert packed[0] == V_ZLIB and len(packed) < len(long_message["content"].encode())
+
+    legacy = json.dumps(message).encode()  # \uXXXX text from before the codec layer
+    for raw in (short, packed, legacy, Codec("json").encode(message), legacy.decode()):
+        assert Codec.decode(raw) in (message, long_message)
+
+
+@pytest.mark.asyncio
+async def test_redis_reads_legacy_values_and_writes_codec():
+    import json
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    await fake.rpush("conv:u1", json.dumps({"role": "user", "content": "สวัสดีค่ะ"}))
+    await fake.set("qflow:u1", json.dumps({"step": "retail_name"}))
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(redis_url="redis://localhost")
+        await store.add_message("u1", "assistant", "ยินดีต้อนรับค่ะ")
+
+        s = await store.get_session("u1")
+        assert [m["content"] for m in s.history] == ["สวัสดีค่ะ", "ยินดีต้อนรับค่ะ"]
+        assert s.quote_flow == {"step": "retail_name"}
+
+        await store.set_quote_flow("u1", {"step": "retail_address"})
+        assert (await fake.get("qflow:u1"))[:1] == b"\x01"
+        assert await store.get_quote_flow("u1") == {"step": "retail_address"}
+
+
+@pytest.mark.asyncio
+async def test_memory_snapshot_restores_lazily(tmp_path):
+    from app.memory.store import ConversationStore
+
+    path = str(tmp_path / "memory.snapshot")
+    store = ConversationStore()
+    await store.add_message("u1", "user", "สนใจ CF-13022 ค่ะ")
+    await store.set_quote_flow("u1", {"step": "retail_address", "name": "คุณสมศรี"})
+    await store.increment_daily_usage("u1")
+    await store.add_message("u2", "user", "untouched")
+    store._local._put("usage:2000-01-01:u1", 7, 3600, 0)  # not today: dropped
+    assert store.save_snapshot(path) == 4
+
+    restored = ConversationStore()
+    reader = restored.restore_snapshot(path)
+    assert reader._index is None  # nothing parsed at startup
+    assert await restored.get_quote_flow("u1") == {"step": "retail_address", "name": "คุณสมศรี"}
+    assert await restored.get_history("u1") == [{"role": "user", "content": "สนใจ CF-13022 ค่ะ"}]
+    assert await restored.get_daily_usage("u1") == 1
+    assert len(reader) == 1  # only u2's history still undecoded
+
+    await restored.clear_quote_flow("u1")
+    assert await restored.get_quote_flow("u1") is None  # a cleared key is not restored again
+    assert restored.save_snapshot(path) == 3  # u2 carried over without being decoded
+    again = ConversationStore()
+    again.restore_snapshot(path)
+    assert await again.get_history("u2") == [{"role": "user", "content": "untouched"}]
+
+
+def test_memory_snapshot_ignores_bad_files(tmp_path):
+    from app.memory.snapshot import open_snapshot
+
+    assert open_snapshot(str(tmp_path / "missing")) is None
+    for name, data in (("empty", b""), ("short", b"CLAW"), ("future", b"CLAWSNAP\x09" + b"\0" * 12)):
+        (tmp_path / name).write_bytes(data)
+        assert open_snapshot(str(tmp_path / name)) is None
+
+
+@pytest.mark.asyncio
+async def test_memory_snapshot_truncated_keeps_leading_records(tmp_path):
+    from app.memory.store import ConversationStore
+
+    path = tmp_path / "memory.snapshot"
+    store = ConversationStore()
+    for user in ("u1", "u2", "u3"):
+        await store.add_message(user, "user", f"hello from {user}")
+    assert store.save_snapshot(str(path)) == 3
+    path.write_bytes(path.read_bytes()[:-5])  # cut into the last record
+
+    restored = ConversationStore()
+    restored.restore_snapshot(str(path))
+    assert await restored.get_history("u1") == [{"role": "user", "content": "hello from u1"}]
+    assert await restored.get_history("u3") == []
+    await restored.add_message("u4", "user", "new")
+    await restored.set_quote_flow("u4", {"step": "retail_name"})
+    await restored.clear_quote_flow("u4")
+    assert restored.save_snapshot(str(path)) == 3  # u1, u4 live + u2 carried over
+
+
+def test_lifespan_snapshots_memory_store(monkeypatch, tmp_path):
+    import asyncio
+    from fastapi.testclient import TestClient
+    import app.memory.store as st
+    from app.config import get_settings
+
+    path = tmp_path / "memory.snapshot"
+    monkeypatch.setenv("MEMORY_SNAPSHOT_PATH", str(path))
+    get_settings.cache_clear()
+    from main import app
+
+    with TestClient(app):
+        asyncio.run(st.get_store().set_lead_flow("u1", {"step": "collect"}))
+    assert path.exists()
+
+    st._store = None
+    with TestClient(app):
+        assert asyncio.run(st.get_store().get_lead_flow("u1")) == {"step": "collect"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_fold_history_swaps_summary_and_drops_folded_head(backend):
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(max_history=6, redis_url="redis://localhost" if backend == "redis" else None)
+        for i in range(6):
+            await store.add_message("u1", "user", f"m{i}")
+        folded = (await store.get_history("u1"))[:4]
+        # Meanwhile a new turn trims m0 off the head and appends at the tail
+        await store.add_message("u1", "user", "m6")
+
+        assert await store.fold_history("u1", None, {"items": [], "messages": 4}, folded) == 3
+        assert [m["content"] for m in await store.get_history("u1")] == ["m4", "m5", "m6"]
+        session = await store.get_session("u1")
+        assert session.summary == {"items": [], "messages": 4}
+        # A second folder that read the old (empty) summary loses the race
+        assert await store.fold_history("u1", None, {"messages": 1}, folded) is None
+        assert await store.get_summary("u1") == {"items": [], "messages": 4}
+
+        await store.clear("u1")
+        assert await store.get_summary("u1") is None
+    if backend == "redis":
+        assert await fake.exists("summary:u1") == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("backend", ["memory", "redis"])
+async def test_fold_history_writes_nothing_when_no_folded_message_is_left(backend):
+    import fakeredis
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        store = ConversationStore(max_history=2, redis_url="redis://localhost" if backend == "redis" else None)
+        for i in range(2):
+            await store.add_message("u1", "user", f"m{i}")
+        folded = await store.get_history("u1")
+        for i in range(2, 4):  # both folded messages trimmed meanwhile
+            await store.add_message("u1", "user", f"m{i}")
+
+        assert await store.fold_history("u1", None, {"messages": 2}, folded) == 0
+        assert await store.get_summary("u1") is None
+        assert [m["content"] for m in await store.get_history("u1")] == ["m2", "m3"]
+
+
+@pytest.mark.asyncio
+async def test_fold_history_matches_entries_written_by_another_codec():
+    import fakeredis
+    from app.memory.codec import Codec
+    from app.memory.store import ConversationStore
+
+    fake = fakeredis.FakeAsyncRedis()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        legacy = ConversationStore(redis_url="redis://localhost", codec=Codec("json"))
+        for text in ("สวัสดีค่ะ", "CF-13022 ราคาเท่าไหร่", "เอา 2 ชิ้น"):
+            await legacy.add_message("u1", "user", text)
+        await legacy.fold_history("u1", None, {"messages": 1}, (await legacy.get_history("u1"))[:1])
+
+        store = ConversationStore(redis_url="redis://localhost", codec=Codec("orjson"))
+        folded = (await store.get_history("u1"))[:1]
+        assert await store.fold_history("u1", {"messages": 1}, {"messages": 2}, folded) == 1
+        assert await store.get_summary("u1") == {"messages": 2}
+        assert [m["content"] for m in await store.get_history("u1")] == ["เอา 2 ชิ้น"]
@@ -0,0 +1,100 @@
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from tests.conftest import _make_completion_response
+
+
+@pytest.fixture
+def summaries(monkeypatch):
+    monkeypatch.setenv("SUMMARY_TRIGGER_MESSAGES", "8")
+    monkeypatch.setenv("SUMMARY_KEEP_MESSAGES", "4")
+    from app.config import get_settings
+    get_settings.cache_clear()
+
+    record = {
+        "customer_type": "project",
+        "items": [{"sku": "cf-13022", "quantity": 100, "color": "Matt Black"}, {"quantity": 3}],
+        "contact": {"company": "Riverside Co.", "fax": "ignored"},
+        "notes": "Condo project, wants a formal quotation.",
+    }
+    response = _make_completion_response(json.dumps(record))
+    response.usage.total_tokens = 300
+    with patch("app.core.summarizer.create_completion", new_callable=AsyncMock, return_value=response) as mock:
+        yield mock
+
+
+@pytest.mark.asyncio
+async def test_old_turns_folded_in_background_and_sent_as_summary(summaries):
+    from app.core.ai_engine import get_ai_reply, SYSTEM_PROMPT
+    from app.core.summarizer import get_summarizer
+    from app.memory.store import get_store
+    from app.metrics import metrics
+
+    store = get_store()
+    with patch("app.core.ai_engine.create_completion", new_callable=AsyncMock) as mock_chat:
+        mock_chat.return_value = _make_completion_response("ok")
+        for i in range(4):
+            await get_ai_reply("u1", f"turn {i}")
+        assert "u1" in get_summarizer()._tasks and summaries.await_count == 0  # off the reply path
+        await get_summarizer().close()
+
+        history = await store.get_history("u1")
+        assert [m["content"] for m in history] == ["turn 2", "ok", "turn 3", "ok"]
+        summary = await store.get_summary("u1")
+        assert summary == {
+            "customer_type": "project",
+            "items": [{"sku": "CF-13022", "quantity": 100, "color": "Matt Black"}],
+            "contact": {"company": "Riverside Co."},
+            "notes": "Condo project, wants a formal quotation.",
+            "messages": 4,
+        }
+        transcript = summaries.call_args[0][0][1]["content"]
+        assert "Customer: turn 0" in transcript and "Sera: ok" in transcript
+        assert summaries.call_args.kwargs["response_format"] == {"type": "json_object"}
+
+        await get_ai_reply("u1", "turn 4")
+
+    messages = mock_chat.call_args[0][0]
+    assert messages[0] == {"role": "system", "content": SYSTEM_PROMPT}
+    assert [m["content"] for m in messages[1:5]] == ["turn 2", "ok", "turn 3", "ok"]
+    assert messages[-2]["role"] == "system"
+    assert messages[-2]["content"].startswith("Summary of the 4 earlier messages")
+    assert "Items: CF-13022 x100 (Matt Black)" in messages[-2]["content"]
+    assert metrics.counter("summary.folds") == 1
+    assert (await store.get_spend("u1")) and metrics.counter("summary.tokens") == 300
+
+
+@pytest.mark.asyncio
+async def test_bad_summary_reply_keeps_history(summaries):
+    from app.core.summarizer import get_summarizer
+    from app.memory.store import get_store
+    from app.metrics import metrics
+
+    summaries.return_value = _make_completion_response("not json")
+    store = get_store()
+    for i in range(8):
+        await store.add_message("u2", "user", f"m{i}")
+    get_summarizer().maybe_schedule("u2", 8)
+    await get_summarizer().close()
+
+    assert len(await store.get_history("u2")) == 8
+    assert await store.get_summary("u2") is None
+    assert metrics.counter("summary.errors") == 1
+
+
+def test_normalize_falls_back_to_previous_fields():
+    from app.core.summarizer import _normalize, format_summary
+
+    previous = {"customer_type": "retail", "items": [{"sku": "CF-600", "quantity": 2, "color": None}],
+                "contact": {"name": "สมศรี"}, "notes": "", "messages": 4}
+    merged = _normalize({"customer_type": "unknown", "items": "n/a"}, previous, 4)
+    assert merged == {**previous, "messages": 8}
+    assert format_summary(merged).splitlines() == [
+        "Summary of the 8 earlier messages of this conversation:",
+        "Customer type: RETAIL",
+        "Items: CF-600 x2",
+        "Contact: name: สมศรี",
+    ]
+    assert format_summary(None) == ""
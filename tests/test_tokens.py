@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+
+@pytest.fixture
+def estimator(monkeypatch):
+    """Count with the per-script estimate, whatever tiktoken can load here."""
+    from app.core import tokens
+
+    monkeypatch.setattr(tokens, "_encoding", lambda model: None)
+    tokens._count.cache_clear()
+    yield tokens
+    tokens._count.cache_clear()
+
+
+def test_fit_history_keeps_recent_messages(estimator):
+    history = [{"role": "user", "content": f"message number {i}"} for i in range(10)]
+    result = estimator.fit_history(history, budget=30)
+    assert 0 < len(result) < len(history)
+    assert result == history[len(history) - len(result):]
+    assert sum(estimator.count_message(m) for m in result) <= 30
+
+
+def test_fit_history_keeps_all_when_within_budget(estimator):
+    history = [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ]
+    assert estimator.fit_history(history, budget=3500) == history
+
+
+def test_fit_history_empty(estimator):
+    assert estimator.fit_history([], budget=3500) == []
+
+
+def test_fit_history_always_keeps_latest_message(estimator):
+    history = [{"role": "user", "content": "สวัสดีค่ะ"}, {"role": "user", "content": "ขอราคา " * 50}]
+    assert estimator.fit_history(history, budget=5) == history[-1:]
+
+
+@pytest.mark.parametrize("text, true_count", [
+    # o200k_base counts
+    ("สนใจโถสุขภัณฑ์แบบชิ้นเดียวค่ะ ราคาเท่าไหร่คะ", 23),
+    ("CF-13022 ราคา 10,800 บาทค่ะ ต้องการจำนวนเท่าไหร่คะ?", 22),
+    ("Do you have a wall hung toilet with a concealed cistern?", 13),
+    ("你好，请问这款马桶多少钱？", 9),
+])
+def test_estimate_close_to_true_count_per_script(estimator, text, true_count):
+    assert abs(estimator.estimate_tokens(text) - true_count) <= max(2, true_count * 0.25)
+
+
+def test_thai_no_longer_undercounted(estimator):
+    text = "ขอใบเสนอราคาสำหรับงานโปรเจคคอนโดค่ะ"  # 16 tokens in o200k_base
+    assert len(text) // 4 < 10 <= estimator.estimate_tokens(text)
+
+
+def test_counts_use_tokenizer_and_are_cached(monkeypatch):
+    from unittest.mock import MagicMock
+    from app.core import tokens
+
+    enc = MagicMock()
+    enc.encode.side_effect = lambda text, disallowed_special: text.split()
+    monkeypatch.setattr(tokens, "_encoding", lambda model: enc)
+    tokens._count.cache_clear()
+    messages = [{"role": "user", "content": "a b c"}, {"role": "assistant", "content": "d e"}]
+
+    assert tokens.count_messages(messages) == 3 + 2 + 2 * tokens.MESSAGE_OVERHEAD + tokens.REPLY_PRIMING
+    tokens.count_messages(messages)
+    assert enc.encode.call_count == 2  # once per distinct message
+    tokens._count.cache_clear()
+
+
+@pytest.fixture
+def fake_tiktoken(monkeypatch):
+    """tiktoken whose encoding download fails until `available` is set."""
+    import sys
+    from types import SimpleNamespace
+    from unittest.mock import MagicMock
+    from app.core import tokens
+
+    state = SimpleNamespace(available=False, calls=0)
+
+    def get_encoding(name):
+        state.calls += 1
+        if not state.available:
+            raise ConnectionError("offline")
+        return MagicMock(name=name)
+
+    monkeypatch.setitem(sys.modules, "tiktoken", SimpleNamespace(encoding_for_model=get_encoding, get_encoding=get_encoding))
+    monkeypatch.setattr(tokens, "_encodings", {})
+    monkeypatch.setattr(tokens, "_failed", {})
+    monkeypatch.setattr(tokens, "_loading", set())
+    yield state
+    tokens._count.cache_clear()
+
+
+def test_failed_encoding_load_is_retried(fake_tiktoken, monkeypatch):
+    from app.core import tokens
+
+    assert tokens._encoding("gpt-4o-mini") is None
+    assert tokens._encoding("gpt-4o-mini") is None
+    assert fake_tiktoken.calls == 1  # not retried within ENCODING_RETRY
+
+    fake_tiktoken.available = True
+    monkeypatch.setattr(tokens, "ENCODING_RETRY", 0.0)
+    assert tokens._encoding("gpt-4o-mini") is not None
+
+
+@pytest.mark.asyncio
+async def test_preload_loads_off_the_event_loop(fake_tiktoken):
+    from app.core import tokens
+
+    fake_tiktoken.available = True
+    await tokens.preload(["gpt-4o-mini", "gpt-4o-mini", ""])
+    assert fake_tiktoken.calls == 1
+    assert tokens._encoding("gpt-4o-mini") is not None
+
+    # First use on the loop without a preload: estimate now, load in an executor
+    assert tokens._encoding("gpt-4.1") is None
+    for _ in range(100):
+        if "gpt-4.1" in tokens._encodings:
+            break
+        await asyncio.sleep(0.01)
+    assert tokens._encoding("gpt-4.1") is not None
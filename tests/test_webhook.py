@@ -68,6 +68,95 @@ def test_oversized_body_returns_413(client):
     assert resp.status_code == 413
 
 
+def test_user_over_rate_limit_is_acked_but_not_processed(client, monkeypatch):
+    from app.config import get_settings
+
+    monkeypatch.setenv("USER_RATE_BURST", "2")
+    get_settings.cache_clear()
+    events = [
+        {"type": "message", "source": {"type": "user", "userId": uid}, "webhookEventId": f"evt{i}",
+         "replyToken": f"r{i}", "message": {"id": f"m{i}", "type": "text", "text": "สวัสดีค่ะ"}}
+        for i, uid in enumerate(["Uflood", "Uflood", "Uother", "Uflood"])
+    ]
+    body = json.dumps({"destination": "Utest", "events": events}).encode()
+    with patch("app.api.webhook._dispatch_events", new_callable=AsyncMock) as dispatch:
+        resp = _signed_post(client, body, get_settings().line_channel_secret)
+
+    assert resp.status_code == 200
+    assert [item[2] for item in dispatch.call_args[0][0]] == ["r0", "r1", "r2"]
+
+
+def test_reject_ceiling_never_refuses_signed_requests(client, monkeypatch):
+    from app.config import get_settings
+
+    monkeypatch.setenv("CALLBACK_REJECT_LIMIT", "2/minute")
+    get_settings.cache_clear()
+    body = _text_event_body()
+    for _ in range(2):
+        assert client.post("/callback", content=body, headers={"X-Line-Signature": "bad=="}).status_code == 400
+    assert client.post("/callback", content=body).status_code == 429
+    assert client.post("/callback", content=body, headers={"X-Line-Signature": "bad=="}).status_code == 429
+    assert _signed_post(client, body, get_settings().line_channel_secret).status_code == 200
+
+
+def test_streamed_catalog_token_pushes_before_reply_completes(client, mock_line_reply):
+    from app.config import get_settings
+    from tests.conftest import _make_completion_stream
+
+    events = []
+    stream = _make_completion_stream("ส่งแคตตาล็อกให้ดูก่อนนะคะ [CATALOG]", "\n\nมีรหัสสินค้า", "ที่สนใจแจ้งได้เลยค่ะ")
+    original = type(stream).__aiter__
+
+    async def tracked(self):
+        async for delta in original(self):
+            events.append("delta")
+            yield delta
+
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream), \
+         patch.object(type(stream), "__aiter__", tracked), \
+         patch("app.api.webhook.push_catalog", new_callable=AsyncMock,
+               side_effect=lambda uid: events.append("push")) as push:
+        resp = _signed_post(client, _text_event_body(text="ขอแคตตาล็อกค่ะ"), get_settings().line_channel_secret)
+
+    assert resp.status_code == 200
+    push.assert_awaited_once_with("U12345678")
+    assert events.index("push") < len(events) - 1  # started while deltas were still arriving
+    sent = mock_line_reply.call_args[0][1]
+    assert "[CATALOG]" not in sent and sent.endswith("ที่สนใจแจ้งได้เลยค่ะ")
+
+
+def test_error_after_streamed_action_skips_apology(client, mock_line_reply):
+    from app.config import get_settings
+    from tests.conftest import _make_completion_stream
+
+    mock_line_reply.side_effect = RuntimeError("LINE down")
+    stream = _make_completion_stream("ส่งแคตตาล็อกให้ดูก่อนนะคะ [CATALOG]", " ที่สนใจแจ้งได้เลยค่ะ")
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream), \
+         patch("app.api.webhook.push_catalog", new_callable=AsyncMock) as push:
+        resp = _signed_post(client, _text_event_body(text="ขอแคตตาล็อกค่ะ"), get_settings().line_channel_secret)
+
+    assert resp.status_code == 200
+    push.assert_awaited_once_with("U12345678")
+    assert mock_line_reply.call_count == 1
+    assert "Sorry" not in mock_line_reply.call_args[0][1]
+
+
+def test_streamed_lead_notify_includes_closing_reply(client, mock_line_reply, monkeypatch):
+    from app.config import get_settings
+    from tests.conftest import _make_completion_stream
+
+    monkeypatch.setenv("TONY_LINE_USER_ID", "Utony")
+    get_settings.cache_clear()
+    stream = _make_completion_stream("[NOTIFY_LEAD] ได้รับข้อมูลแล้วค่ะ", " คุณวิชัย 081-234-5678")
+    with patch("app.core.ai_engine.stream_completion", new_callable=AsyncMock, return_value=stream), \
+         patch("app.services.line_service.push_text", new_callable=AsyncMock) as push:
+        resp = _signed_post(client, _text_event_body(text="คุณวิชัย 081-234-5678"), get_settings().line_channel_secret)
+
+    assert resp.status_code == 200
+    push.assert_called_once()
+    assert "ได้รับข้อมูลแล้วค่ะ คุณวิชัย 081-234-5678" in push.call_args[0][1]
+
+
 def test_ai_failure_sends_fallback(mock_line_reply):
     """When AI raises, background task must send the fallback reply to LINE."""
     with patch("app.api.webhook.get_ai_reply", new_callable=AsyncMock) as bad_ai:
@@ -86,9 +175,10 @@ def test_ai_failure_sends_fallback(mock_line_reply):
 
 def test_daily_limit_sends_limit_message(mock_line_reply):
     """When daily limit is reached, send a limit message and skip the AI call."""
+    from app.memory.store import Session
+
     mock_store = MagicMock()
-    mock_store.get_daily_usage = AsyncMock(return_value=100)
-    mock_store.increment_daily_usage = AsyncMock(return_value=101)
+    mock_store.get_session = AsyncMock(return_value=Session(usage=100, allowed=False))
 
     with patch("app.api.webhook.get_store", return_value=mock_store), \
          patch("app.api.webhook.get_ai_reply", new_callable=AsyncMock) as mock_ai:
@@ -103,3 +193,57 @@ def test_daily_limit_sends_limit_message(mock_line_reply):
     args = mock_line_reply.call_args[0]
     assert "limit" in args[1].lower()
     mock_ai.assert_not_called()
+
+
+def test_non_text_events_skipped(mock_line_reply):
+    from app.config import get_settings
+
+    body = json.dumps({
+        "destination": "Utest",
+        "events": [
+            {"type": "follow", "source": {"type": "user", "userId": "U1"}, "replyToken": "r1"},
+            {"type": "message", "source": {"type": "user", "userId": "U1"}, "replyToken": "r2",
+             "message": {"id": "m1", "type": "sticker", "packageId": "1", "stickerId": "1"}},
+        ],
+    }).encode()
+    with patch("app.api.webhook._handle_message", new_callable=AsyncMock) as handle:
+        from main import app
+        with TestClient(app) as c:
+            resp = _signed_post(c, body, get_settings().line_channel_secret)
+
+    assert resp.status_code == 200
+    handle.assert_not_called()
+
+
+def test_parse_text_events_extracts_only_needed_fields():
+    from app.ingress.events import TextEvent, parse_text_events
+
+    body = json.loads(_text_event_body(user_id="U9", text="สวัสดี"))
+    body["events"][0]["deliveryContext"]["isRedelivery"] = True
+    events = parse_text_events(json.dumps(body).encode())
+
+    assert events == [TextEvent(
+        user_id="U9",
+        text="สวัสดี",
+        reply_token="nHuyWiB7yP5Zw52FIkcQobQuGDXCTA",
+        webhook_event_id="evt1",
+        is_redelivery=True,
+    )]
+
+
+def test_verify_signature_on_raw_bytes():
+    from app.ingress.events import verify_signature
+
+    body = _text_event_body()
+    assert verify_signature(body, _make_signature(body, "s3cret"), "s3cret")
+    assert not verify_signature(body + b" ", _make_signature(body, "s3cret"), "s3cret")
+    assert not verify_signature(body, "bad==", "s3cret")
+
+
+def test_oversized_content_length_rejected_before_read(client):
+    resp = client.post(
+        "/callback",
+        content=b"{}",
+        headers={"X-Line-Signature": "sig", "Content-Length": "5000000"},
+    )
+    assert resp.status_code == 413
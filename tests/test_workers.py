@@ -0,0 +1,100 @@
+from unittest.mock import MagicMock, patch
+
+import fakeredis
+import pytest
+
+
+@pytest.mark.asyncio
+async def test_only_one_lease_holder_runs_the_scheduler():
+    from app.agents.leader import LeaderLease
+
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    a_sched, b_sched = MagicMock(), MagicMock()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        a = LeaderLease("redis://localhost", a_sched.resume, a_sched.pause)
+        b = LeaderLease("redis://localhost", b_sched.resume, b_sched.pause)
+        assert await a.step() is True
+        assert await b.step() is False
+        assert await a.step() is True  # renewal
+        a_sched.resume.assert_called_once()
+        b_sched.resume.assert_not_called()
+
+        await a.stop()  # releases the lease on shutdown
+        a_sched.pause.assert_called_once()
+        assert await b.step() is True
+        b_sched.resume.assert_called_once()
+        await b.stop()
+
+
+@pytest.mark.asyncio
+async def test_leader_steps_down_when_redis_unreachable():
+    import time
+    from app.agents.leader import LeaderLease
+
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    sched = MagicMock()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        lease = LeaderLease("redis://localhost", sched.resume, sched.pause, ttl=30)
+        assert await lease.step()
+    now = time.monotonic()
+    clock = MagicMock(monotonic=lambda: now + 25, time=time.time, perf_counter=time.perf_counter)
+    with patch.object(fake, "eval", side_effect=ConnectionError("down")), \
+         patch("app.agents.leader.time", clock):
+        assert await lease.step() is False  # the lease may expire before the next renewal
+    sched.pause.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_leader_steps_down_when_redis_hangs():
+    import asyncio
+    from app.agents.leader import LeaderLease
+
+    async def hang(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    fake = fakeredis.FakeAsyncRedis(decode_responses=True)
+    sched = MagicMock()
+    with patch("redis.asyncio.from_url", return_value=fake):
+        lease = LeaderLease("redis://localhost", sched.resume, sched.pause, ttl=0.15)
+        assert await lease.step()
+    with patch.object(fake, "eval", side_effect=hang):
+        # each check gives up after one renew interval; leadership ends before the lease can expire
+        results = [await asyncio.wait_for(lease.step(), 1) for _ in range(3)]
+    assert results[-1] is False
+    sched.pause.assert_called_once()
+
+
+def test_single_process_without_redis_always_leads():
+    from app.agents.leader import LeaderLease
+
+    sched = MagicMock()
+    lease = LeaderLease(None, sched.resume, sched.pause)
+    lease.start()
+    assert lease.is_leader
+    sched.resume.assert_called_once()
+
+
+def test_multiple_workers_refuse_memory_only_state(monkeypatch):
+    from app.config import get_settings
+    from main import check_deployment
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    monkeypatch.delenv("REDIS_URL", raising=False)
+    get_settings.cache_clear()
+    with pytest.raises(RuntimeError, match="REDIS_URL"):
+        check_deployment(get_settings())
+
+    monkeypatch.setenv("REDIS_URL", "redis://localhost")
+    monkeypatch.setenv("MEMORY_SNAPSHOT_PATH", "data/memory.snapshot")
+    get_settings.cache_clear()
+    with pytest.raises(RuntimeError, match="MEMORY_SNAPSHOT_PATH"):
+        check_deployment(get_settings())
+
+    monkeypatch.delenv("MEMORY_SNAPSHOT_PATH")
+    get_settings.cache_clear()
+    check_deployment(get_settings())
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    monkeypatch.delenv("REDIS_URL")
+    get_settings.cache_clear()
+    check_deployment(get_settings())
@@ -0,0 +1,47 @@
+"""
+Ingress worker process: drains the INGRESS_MODE=queue stream without serving HTTP.
+
+  python worker.py
+
+Run it next to web processes started with INGRESS_ROLE=web, so acks and AI work scale
+separately (both need the same REDIS_URL).  SIGTERM / SIGINT stop consuming; in-flight
+events get the pool's stop timeout and are otherwise reclaimed by another worker.
+"""
+import asyncio
+import logging
+import signal
+
+import main  # noqa: F401  logging and Sentry set up as for the web process
+from app.api.webhook import handle_queued_event
+from app.config import get_settings
+from app.core.summarizer import get_summarizer
+from app.core.tokens import preload
+from app.ingress.queue import get_event_queue
+from app.ingress.worker import get_worker_pool
+from app.memory.store import get_store
+
+logger = logging.getLogger("worker")
+
+
+async def run() -> None:
+    settings = get_settings()
+    if settings.ingress_mode != "queue":
+        raise SystemExit("worker.py needs INGRESS_MODE=queue")
+    await preload((settings.openai_model, settings.openai_model_light, settings.openai_model_strong))
+    store = get_store()
+    pool = get_worker_pool(handle_queued_event)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    pool.start()
+    await stop.wait()
+    logger.info("Ingress worker shutting down")
+    await pool.stop()
+    await get_event_queue().close()
+    await get_summarizer().close()
+    await store.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())